@@ -1,5 +1,15 @@
 from pybquiz.api_handler import create_handler
+from pybquiz.api_handler.transport import configure_transport
+from pybquiz.api_handler.store import set_cache_home
+from pybquiz.api_handler.retry import APIError
+from pybquiz.api_handler.deadline import Deadline, DeadlineExceeded
+from pybquiz.api_handler.base import BaseAPIHandler
+from pybquiz.planner import FetchPlanner
+from pybquiz.db.store import get_question_store
+from pybquiz.db.used import UsedIndex, Exclusion
+from pybquiz.db.neardup import NearDuplicateIndex, NearDuplicateFilter
 from typing import List
+from concurrent.futures import ThreadPoolExecutor
 import yaml
 import json
 import os
@@ -9,6 +19,9 @@ from pybquiz.const import PYBConst as C
 
 class Round():
     
+    # Number of concurrent fallback queries
+    FILL_WORKERS = 4
+    
     def __init__(
         self,
         title: str,
@@ -19,8 +32,16 @@ class Round():
         type: str = None,
         token: str = None,
         verbose: bool = False,
-        delay_api: float = 5.0,
+        delay_api: float = None,
         clear_cache: bool = False,    
+        rate_limit: dict = None,
+        deadline: Deadline = None,
+        prefetched: dict = None,
+        fill: bool = True,
+        fallback: List[dict] = None,
+        local_first: bool = False,
+        used: UsedIndex = None,
+        duplicates: NearDuplicateFilter = None,
     ):
         
         # Store variables
@@ -31,19 +52,51 @@ class Round():
         self.type = type 
         self.token = token
         self.api = api
+        # Questions already fetched by the planner per difficulty level
+        self.prefetched = {} if prefetched is None else prefetched
+        # Equivalent categories on other APIs (api, theme_id, token, rate_limit)
+        self.fallback = [] if fallback is None else fallback
+        # Take questions from the local question store before the network
+        self.local_first = local_first
+        # Questions already played in front of the audience are skipped
+        self.used = used
+        # Near duplicates of questions already accepted for the quiz are skipped
+        self.duplicates = duplicates
+        self.verbose = verbose
+        
+        # Create pybquiz from config file, metadata requests are within time budget too
+        self.deadline = deadline
+        self.degraded = False
+        self.api = create_handler(
+            name=api, delay_api=delay_api, token=token, verbose=verbose, clear_cache=clear_cache, rate_limit=rate_limit,
+            deadline=deadline,
+        )
+        
+        # Fetch questions within time budget
+        try:
+            questions = {}
+            for i, n in enumerate(self.difficulty):
+                # Get question with difficulty level
+                questions[i] = self._get_questions(n=n, difficulty=i)
+            
+            # Complete difficulty levels that came back short
+            if fill and not self.degraded:
+                questions = self._fill(questions=questions, delay_api=delay_api)
+        finally:
+            # Handler is shared, the budget of this round must not leak into the next users
+            self.api.set_deadline(None)
         
-        # Create pybquiz from config file
-        self.api = create_handler(name=api, delay_api=delay_api, token=token, verbose=verbose, clear_cache=clear_cache)
-
         self.questions = []
-        for i, n in enumerate(self.difficulty):
-            # Get question with difficulty level
-            qs = self.api.get_questions(category_id=self.theme_id, difficulty=i, n=n, type=self.type)
+        for i in range(len(self.difficulty)):
             # Append to list
-            self.questions.extend(qs)
+            self.questions.extend(questions[i])
         
         if verbose:
             print("Question generated: {}".format(len(self.questions)))
+            
+        # Never end up silently short of questions
+        if len(self.questions) < sum(self.difficulty):
+            print("Warning: round '{}' has {} questions out of {}".format(self.title, len(self.questions), sum(self.difficulty)))
         
         # Check if shuffle is needed
         if self.shuffle:
@@ -52,6 +105,162 @@ class Round():
             id_shuffle = np.random.permutation(N)
             self.questions = np.array(self.questions)[id_shuffle].tolist()
             
+    def _get_questions(self, n: int, difficulty: int):
+        """
+        Get questions planned for the round first, then missing ones from the API. Close
+        to the deadline, only local questions are used and the round is flagged as degraded.
+        """
+        if n <= 0:
+            return []
+        
+        # Questions fetched by the planner
+        qs = self._merge([], list(self.prefetched.get(difficulty, [])), n=n)
+        if len(qs) >= n:
+            return qs
+        
+        # Questions already in the local store
+        if self.local_first:
+            exclude = Exclusion(set([q.uuid for q in qs if q.uuid]), self.used, library=self.api.library)
+            qs = self._merge(qs, self.api.get_local_questions(n=n-len(qs), category_id=self.theme_id, difficulty=difficulty, type=self.type, exclude=exclude), n=n)
+            if len(qs) >= n:
+                return qs
+        
+        # Not enough time left for a request
+        if self.deadline is not None and self.deadline.remaining() <= self.api.expected_request_time():
+            self.degraded = True
+            exclude = Exclusion(self.used, library=self.api.library)
+            return self._merge(qs, self.api.get_local_questions(n=n-len(qs), category_id=self.theme_id, difficulty=difficulty, type=self.type, exclude=exclude), n=n)
+        
+        try:
+            qs = self._merge(qs, self.api.fetch_questions(category_id=self.theme_id, difficulty=difficulty, n=n-len(qs), type=self.type), n=n)
+        except DeadlineExceeded as e:
+            print("Warning: {}".format(e))
+        except APIError as e:
+            print("Warning: {}".format(e))
+            return qs
+        
+        # Deadline reached before the end, complete with local questions
+        if len(qs) < n and self.deadline is not None and self.deadline.remaining() <= self.api.expected_request_time():
+            self.degraded = True
+            exclude = Exclusion(self.used, library=self.api.library)
+            qs = self._merge(qs, self.api.get_local_questions(n=n-len(qs), category_id=self.theme_id, difficulty=difficulty, type=self.type, exclude=exclude), n=n)
+            
+        return qs
+    
+    def _missing(self, questions: dict) -> dict:
+        return {d: n - len(questions[d]) for d, n in enumerate(self.difficulty) if n - len(questions[d]) > 0}
+    
+    @staticmethod
+    def _fetch(handler, n: int, category_id: int, difficulty: int, type: str) -> list:
+        # Shortfalls are expected here, never fail the round
+        try:
+            return handler.fetch_questions(category_id=category_id, difficulty=difficulty, n=n, type=type)
+        except APIError as e:
+            print("Warning: {}".format(e))
+            return []
+    
+    def _fill(self, questions: dict, delay_api: float = None) -> dict:
+        """
+        Complete difficulty levels that came back short. Missing questions are requested
+        again (no more than the category holds), then taken from other difficulty levels 
+        of the category and finally from the fallback categories of other APIs, queried 
+        concurrently. Each handler waits for its own rate limit.
+
+        Parameters
+        ----------
+        questions : dict
+            Questions per difficulty level.
+        delay_api : float, optional
+            Fixed time between queries to API in seconds, by default None.
+
+        Returns
+        -------
+        questions : dict
+            Completed questions per difficulty level.
+        """
+        # Questions of all levels, a question is never used twice
+        used = [q for qs in questions.values() for q in qs]
+        
+        def take(d, new):
+            n = self.difficulty[d] - len(questions[d])
+            new = self._merge(list(used), new, n=len(used) + n)[len(used):]
+            questions[d].extend(new)
+            used.extend(new)
+            
+        # Re-request missing count, the first request may have asked more than available
+        for d, missing in self._missing(questions).items():
+            available = self.api.available_questions(category_id=self.theme_id, difficulty=d)
+            if available is not None and available >= 0:
+                missing = min(missing, available - len(questions[d]))
+            if missing > 0:
+                take(d, self._fetch(self.api, n=missing, category_id=self.theme_id, difficulty=d, type=self.type))
+        
+        # Relax difficulty, closest levels first
+        for d in self._missing(questions):
+            for d_relax in sorted(range(len(self.difficulty)), key=lambda x: (abs(x - d), x)):
+                missing = self._missing(questions).get(d, 0)
+                if d_relax == d or missing == 0:
+                    continue
+                # Only what is left once the level itself is served
+                available = self.api.available_questions(category_id=self.theme_id, difficulty=d_relax)
+                if available is not None and available >= 0 and available <= self.difficulty[d_relax]:
+                    continue
+                take(d, self._fetch(self.api, n=missing, category_id=self.theme_id, difficulty=d_relax, type=self.type))
+        
+        # Fallback categories on other APIs
+        missing = self._missing(questions)
+        if len(missing) == 0 or len(self.fallback) == 0:
+            return questions
+        
+        if self.verbose:
+            print("Round '{}' short of {} questions, use fallback {}".format(self.title, sum(missing.values()), self.fallback))
+        
+        # Query all fallbacks at once, results are used in configured order
+        tasks = []
+        handlers = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.FILL_WORKERS) as executor:
+                for cfg in self.fallback:
+                    try:
+                        handler = create_handler(
+                            name=cfg["api"], delay_api=delay_api, token=cfg.get("token", None), verbose=self.verbose, 
+                            rate_limit=cfg.get("rate_limit", None), deadline=self.deadline,
+                        )
+                    except NotImplementedError:
+                        continue
+                    if not isinstance(handler, BaseAPIHandler):
+                        continue
+                    handlers.append(handler)
+                    for d, n in missing.items():
+                        tasks.append((d, executor.submit(self._fetch, handler, n, cfg["theme_id"], d, cfg.get("type", self.type))))
+                
+                for d, task in tasks:
+                    if self._missing(questions).get(d, 0) > 0:
+                        take(d, task.result())
+        finally:
+            for handler in handlers:
+                handler.set_deadline(None)
+            
+        return questions
+    
+    def _merge(self, qs: list, new: list, n: int = None) -> list:
+        """
+        Append new questions that are not already in the list, nor used before by the
+        audience, nor near duplicates of questions accepted for the quiz. Stops once the
+        list holds `n` questions, so that only kept questions are accepted by the near
+        duplicate filter.
+        """
+        seen = set([q.uuid if q.uuid else q.question for q in qs])
+        for q in new:
+            if n is not None and len(qs) >= n:
+                break
+            uid = q.uuid if q.uuid else q.question
+            if uid in seen or (self.used is not None and self.used.is_used(q)):
+                continue
+            if self.duplicates is None or self.duplicates.accept(q):
+                qs.append(q)
+                seen.add(uid)
+        return qs
             
     def dump(self):
         # Create response
@@ -60,6 +269,7 @@ class Round():
             C.THEME_ID: self.theme_id,
             C.DIFFICULTY: self.difficulty,
             C.TYPE: self.type,
+            C.DEGRADED: self.degraded,
             C.QUESTIONS: [q.dump() for q in self.questions]
         }
         
@@ -77,14 +287,39 @@ class PybQuiz:
         clear_cache: bool = False,
         tokens: dict = None,
         verbose: bool = True,
+        rate_limits: dict = None,
+        deadline: float = None,
+        plan: bool = True,
+        local_first: bool = False,
+        audience: str = None,
+        near_duplicates: bool = False,
     ):
     
         self.title = title
         self.author = author
         self.verbose = verbose  
         self.tokens = tokens      
+        self.rate_limits = {} if rate_limits is None else rate_limits
+        # Overall time budget in seconds
+        self.deadline = None if deadline is None else Deadline(seconds=deadline)
+        # Merge queries of all rounds before creating them
+        self.plan = plan
+        # Take questions from the local question store before the network
+        self.local_first = local_first
+        # Questions already played in front of the audience (None if not tracked)
+        self.used = None if audience is None else UsedIndex(audience=audience)
+        # Skip near duplicates within the quiz (and of questions used by the audience)
+        self.duplicates = self._create_duplicates() if near_duplicates else None
         self.rounds = self._create_rounds(cfg_rounds=cfg_rounds, delay_api=delay_api, clear_cache=clear_cache)
         
+        # Report rounds filled without network
+        if self.verbose and len(self.degraded_rounds) > 0:
+            print("Degraded rounds (deadline reached): {}".format(self.degraded_rounds))
+        
+    @property
+    def degraded_rounds(self) -> List[str]:
+        return [r.title for r in self.rounds if r.degraded]
+        
     def _create_rounds(self, cfg_rounds: dict, delay_api: float, clear_cache: float):
         
         # Round infos
@@ -95,13 +330,43 @@ class PybQuiz:
             print("Quiz: {}".format(self.title))
             print("Start rounds creation ...")
         
-        for i, cfg_round in enumerate(cfg_rounds):
-            
+        for cfg_round in cfg_rounds:
             # Update dict
-            cfg_round.update({"verbose": self.verbose, "delay_api": delay_api, "clear_cache": clear_cache})
+            cfg_round.update({
+                "verbose": self.verbose, "delay_api": delay_api, "clear_cache": clear_cache, "deadline": self.deadline, 
+                "used": self.used, "duplicates": self.duplicates,
+            })
             
-            # Update API token
+            # Update API token and rate limit
             cfg_round["token"] = self.tokens.get(cfg_round["api"], None)
+            cfg_round["rate_limit"] = self.rate_limits.get(cfg_round["api"], None)
+            
+            # Same settings for fallback categories
+            for cfg_fallback in cfg_round.get("fallback", []):
+                cfg_fallback["token"] = self.tokens.get(cfg_fallback["api"], None)
+                cfg_fallback["rate_limit"] = self.rate_limits.get(cfg_fallback["api"], None)
+            
+        handlers = self._create_handlers(cfg_rounds=cfg_rounds) if self.plan or self.local_first else {}
+        
+        # Questions of the local store first, only the rest goes to the network
+        if self.local_first:
+            for cfg_round, questions in zip(cfg_rounds, self._take_local(cfg_rounds=cfg_rounds, handlers=handlers)):
+                cfg_round["prefetched"] = questions
+                cfg_round["local_first"] = True
+        
+        # Fetch questions of all rounds with as few queries as possible
+        if self.plan:
+            planner = FetchPlanner(handlers=handlers, verbose=self.verbose, used=self.used)
+            prefetched = planner.run(cfg_rounds=[self._remaining(cfg_round) for cfg_round in cfg_rounds])
+            for cfg_round, questions in zip(cfg_rounds, prefetched):
+                local = cfg_round.get("prefetched", {})
+                cfg_round["prefetched"] = {d: local.get(d, []) + questions.get(d, []) for d in questions}
+        
+        # Planning is over, rounds set the deadline again while they query
+        for handler in handlers.values():
+            handler.set_deadline(None)
+        
+        for i, cfg_round in enumerate(cfg_rounds):
             
             # Display current info
             if self.verbose:
@@ -115,6 +380,76 @@ class PybQuiz:
         
         # Return rounds
         return rounds
+    
+    def _create_duplicates(self) -> NearDuplicateFilter:
+        """
+        Near duplicate filter of the quiz. With an audience, the index of the local
+        question bank is brought up to date to recognize questions already played.
+        """
+        index = None
+        store = get_question_store()
+        if self.used is not None and store is not None:
+            index = NearDuplicateIndex()
+            index.update(store=store, verbose=self.verbose)
+        return NearDuplicateFilter(index=index, used=self.used)
+    
+    def _take_local(self, cfg_rounds: dict, handlers: dict) -> List[dict]:
+        """
+        Questions of the local store per difficulty level for each round. A question is
+        given to a single round.
+        """
+        taken = {}
+        prefetched = []
+        for cfg_round in cfg_rounds:
+            questions = {}
+            handler = handlers.get((cfg_round["api"], cfg_round["token"]), None)
+            for d, n in enumerate(cfg_round.get("difficulty", [])):
+                if handler is None or n <= 0:
+                    continue
+                exclude = taken.setdefault(cfg_round["api"], set())
+                questions[d] = handler.get_local_questions(
+                    n=n, category_id=cfg_round["theme_id"], difficulty=d, type=cfg_round.get("type", None), 
+                    exclude=Exclusion(exclude, self.used, library=handler.library),
+                )
+                exclude.update([q.uuid for q in questions[d] if q.uuid])
+            prefetched.append(questions)
+        
+        if self.verbose:
+            n_local = sum([len(qs) for questions in prefetched for qs in questions.values()])
+            print("Found {} questions in the local store".format(n_local))
+        
+        return prefetched
+    
+    @staticmethod
+    def _remaining(cfg_round: dict) -> dict:
+        """
+        Round configuration asking only for questions not prefetched yet.
+        """
+        prefetched = cfg_round.get("prefetched", {})
+        difficulty = [max(n - len(prefetched.get(d, [])), 0) for d, n in enumerate(cfg_round.get("difficulty", []))]
+        return dict(cfg_round, difficulty=difficulty)
+    
+    def _create_handlers(self, cfg_rounds: dict) -> dict:
+        """
+        Create one handler per API (and token) used by the rounds. APIs that cannot be
+        used (e.g. missing token) are skipped.
+        """
+        handlers = {}
+        for cfg_round in cfg_rounds:
+            key = (cfg_round["api"], cfg_round["token"])
+            if key in handlers:
+                continue
+            try:
+                handler = create_handler(
+                    name=cfg_round["api"], delay_api=cfg_round["delay_api"], token=cfg_round["token"], verbose=self.verbose,
+                    clear_cache=cfg_round["clear_cache"], rate_limit=cfg_round["rate_limit"], deadline=self.deadline,
+                )
+            except NotImplementedError:
+                continue
+            if not isinstance(handler, BaseAPIHandler):
+                continue
+            handlers[key] = handler
+        return handlers
         
     def dump(self, file: str):
         
@@ -128,13 +463,19 @@ class PybQuiz:
         # Save file
         with open(file, "w") as f:
             json.dump(json_data, f, indent=4, sort_keys=True)
+        
+        # Never play these questions again in front of the audience
+        if self.used is not None:
+            n_used = self.used.mark(questions=[q for r in self.rounds for q in r.questions])
+            if self.verbose:
+                print("Marked {} questions as used for '{}'".format(n_used, self.used.audience))
 
         # Display result
         if self.verbose:
             print("Saved to {}".format(file))
             
     @staticmethod
-    def from_yaml(yaml_path: str, yaml_token: str = None):
+    def from_yaml(yaml_path: str, yaml_token: str = None, deadline: float = None):
         
         # Default tokens empty
         data_token = {}
@@ -150,13 +491,27 @@ class PybQuiz:
         
         # Base infos
         cfg_base = data_cfg.get("BaseInfo", {})
-        delay_api = cfg_base.get("delay_api", 5.)
+        delay_api = cfg_base.get("delay_api", None)
+        rate_limits = cfg_base.get("rate_limits", {})
         author = cfg_base.get("author", "")
         title = cfg_base.get("title", "")
         verbose = cfg_base.get("verbose", True) 
         clear_cache = cfg_base.get("clear_cache", False) 
+        deadline = cfg_base.get("deadline", None) if deadline is None else deadline
+        plan = cfg_base.get("plan", True)
+        local_first = cfg_base.get("local_first", False)
+        audience = cfg_base.get("audience", None)
+        near_duplicates = cfg_base.get("near_duplicates", False)
         cfg_rounds = data_cfg.get("Rounds", [])
         
+        # Custom cache folder (default to the user cache folder)
+        if "cache_dir" in cfg_base:
+            set_cache_home(path=os.path.expanduser(cfg_base["cache_dir"]))
+        
+        # Custom HTTP settings (timeouts, max size)
+        if "transport" in cfg_base:
+            configure_transport(**cfg_base["transport"])
+        
         # Create quiz
         quiz = PybQuiz(
             title = title,
@@ -165,6 +520,12 @@ class PybQuiz:
             cfg_rounds=cfg_rounds, 
             clear_cache=clear_cache,
             tokens=data_token,
-            verbose=verbose
+            verbose=verbose,
+            rate_limits=rate_limits,
+            deadline=deadline,
+            plan=plan,
+            local_first=local_first,
+            audience=audience,
+            near_duplicates=near_duplicates,
         )
         return quiz
\ No newline at end of file
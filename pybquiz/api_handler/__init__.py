@@ -1,7 +1,10 @@
 import os
+import threading
 import yaml
 
 from pybquiz.api_handler.base import BaseAPIHandler
+from pybquiz.api_handler.deadline import Deadline
+from pybquiz.api_handler.store import get_cache_home
 from pybquiz.api_handler.opentriviadb import OpenTriviaDB
 from pybquiz.api_handler.thetriviaapi import TheTriviaAPI
 from pybquiz.api_handler.quizapi import QuizAPI
@@ -11,13 +14,106 @@ import pybquiz.api_handler as API
 __all__ = ['OpenTriviaDB', "TheTriviaAPI", "QuizAPI", "APINinjas"]
 
 
-def create_handler(name: str, delay_api: float = 5., token: str = None, verbose: bool = True, clear_cache: bool = False) -> BaseAPIHandler:
-    
+# Handlers shared by the process, indexed by name, token and settings. The registry
+# lock only guards the dicts, each key has its own lock held during construction
+_HANDLERS = {}
+_HANDLERS_LOCKS = {}
+_HANDLERS_LOCK = threading.Lock()
+
+
+def create_handler(
+    name: str, 
+    delay_api: float = None, 
+    token: str = None, 
+    verbose: bool = True, 
+    clear_cache: bool = False, 
+    rate_limit: dict = None,
+    offline: bool = False,
+    shared: bool = True,
+    deadline: Deadline = None,
+) -> BaseAPIHandler:
+    """
+    Get the handler of an API. By default handlers are shared by the whole process so
+    that category metadata, rate limits and sessions are loaded once and reused by all 
+    rounds and quizzes.
+
+    Parameters
+    ----------
+    name : str
+        Name of the API (class name, e.g. "OpenTriviaDB").
+    delay_api : float, optional
+        Fixed time between queries to API in seconds, by default None.
+    token : str, optional
+        API token, by default None.
+    verbose : bool, optional
+        Extended verbose terminal output, by default True.
+    clear_cache : bool, optional
+        Rebuild category metadata (once per process for shared handlers), by default False.
+    rate_limit : dict, optional
+        Custom rate limit with keys "requests", "window" and "burst", by default None.
+    offline : bool, optional
+        Never query the API, by default False.
+    shared : bool, optional
+        Reuse the handler of the process registry, by default True.
+    deadline : Deadline, optional
+        Time budget of the queries, set on shared handlers too (see `set_deadline`), by 
+        default None.
+
+    Returns
+    -------
+    handler : BaseAPIHandler
+        API handler.
+        
+    Raises
+    ------
+    NotImplementedError
+        If the API is unknown or its token is missing.
+    """
     if not hasattr(API, name):
-        return NotImplementedError()
+        raise NotImplementedError("Unknown API {}".format(name))
     
     cls = getattr(API, name) 
-    return cls(delay_api=delay_api, token=token, verbose=verbose, clear_cache=clear_cache)
+    if not shared:
+        return cls(delay_api=delay_api, token=token, verbose=verbose, clear_cache=clear_cache, rate_limit=rate_limit, offline=offline, deadline=deadline)
+    
+    # Same API reached with the same settings and cache folder
+    key = (
+        name, token, delay_api, None if rate_limit is None else tuple(sorted(rate_limit.items())), offline, 
+        cls.URL_REDIRECT, get_cache_home(),
+    )
+    with _HANDLERS_LOCK:
+        lock = _HANDLERS_LOCKS.setdefault(key, threading.Lock())
+    
+    # Other APIs are not blocked while this one loads its metadata
+    with lock:
+        with _HANDLERS_LOCK:
+            handler = _HANDLERS.get(key, None)
+        # Cache already rebuilt by this process if required
+        if handler is None or (clear_cache and not handler.cleared):
+            handler = cls(delay_api=delay_api, token=token, verbose=verbose, clear_cache=clear_cache, rate_limit=rate_limit, offline=offline, deadline=deadline)
+            with _HANDLERS_LOCK:
+                _HANDLERS[key] = handler
+        else:
+            handler.set_deadline(deadline)
+            # Metadata may have failed to load at creation (deadline reached, no cache yet)
+            handler.reload_db()
+    return handler
+
+
+def clear_handlers():
+    """
+    Empty the handler registry, next calls to `create_handler` create new handlers.
+    """
+    with _HANDLERS_LOCK:
+        _HANDLERS.clear()
+
+
+def redirect(base_url: str = None):
+    """
+    Point all handlers to a stand-in server (e.g. TriviaSimulator), None to restore.
+    """
+    for name in __all__:
+        getattr(API, name).redirect(base_url=base_url)
 
 
 def from_yaml(yaml_file: str):
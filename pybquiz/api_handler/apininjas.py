@@ -1,5 +1,8 @@
 from pybquiz.api_handler.base import BaseAPIHandler
+from pybquiz.api_handler.deadline import Deadline
+from pybquiz.api_handler.retry import APIError
 from typing import Union, List
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
 from tqdm import tqdm
 from pybquiz.elements import Questions
@@ -18,6 +21,18 @@ class APINinjas(BaseAPIHandler):
     KEY_R_QUESTION = "question"
     KEY_R_ANSWER = "answer"
     
+    # Rate limit
+    RATE_REQUESTS = 1
+    RATE_WINDOW = 1.0
+    RATE_BURST = 10
+    
+    # Questions have no difficulty level
+    QUERY_DIFFICULTY = False
+    
+    # Batched mode, requests in flight and maximal number of requests per question asked
+    BATCH_WORKERS = 10
+    BATCH_MAX_FACTOR = 2
+    
     # Hard coded :(
     CATEGORIES = [
         "artliterature",
@@ -38,10 +53,13 @@ class APINinjas(BaseAPIHandler):
     
     def __init__(
         self,
-        delay_api: int = 5,
+        delay_api: float = None,
         verbose: bool = True,
         clear_cache: bool = False,
+        rate_limit: dict = None,
         token: str = None,
+        offline: bool = False,
+        deadline: Deadline = None,
     ) -> None:
         """
         
@@ -49,8 +67,15 @@ class APINinjas(BaseAPIHandler):
 
         Parameters
         ----------
-        delay_api : int, optional
-            Default time between queries to API in seconds. By default 5 seconds.
+        delay_api : float, optional
+            Fixed time between queries to API in seconds. By default None, use the 
+            handler rate limit (RATE_REQUESTS per RATE_WINDOW seconds).
+        rate_limit : dict, optional
+            Custom rate limit with keys "requests", "window" and "burst".
+        offline : bool, optional
+            Never query the API, use cached statistics only. By default False.
+        deadline : Deadline, optional
+            Time budget of the queries, category metadata included. By default None.
         """
         
         # Key is needed for this api
@@ -58,7 +83,7 @@ class APINinjas(BaseAPIHandler):
             raise NotImplementedError()
         
         self.token = token
-        super().__init__(verbose=verbose, delay_api=delay_api, clear_cache=clear_cache, qtype="Open")
+        super().__init__(verbose=verbose, delay_api=delay_api, clear_cache=clear_cache, qtype="Open", rate_limit=rate_limit, offline=offline, deadline=deadline)
                 
     def initialize_db(self) -> Union[List[str], List[int], np.ndarray, np.ndarray]:
         """
@@ -88,37 +113,111 @@ class APINinjas(BaseAPIHandler):
         # Retreive categories
         return categories_name, categories_id, categories_type, categories_difficulty
     
-    def get_questions(self, n: int, category_id: int = None, difficulty: int = None, type: str = None) -> List[Questions]:
+    def count_requests(self, n: int) -> int:
+        """
+        One request per question.
+        """
+        return max(n, 0)
+    
+    def get_questions(self, n: int, category_id: int = None, difficulty: int = None, type: str = None, batched: bool = True) -> List[Questions]:
+        """
+        Get questions, one request per question. In batched mode requests are sent
+        concurrently (paced by the rate limiter) until `n` unique questions are collected 
+        or BATCH_MAX_FACTOR * n requests were sent.
 
+        Parameters
+        ----------
+        n : int
+            Number of questions.
+        category_id : int, optional
+            Category of the questions, by default None (any).
+        difficulty : int, optional
+            Not supported by the API, by default None.
+        type : str, optional
+            Not supported by the API, by default None.
+        batched : bool, optional
+            Send requests concurrently, by default True.
+
+        Returns
+        -------
+        questions : List[Questions]
+            At most n unique questions.
+        """
         params = {}
         header = {}
         
         # Check category
         if category_id is not None:
-            params[self.KEY_CAT] = self.categories[category_id]
+            params[self.KEY_CAT] = self.category_name(category_id=category_id)
         # Check session token
         if self.token is not None:
             header[self.KEY_TOKEN] = self.token
-                        
-        # Create query dict (if None then consider any)
-        questions = []
-        for i in range(n):
-            # Send request
-            result = self.slow_request_urllib3(url=self.URL_QUESTION, header=header, params=params)[0]
-            q_text = result.get(self.KEY_R_QUESTION, self.KEY_R_ERROR)
-            # Create question
-            q = Questions(
-                question=q_text,
-                correct_answers=[result.get(self.KEY_R_ANSWER, self.KEY_R_ERROR)],
-                incorrect_answers=[],
-                library=self.__class__.__name__.lower(), 
-                category=result.get(self.KEY_R_CAT, self.KEY_R_ERROR),
-                category_id=category_id,
-                uuid=hashlib.md5(q_text.encode('ascii')).hexdigest(),
-                difficulty=None,
-                type="text",
-            )
-            questions.append(q)
-
-            
-        return questions
\ No newline at end of file
+        
+        if not batched:
+            questions = []
+            for i in range(n):
+                q = self.get_question(header=header, params=params, category_id=category_id)
+                if q is None:
+                    break
+                questions.append(q)
+            return self.save_questions(questions)
+        
+        # Unique questions by uuid
+        questions = {}
+        sent = 0
+        error, stop = None, False
+        with ThreadPoolExecutor(max_workers=self.BATCH_WORKERS) as executor:
+            pending = set()
+            while True:
+                # Keep as many requests in flight as questions are missing
+                while not stop and sent < self.BATCH_MAX_FACTOR * n and len(pending) < min(self.BATCH_WORKERS, n - len(questions)):
+                    pending.add(executor.submit(self.get_question, header, params, category_id))
+                    sent += 1
+                if len(pending) == 0:
+                    break
+                
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        q = task.result()
+                    except APIError as e:
+                        error, stop = e, True
+                        continue
+                    if q is None:
+                        stop = True
+                        continue
+                    questions.setdefault(q.uuid, q)
+        
+        # Keep questions already fetched
+        if len(questions) == 0 and error is not None:
+            raise error
+        if error is not None:
+            print("Warning: {}".format(error))
+                    
+        return self.save_questions(list(questions.values())[:n])
+    
+    def get_question(self, header: dict, params: dict, category_id: int = None) -> Questions:
+        """
+        Get a single question, None if the API returned an error.
+        """
+        # Send request
+        result = self.slow_request_urllib3(url=self.URL_QUESTION, header=header, params=params)
+        # Check if answer is correct
+        if self.is_error(result=result) or len(result) == 0:
+            if self.verbose:
+                print("Error in API: {}".format(result))
+            return None
+        result = result[0]
+        q_text = result.get(self.KEY_R_QUESTION, self.KEY_R_ERROR)
+        # Create question
+        return Questions(
+            question=q_text,
+            correct_answers=[result.get(self.KEY_R_ANSWER, self.KEY_R_ERROR)],
+            incorrect_answers=[],
+            library=self.__class__.__name__.lower(), 
+            category=result.get(self.KEY_R_CAT, self.KEY_R_ERROR),
+            category_id=category_id,
+            uuid=hashlib.md5(q_text.encode('utf8')).hexdigest(),
+            difficulty=None,
+            type="text",
+        )
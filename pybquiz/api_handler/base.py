@@ -2,95 +2,724 @@ from abc import abstractmethod
 from typing import List
 from typing import Union, Tuple
 import time
-import requests
-import json
 import numpy as np
 from py_markdown_table.markdown_table import markdown_table
-import pickle
 import os
+import re
+import html
+import unicodedata
+import threading
+import sqlite3
+from collections import OrderedDict
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
 from pybquiz.elements import Questions
-import urllib3
-import http.client
-from urllib.parse import urlparse, urlencode
+from pybquiz.api_handler.ratelimit import TokenBucket, SharedTokenBucket, AIMDController
+from pybquiz.api_handler.transport import HTTPTransport, Response, TransportError, get_transport
+from pybquiz.api_handler.cache import ResponseCache
+from pybquiz.api_handler.cassette import get_cassette
+from pybquiz.api_handler.retry import RetryPolicy, CircuitBreaker, APIError, RetryableError, CircuitOpenError, BudgetExceeded
+from pybquiz.api_handler.deadline import Deadline, DeadlineExceeded
+from pybquiz.api_handler.store import ArrayStore, StoreError, get_cache_home
+from pybquiz.filelock import FileLock
+from pybquiz.db.store import QuestionStore, get_question_store
 
 
 CACHE_FOLDER = ".cache"
 
+
+class UnknownCategoryError(APIError, KeyError):
+    """
+    Raised when a category id or name is not in the handler metadata.
+    """
+    pass
+
+
+class CategoryMetadata:
+
+    __slots__ = ["categories", "categories_id", "categories_type", "categories_difficulty", "index_id", "index_name", "index_norm"]
+
+    def __init__(self, cats: np.ndarray, cats_id: np.ndarray, cats_type: np.ndarray, cats_diff: np.ndarray, normalize=None) -> None:
+        """
+        Category metadata of a handler and its lookup indexes (id, name and normalized
+        name to row). Never modified once built, a refresh builds a new one so that
+        readers always see arrays and indexes of the same version.
+
+        Parameters
+        ----------
+        cats : np.ndarray
+            Category names.
+        cats_id : np.ndarray
+            Category ids.
+        cats_type : np.ndarray
+            Number of questions per type (text, image).
+        cats_diff : np.ndarray
+            Number of questions per difficulty level.
+        normalize : callable, optional
+            Normalization of names, by default BaseAPIHandler.normalize_name.
+        """
+        normalize = BaseAPIHandler.normalize_name if normalize is None else normalize
+        self.categories, self.categories_id, self.categories_type, self.categories_difficulty = cats, cats_id, cats_type, cats_diff
+        self.index_id = {int(id): i for i, id in enumerate(cats_id)}
+        self.index_name = {str(name): i for i, name in enumerate(cats)}
+        self.index_norm = {normalize(name): i for i, name in enumerate(cats)}
+
+    def __repr__(self):
+        return "{}(categories={})".format(self.__class__.__name__, len(self.categories))
+
+
 class BaseAPIHandler:
+    
+    # Default rate limit (requests per window in seconds and burst size)
+    RATE_REQUESTS = 1
+    RATE_WINDOW = 5.0
+    RATE_BURST = 1
+    # Share the budget with all processes of the machine (SQLite ledger)
+    RATE_SHARED = True
+    
+    # Adaptive rate (AIMD), increase and bounds relative to the configured rate
+    RATE_INCREASE = 0.05
+    RATE_DECREASE = 0.5
+    RATE_MIN_FACTOR = 0.1
+    RATE_MAX_FACTOR = 4.0
+    
+    KEY_RATE_REQUESTS = "requests"
+    KEY_RATE_WINDOW = "window"
+    KEY_RATE_BURST = "burst"
+    KEY_R_ERROR = "error"
+    
+    KEY_RETRY_AFTER = "Retry-After"
+    
+    STATUS_TOO_MANY_REQUESTS = 429
+    # Error payloads asking to slow down (lower case)
+    THROTTLE_MESSAGES = ["rate limit", "too many requests", "quota"]
+    
+    # Retry policy and circuit breaker
+    RETRY_MAX = 3
+    RETRY_BACKOFF = 2.0
+    RETRY_MAX_BACKOFF = 60.
+    CIRCUIT_THRESHOLD = 5
+    CIRCUIT_RESET = 120.
+    
+    # Query capabilities, payload reports each question difficulty (queries without
+    # difficulty can be split afterwards) and a query can target several categories
+    MIXED_DIFFICULTY = False
+    MULTI_CATEGORY = False
+    # Queries can target a difficulty level
+    QUERY_DIFFICULTY = True
+    
+    LUT_DIFFICULTY = {
+        0: "easy",
+        1: "medium",
+        2: "hard",
+    }
+    
+    # Maximal number of questions per query (None if no limit)
+    MAX_BATCH = None
+    # Number of pages without new questions before giving up
+    MAX_STALE_PAGES = 2
+    
+    # Number of concurrent requests of the metadata crawler (paced by the rate limiter)
+    CRAWL_WORKERS = 8
+    # Number of concurrent requests of batched queries
+    BATCH_WORKERS = 1
+    
+    # Base URL of a stand-in server (see redirect)
+    URL_REDIRECT = None
+    
+    # Response cache, TTL in seconds per URL (uncached if not listed) and size in bytes
+    CACHE_TTL = {}
+    CACHE_MAX_SIZE = 50 * 1024 * 1024
+    
+    # Category metadata is served from cache and refreshed in background once older than TTL
+    METADATA_TTL = 7 * 24 * 3600
+    # Background refreshes in progress, one per cache file
+    REFRESH_LOCK = threading.Lock()
+    REFRESH_THREADS = {}
    
     def __init__(
         self,
         verbose: bool = True,
-        delay_api: float = 5.0,
+        delay_api: float = None,
         clear_cache: bool = False,
         qtype: str = None,
+        rate_limit: dict = None,
+        offline: bool = False,
+        deadline: Deadline = None,
     ) -> None:
         
         # Laod variables
         self.force_reload = False
+        # Metadata rebuilt at construction (clear_cache), see create_handler
+        self.cleared = clear_cache
         self.verbose = verbose
+        # Never send requests, only cached statistics are available
+        self.offline = offline
         self.delay_api = delay_api
         self.qtype = qtype
-        # Define cache file
-        self.cache_dir = os.path.join(os.path.dirname(__file__), ".cache")
-        self.cache_file = os.path.join(self.cache_dir, self.__class__.__name__.lower() + ".npy")
+        # Define cache store (user cache folder, see get_cache_home)
+        self.cache_dir = os.path.join(get_cache_home(), "api_handler")
+        if self.URL_REDIRECT is not None:
+            # Keep data of stand-in servers apart
+            self.cache_dir = os.path.join(self.cache_dir, "redirect", urlparse(self.URL_REDIRECT).netloc.replace(":", "_"))
+        self.store = ArrayStore(path=os.path.join(self.cache_dir, self.__class__.__name__.lower()))
+        self.cache_file = self.store.path
+        self.rate_file = os.path.join(self.cache_dir, self.__class__.__name__.lower() + "_rate.json")
+        self.ledger_file = os.path.join(self.cache_dir, "ratelimit.sqlite")
         os.makedirs(self.cache_dir, exist_ok=True)
+        # Define response cache
+        self.response_cache = ResponseCache(
+            cache_dir=os.path.join(self.cache_dir, "responses", self.__class__.__name__.lower()), 
+            max_size=self.CACHE_MAX_SIZE,
+        )
+        # Define rate limiter and its adaptive controller
+        self.limiter = self.create_limiter(delay_api=delay_api, rate_limit=rate_limit)
+        self.controller = self.create_controller(limiter=self.limiter)
+        # Define retry policy and circuit breaker
+        self.retry = RetryPolicy(max_retries=self.RETRY_MAX, backoff=self.RETRY_BACKOFF, max_backoff=self.RETRY_MAX_BACKOFF)
+        self.breaker = CircuitBreaker(failure_threshold=self.CIRCUIT_THRESHOLD, reset_timeout=self.CIRCUIT_RESET)
+        # Overall time budget of queries (see set_deadline), metadata requests included
+        self.deadline = deadline
+        # HTTP requests sent (retries and token calls included) and limit (see set_request_budget)
+        self.sent_requests = 0
+        self.request_limit = None
+        self.sent_lock = threading.Lock()
+        
+        # Only one process builds the cache, the others wait and reuse it
+        self.cache_lock = os.path.join(self.cache_dir, self.__class__.__name__.lower() + ".lock")
+        requested = time.time()
+        rebuild = clear_cache and not self.offline
+        
+        # Relaod from cache (False if missing or invalid)
+        loaded = not rebuild and self.load_db()
         
-        # Check if already exists:
-        if not os.path.exists(self.cache_file) or clear_cache:
-            # Reload from web (update)
+        if not loaded:
+            with FileLock(path=self.cache_lock):
+                # Built by another process while waiting
+                loaded = self.load_db() and (not rebuild or self.fetched_at >= requested)
+                
+                # Cache written by older versions inside the package folder
+                if not loaded and not rebuild and self.URL_REDIRECT is None:
+                    self.migrate_db(path=os.path.join(os.path.dirname(__file__), CACHE_FOLDER, self.__class__.__name__.lower() + ".npy"))
+                    loaded = self.load_db()
+                
+                # Check if already exists:
+                if not loaded and not self.offline:
+                    # Reload from web (update)
+                    if self.verbose:
+                        print("Initialize {} (first time only)".format(self.__class__.__name__.lower()))
                     
-            if self.verbose:
-                print("Initialize {} (first time only)".format(self.__class__.__name__.lower()))
+                    try:
+                        loaded = self.commit_db(*self.initialize_db())
+                    except DeadlineExceeded as e:
+                        # Categories stay unknown until reload_db (see create_handler)
+                        print("Warning: {}".format(e))
+        
+        # Nothing cached yet and no network, categories are unknown
+        if not loaded:
+            self.set_db(np.array([]), np.array([], dtype=int), np.zeros((0, 2)), np.zeros((0, 3)))
+            self.fetched_at = 0.
+            return
+        
+        # Serve stale metadata right away, refresh it in background
+        if not self.offline and time.time() - self.fetched_at > self.METADATA_TTL:
+            self.start_refresh()
             
-            cats, cats_id, cats_type, cats_diff = self.initialize_db()
-            with open(self.cache_file, 'wb') as f:
-                np.save(f, cats)
-                np.save(f, cats_id)
-                np.save(f, cats_type)
-                np.save(f, cats_diff)                
+    def save_db(self, cats: List[str], cats_id: List[int], cats_type: np.ndarray, cats_diff: np.ndarray, fetched_at: float = None):
+        """
+        Save category metadata and the time it was fetched (now by default) to the cache 
+        store (atomic).
+        """
+        self.store.save(
+            arrays={
+                "categories": np.array(cats, dtype=str),
+                "categories_id": np.array(cats_id),
+                "categories_type": np.array(cats_type),
+                "categories_difficulty": np.array(cats_diff),
+            },
+            meta={"fetched_at": time.time() if fetched_at is None else fetched_at},
+        )
+        
+    def commit_db(self, cats: List[str], cats_id: List[int], cats_type: np.ndarray, cats_diff: np.ndarray) -> bool:
+        """
+        Use new category metadata: saved to the cache store then loaded back. Metadata
+        replayed from a cassette is only kept in memory, the cache holds live data only.
+
+        Returns
+        -------
+        loaded : bool
+            True if the metadata is in use.
+        """
+        cassette = get_cassette()
+        if cassette is not None and cassette.is_replay:
+            self.set_db(np.array(cats, dtype=str), np.array(cats_id), np.array(cats_type), np.array(cats_diff))
+            self.fetched_at = time.time()
+            return True
+        self.save_db(cats, cats_id, cats_type, cats_diff)
+        return self.load_db()
+        
+    def load_db(self) -> bool:
+        """
+        Load category metadata from the cache store (memory-mapped, shared by processes).
 
-        # Relaod from cache
-        with open(self.cache_file, 'rb') as f:
-            self.categories = np.load(f)
-            self.categories_id = np.load(f)
-            self.categories_type = np.load(f)
-            self.categories_difficulty = np.load(f)
+        Returns
+        -------
+        loaded : bool
+            False if the store is missing, from another version or corrupted.
+        """
+        try:
+            arrays, meta = self.store.load(mmap=True)
+        except StoreError as e:
+            if self.store.exists():
+                print("Warning: {}".format(e))
+            return False
+        self.set_db(arrays["categories"], arrays["categories_id"], arrays["categories_type"], arrays["categories_difficulty"])
+        self.fetched_at = meta.get("fetched_at", 0.)
+        return True
     
+    def reload_db(self) -> bool:
+        """
+        Load category metadata again if it is still unknown, e.g. the deadline was 
+        reached while building it at creation or nothing was cached yet (offline).
+        Read from the cache first, then built from the API unless offline.
+
+        Returns
+        -------
+        loaded : bool
+            True if categories are known.
+        """
+        if len(self.categories_id) > 0:
+            return True
+        # Cached by another handler meanwhile
+        if self.load_db():
+            return True
+        if self.offline:
+            return False
         
-    def slow_request_urllib3(self, url: str, header: dict = None, params: dict = None, method="GET"):
+        with FileLock(path=self.cache_lock):
+            # Built by another handler while waiting
+            if self.load_db():
+                return True
+            try:
+                return self.commit_db(*self.initialize_db())
+            except APIError as e:
+                print("Warning: {}".format(e))
+                return False
+    
+    def set_db(self, cats: np.ndarray, cats_id: np.ndarray, cats_type: np.ndarray, cats_diff: np.ndarray):
+        """
+        Set category metadata and build lookup indexes (id, name and normalized name to row).
+        """
+        # Single assignment, readers never mix two versions (background refresh)
+        self.metadata = CategoryMetadata(cats, cats_id, cats_type, cats_diff, normalize=self.normalize_name)
+    
+    # Metadata of the current snapshot. Read `metadata` once to combine several of them
+    @property
+    def categories(self) -> np.ndarray:
+        return self.metadata.categories
+    
+    @property
+    def categories_id(self) -> np.ndarray:
+        return self.metadata.categories_id
+    
+    @property
+    def categories_type(self) -> np.ndarray:
+        return self.metadata.categories_type
+    
+    @property
+    def categories_difficulty(self) -> np.ndarray:
+        return self.metadata.categories_difficulty
+        
+    @staticmethod
+    def normalize_name(name: str) -> str:
+        """
+        Name without case, accents and punctuation, e.g. "Entertainment: Books" -> "entertainmentbooks".
+        """
+        name = unicodedata.normalize("NFKD", html.unescape(str(name))).encode("ascii", "ignore").decode("ascii")
+        return re.sub('[^a-z0-9]+', '', name.lower())
+    
+    def category_row(self, category_id: int, strict: bool = True, metadata: CategoryMetadata = None) -> int:
+        """
+        Row of a category in the metadata arrays.
+
+        Parameters
+        ----------
+        category_id : int
+            Category id.
+        strict : bool, optional
+            Raise if the category is unknown, otherwise return None. By default True.
+        metadata : CategoryMetadata, optional
+            Snapshot the row is read from, by default the current one.
+
+        Returns
+        -------
+        row : int
+            Row of the category.
+
+        Raises
+        ------
+        UnknownCategoryError
+            If strict and the category is unknown.
+        """
+        metadata = self.metadata if metadata is None else metadata
+        try:
+            row = metadata.index_id.get(int(category_id), None)
+        except (TypeError, ValueError):
+            row = None
+        if row is None and strict:
+            raise UnknownCategoryError("Unknown category id {} for {}".format(category_id, self.__class__.__name__))
+        return row
+    
+    def category_row_by_name(self, name: str, strict: bool = True, metadata: CategoryMetadata = None) -> int:
+        """
+        Row of a category from its name (exact name first, then normalized name).
+
+        Parameters
+        ----------
+        name : str
+            Category name.
+        strict : bool, optional
+            Raise if the category is unknown, otherwise return None. By default True.
+        metadata : CategoryMetadata, optional
+            Snapshot the row is read from, by default the current one.
+
+        Returns
+        -------
+        row : int
+            Row of the category.
+
+        Raises
+        ------
+        UnknownCategoryError
+            If strict and the category is unknown.
+        """
+        metadata = self.metadata if metadata is None else metadata
+        row = metadata.index_name.get(str(name), None)
+        if row is None:
+            row = metadata.index_norm.get(self.normalize_name(name), None)
+        if row is None and strict:
+            raise UnknownCategoryError("Unknown category {} for {}".format(name, self.__class__.__name__))
+        return row
+    
+    def category_id_by_name(self, name: str, strict: bool = True) -> int:
+        """
+        Id of a category from its name, None if unknown and not strict.
+        """
+        metadata = self.metadata
+        row = self.category_row_by_name(name=name, strict=strict, metadata=metadata)
+        return None if row is None else int(metadata.categories_id[row])
+    
+    def category_name(self, category_id: int, strict: bool = True) -> str:
+        """
+        Name of a category from its id, None if unknown and not strict.
+        """
+        metadata = self.metadata
+        row = self.category_row(category_id=category_id, strict=strict, metadata=metadata)
+        return None if row is None else str(metadata.categories[row])
+    
+    def migrate_db(self, path: str):
+        """
+        Import a cache of older versions (four arrays saved back to back in a .npy file).
+        Metadata is considered stale and refreshed at first use.
+        """
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'rb') as f:
+                arrays = [np.load(f) for _ in range(4)]
+        except (OSError, ValueError, EOFError):
+            return
+        # Unknown fetch time
+        self.save_db(*arrays, fetched_at=0.)
+        
+    def start_refresh(self) -> threading.Thread:
+        """
+        Refresh category metadata in a background thread (at most one per cache file).
+        """
+        with self.REFRESH_LOCK:
+            thread = self.REFRESH_THREADS.get(self.cache_file, None)
+            if thread is None or not thread.is_alive():
+                if self.verbose:
+                    print("Refresh {} metadata in background".format(self.__class__.__name__.lower()))
+                thread = threading.Thread(target=self.refresh_db, daemon=True)
+                self.REFRESH_THREADS[self.cache_file] = thread
+                thread.start()
+        return thread
+        
+    def refresh_db(self):
+        """
+        Refresh category metadata. Only categories whose total changed (or new ones) are
+        counted again, if the API reports totals (see `category_totals`).
+        """
+        try:
+            with FileLock(path=self.cache_lock):
+                # Refreshed by another process while waiting
+                if self.load_db() and time.time() - self.fetched_at <= self.METADATA_TTL:
+                    return
+                totals = self.category_totals()
+                if totals is None:
+                    cats, cats_id, cats_type, cats_diff = self.initialize_db()
+                else:
+                    cats, cats_id, cats_type, cats_diff = self.update_db(totals=totals)
+                self.commit_db(cats, cats_id, cats_type, cats_diff)
+        except Exception as e:
+            # Stale metadata is still valid
+            print("Warning: refresh of {} metadata failed, {}".format(self.__class__.__name__.lower(), e))
+            
+    def update_db(self, totals: OrderedDict) -> Union[List[str], List[int], np.ndarray, np.ndarray]:
+        """
+        Build category metadata from cached counts, counting again categories whose total 
+        changed.
+
+        Parameters
+        ----------
+        totals : OrderedDict
+            Total number of questions per (category name, category id), -1 if unknown.
+
+        Returns
+        -------
+        categories : List[str]
+            List of N categories as strings.
+        categories_id : List[int]
+            List of N categories as ints.
+        categories_type : np.ndarray
+            Array of N categories 2 types ("text", "image")            
+        categories_difficulty : np.ndarray
+            Array of N categories and 3 difficulty level ("easy", "medium", "hard")
+        """
+        N = len(totals)
+        categories_name = [name for name, _ in totals]
+        categories_id = [id for _, id in totals]
+        categories_difficulty = np.zeros((N, 3))
+        categories_type = np.zeros((N, 2))
+        
+        # Keep counts of unchanged categories
+        metadata = self.metadata
+        cached = {name: i for i, name in enumerate(metadata.categories)}
+        changed = []
+        for i, ((name, id), total) in enumerate(totals.items()):
+            j = cached.get(name, None)
+            if j is not None and total >= 0 and metadata.categories_difficulty[j].sum() == total:
+                categories_difficulty[i] = metadata.categories_difficulty[j]
+                categories_type[i] = metadata.categories_type[j]
+            else:
+                changed.append(i)
+                
+        if self.verbose:
+            print("{} categories of {} changed".format(len(changed), self.__class__.__name__.lower()))
+        
+        def update(k, counts):
+            categories_difficulty[changed[k]], categories_type[changed[k]] = counts
+        
+        # Count changed categories, concurrently
+        items = [self.category_key(name=categories_name[i], id=categories_id[i]) for i in changed]
+        self.crawl(fn=self.count_category, items=items, callback=update)
+        
+        return categories_name, categories_id, categories_type, categories_difficulty
+    
+    def category_totals(self) -> OrderedDict:
+        """
+        Total number of questions per (category name, category id) as currently reported 
+        by the API. None if not available, then metadata is rebuilt with `initialize_db`.
+        """
+        return None
+    
+    def category_key(self, name: str, id: int):
+        """
+        Argument of `count_category` for a category.
+        """
+        return id
+    
+    def count_category(self, category) -> Tuple[List[int], List[int]]:
+        """
+        Number of questions of a category per difficulty and per type.
+        """
+        raise NotImplementedError
+    
+    def create_limiter(self, delay_api: float = None, rate_limit: dict = None) -> TokenBucket:
+        """
+        Create the token bucket of the handler. Class defaults (RATE_REQUESTS, RATE_WINDOW,
+        RATE_BURST) are used unless overwritten. If RATE_SHARED, the bucket is stored in
+        a SQLite ledger shared by all processes using the same cache folder.
+
+        Parameters
+        ----------
+        delay_api : float, optional
+            Legacy fixed delay in seconds. If positive, allow one request per `delay_api` 
+            seconds, 0 (no delay) keeps the class default rate.
+        rate_limit : dict, optional
+            Custom limit with keys "requests", "window" and "burst". Has priority over `delay_api`.
+
+        Returns
+        -------
+        limiter : TokenBucket
+            Rate limiter of the handler.
+        """
+        # Class defaults
+        n_requests = self.RATE_REQUESTS
+        window = self.RATE_WINDOW
+        burst = self.RATE_BURST
+        
+        # Legacy behavior, one request every delay_api seconds (0 means no extra delay,
+        # the API rate limit still applies)
+        if delay_api is not None and delay_api > 0:
+            n_requests, window, burst = 1, delay_api, 1
+            
+        # Custom rate limit
+        if rate_limit is not None:
+            n_requests = rate_limit.get(self.KEY_RATE_REQUESTS, n_requests)
+            window = rate_limit.get(self.KEY_RATE_WINDOW, window)
+            burst = rate_limit.get(self.KEY_RATE_BURST, burst)
+        
+        # Budget shared by all handlers of this API on the machine
+        if self.RATE_SHARED:
+            return SharedTokenBucket(
+                path=self.ledger_file, name=self.__class__.__name__.lower(), requests=n_requests, window=window, burst=burst,
+            )
+            
+        return TokenBucket(requests=n_requests, window=window, burst=burst)
+    
+    def create_controller(self, limiter: TokenBucket) -> AIMDController:
+        """
+        Create the AIMD controller adapting the limiter rate. Bounds are defined relative
+        to the configured rate (RATE_MIN_FACTOR, RATE_MAX_FACTOR), never to the live rate
+        so that they do not drift across runs. The learned rate is stored in `rate_file`
+        next to the handler cache.
+
+        Parameters
+        ----------
+        limiter : TokenBucket
+            Rate limiter to control.
+
+        Returns
+        -------
+        controller : AIMDController
+            Adaptive controller of the handler.
+        """
+        rate = limiter.configured_rate
+        return AIMDController(
+            bucket=limiter,
+            min_rate=rate * self.RATE_MIN_FACTOR,
+            max_rate=rate * self.RATE_MAX_FACTOR,
+            increase=rate * self.RATE_INCREASE,
+            decrease=self.RATE_DECREASE,
+            path=self.rate_file,
+        )
+        
+        
+    @classmethod
+    def redirect(cls, base_url: str = None):
+        """
+        Point URL constants (URL_*) of the handler to another server, e.g. a local 
+        TriviaSimulator. The path is kept and prefixed by the lower class name, for 
+        example https://opentdb.com/api.php becomes <base_url>/opentriviadb/api.php.
+
+        Parameters
+        ----------
+        base_url : str, optional
+            Base URL of the server, by default None (restore original URLs).
+        """
+        # Save original URLs once
+        if "URLS_DEFAULT" not in cls.__dict__:
+            cls.URLS_DEFAULT = {k: v for k, v in vars(cls).items() if k.startswith("URL_") and isinstance(v, str)}
+        
+        mapping = {}
+        for k, v in cls.URLS_DEFAULT.items():
+            url = v
+            if base_url is not None:
+                url = "{}/{}{}".format(base_url.rstrip("/"), cls.__name__.lower(), urlparse(v).path)
+            mapping[getattr(cls, k)] = url
+            setattr(cls, k, url)
+            
+        # Keep cached endpoints in line
+        cls.CACHE_TTL = {mapping.get(k, k): v for k, v in cls.CACHE_TTL.items()}
+        cls.URL_REDIRECT = base_url
+    
+    @property
+    def library(self) -> str:
+        """
+        Library of the questions of the handler (see Questions.library).
+        """
+        return self.__class__.__name__.lower()
+    
+    @property
+    def transport(self) -> HTTPTransport:
+        """
+        Pooled HTTP transport shared by all handlers, with a connection per concurrent
+        request of the handler.
         """
-        Send URL get request after a delay in seconds.
+        return get_transport(pool_size=max(self.CRAWL_WORKERS, self.BATCH_WORKERS))
+    
+    def send_request(self, url: str, header: dict = None, params: dict = None, method="GET") -> Response:
+        """
+        Send request through the shared transport once allowed by the rate limiter. If
+        a cassette is in use, the request is recorded or replayed (see `use_cassette`).
 
         Parameters
         ----------
         url : str
-            URL get query to send.
+            URL query to send.
+        header : dict, optional
+            Request headers, by default None.
+        params : dict, optional
+            Query fields, by default None.
+        method : str, optional
+            HTTP method, by default "GET".
 
         Returns
         -------
-        dict
-            Parsed result to URL query.
+        response : Response
+            Raw response to URL query.
         """
-        # Wait to not query too many times in a row            
-        time.sleep(self.delay_api) 
+        # Serve recorded response, no network
+        cassette = get_cassette()
+        if cassette is not None and cassette.is_replay:
+            return cassette.replay(url=url, params=params, method=method)
+        
+        if self.offline:
+            raise APIError("Offline handler, no request to {}".format(url))
+        
+        # Wait until the rate limit allows a new request (within deadline)
+        timeout = None
+        if self.deadline is not None:
+            timeout = self.deadline.remaining()
+        if self.limiter.acquire(timeout=timeout) is None:
+            raise DeadlineExceeded("Deadline reached, rate limit does not allow a request to {}".format(url))
         
         if self.verbose:
             print("Send request url: {}, key: {}".format(url, params))
             
-        # Build request
-        result = urllib3.request(
-            method=method, 
-            url=url,
-            headers=header,
-            fields=params, #  Add custom form fields
-        )
+        # Build request, remaining time is the timeout
+        if self.deadline is not None:
+            self.deadline.check(what="request to {}".format(url))
+            timeout = self.deadline.remaining()
         
-        return json.loads(result.data)
+        # Count the request, never go past the budget
+        with self.sent_lock:
+            if self.request_limit is not None and self.sent_requests >= self.request_limit:
+                raise BudgetExceeded("Request budget of {} spent, skip {}".format(self.__class__.__name__, url))
+            self.sent_requests += 1
+        try:
+            response = self.transport.request(url=url, header=header, params=params, method=method, timeout=timeout)
+        except TransportError:
+            # Timed out because of the deadline, do not retry
+            if self.deadline is not None:
+                self.deadline.check(what="request to {}".format(url))
+            raise
         
-    def slow_request_httpclient(self, url: str, header: dict = None, params: dict = None, method="GET"):
+        # Record response
+        if cassette is not None and cassette.is_record:
+            cassette.record(url=url, header=header, params=params, method=method, response=response)
+            
+        return response
+        
+    def slow_request_urllib3(self, url: str, header: dict = None, params: dict = None, method="GET"):
         """
-        Send URL get request after a delay in seconds.
+        Send URL get request once allowed by the rate limiter. Transient failures are
+        retried with exponential backoff, the circuit breaker fails fast once the 
+        provider is down. Results of URLs listed in CACHE_TTL are served from the 
+        response cache while fresh.
 
         Parameters
         ----------
@@ -101,22 +730,413 @@ class BaseAPIHandler:
         -------
         dict
             Parsed result to URL query.
+            
+        Raises
+        ------
+        APIError
+            If the query failed after all retries (CircuitOpenError if provider is down).
         """
-        # Wait to not query too many times in a row            
-        time.sleep(self.delay_api) 
+        # Check if cached (metadata endpoints only), cassettes see every request
+        ttl = self.CACHE_TTL.get(url, None) if get_cassette() is None else None
+        if ttl is not None:
+            key = ResponseCache.make_key(url=url, params=params, method=method)
+            result = self.response_cache.get(key=key, ttl=ttl)
+            if result is not None:
+                if self.verbose:
+                    print("Cached request url: {}, key: {}".format(url, params))
+                return result
         
-        if self.verbose:
-            print("Send request url: {}, key: {}".format(url, params))
+        result = self._request_with_retry(url=url, header=header, params=params, method=method)
+        
+        # Only valid payloads are cached
+        if ttl is not None and not self.is_error(result=result):
+            self.response_cache.set(key=key, data=result, url=url)
+        
+        return result
+    
+    def _request_with_retry(self, url: str, header: dict = None, params: dict = None, method="GET"):
+        """
+        Send request, retry transient failures with exponential backoff.
+        """
+        for attempt in range(self.retry.max_retries + 1):
+            
+            # Fail fast if provider is considered down
+            if not self.breaker.allow():
+                raise CircuitOpenError("{} circuit open, skip {}".format(self.__class__.__name__, url))
+            
+            try:
+                response = self.send_request(url=url, header=header, params=params, method=method)
+                result = self.parse_response(response=response)
+            except (TransportError, RetryableError) as e:
+                error = e
+                # Throttling is not a provider failure
+                if getattr(e, "failure", True):
+                    self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+                return result
+            
+            # Wait before next attempt
+            if attempt < self.retry.max_retries:
+                delay = self.retry.delay(attempt=attempt, retry_after=getattr(error, "retry_after", None))
+                if self.deadline is not None:
+                    self.deadline.check(needed=delay, what="retry of {}".format(url))
+                if self.verbose:
+                    print("Request failed ({}), retry in {:.1f}s".format(error, delay))
+                time.sleep(delay)
+                
+        raise APIError("{} request to {} failed after {} attempts".format(
+            self.__class__.__name__, url, self.retry.max_retries + 1)) from error
+    
+    def crawl(self, fn, items: list, callback=None) -> list:
+        """
+        Call `fn` on each item concurrently (CRAWL_WORKERS threads). Each request still
+        waits for the rate limiter, so the crawl runs as fast as the rate budget allows.
+
+        Parameters
+        ----------
+        fn : callable
+            Function sending the request(s) of an item, `fn(item)`.
+        items : list
+            Items to crawl, e.g. categories.
+        callback : callable, optional
+            Called as `callback(index, result)` as soon as an item is done, by default None.
+
+        Returns
+        -------
+        results : list
+            Result of each item, in the order of `items`.
+        """
+        results = [None] * len(items)
+        tasks = {}
+        executor = ThreadPoolExecutor(max_workers=self.CRAWL_WORKERS)
+        try:
+            tasks = {executor.submit(fn, item): i for i, item in enumerate(items)}
+            for task in tqdm(as_completed(tasks), total=len(tasks), disable=(not self.verbose)):
+                i = tasks[task]
+                results[i] = task.result()
+                if callback is not None:
+                    callback(i, results[i])
+        finally:
+            # Drop items not started yet on failure (no-op once all are done), only wait
+            # for the requests in flight
+            for task in tasks:
+                task.cancel()
+            executor.shutdown(wait=True)
+        return results
+        
+    def parse_response(self, response: Response):
+        """
+        Parse response payload and adapt the request rate to it.
+
+        Parameters
+        ----------
+        response : Response
+            Raw response to URL query.
+
+        Returns
+        -------
+        result : dict or list
+            Parsed result to URL query.
+            
+        Raises
+        ------
+        RetryableError
+            If the request was throttled, the server failed or the payload is invalid.
+        APIError
+            If the request was rejected and the payload is not readable.
+        """
+        
+        # Replayed responses say nothing about the live API, keep the learned rate
+        cassette = get_cassette()
+        controller = None if cassette is not None and cassette.is_replay else self.controller
+        
+        # Delay requested by server
+        retry_after = response.headers.get(self.KEY_RETRY_AFTER, None)
+        retry_after = float(retry_after) if retry_after is not None and retry_after.isdigit() else None
+        
+        # Back off if rate limited by server
+        if response.status == self.STATUS_TOO_MANY_REQUESTS:
+            if controller is not None:
+                controller.throttle()
+            raise RetryableError("HTTP {}".format(response.status), retry_after=retry_after, failure=False)
+        # Server side failure
+        if self.retry.should_retry(response.status):
+            raise RetryableError("HTTP {}".format(response.status), retry_after=retry_after)
+        
+        # Parse payload
+        try:
+            result = response.json()
+        except ValueError:
+            if response.status >= 400:
+                raise APIError("HTTP {}: {}".format(response.status, response.data[:200]))
+            raise RetryableError("Invalid payload")
+        
+        # Check payload (API specific)
+        if self.is_throttled(result=result):
+            if controller is not None:
+                controller.throttle()
+            raise RetryableError("Rate limited: {}".format(result), failure=False)
+        if controller is not None and response.status < 400 and not self.is_error(result=result):
+            controller.success()
             
-        # Parse url
-        urlsegments = urlparse(url)
+        return result
+        
+    def fetch_questions(self, n: int, category_id: int = None, difficulty: int = None, type: str = None, max_pages: int = None) -> List[Questions]:
+        """
+        Get `n` questions, split in pages of at most MAX_BATCH questions. Pages are merged
+        and deduplicated by uuid. Stops once the API has no new question to offer.
+
+        Parameters
+        ----------
+        n : int
+            Number of questions.
+        category_id : int, optional
+            Category of the questions, by default None (any).
+        difficulty : int, optional
+            Difficulty level, by default None (any).
+        type : str, optional
+            Type of questions, by default None (any).
+        max_pages : int, optional
+            Maximal number of queries, by default None (no limit).
+
+        Returns
+        -------
+        questions : List[Questions]
+            At most n unique questions.
+        """
+        questions = {}
+        pages, stale = 0, 0
+        
+        while len(questions) < n and stale < self.MAX_STALE_PAGES:
+            # Size of next page
+            size = n - len(questions)
+            if self.MAX_BATCH is not None:
+                size = min(size, self.MAX_BATCH)
+            
+            try:
+                page = self.get_questions(n=size, category_id=category_id, difficulty=difficulty, type=type)
+            except APIError as e:
+                # Keep pages already fetched
+                if len(questions) == 0:
+                    raise
+                print("Warning: {}".format(e))
+                break
+            
+            # Merge unique questions
+            count = len(questions)
+            for q in page:
+                questions.setdefault(q.uuid if q.uuid else q.question, q)
+            stale = stale + 1 if len(questions) == count else 0
+            
+            # Check number of pages
+            pages += 1
+            if max_pages is not None and pages >= max_pages:
+                break
+            
+        return list(questions.values())[:n]
+    
+    def parse_difficulty(self, value: str, default: int = None) -> int:
+        """
+        Difficulty level (see LUT_DIFFICULTY) from the name reported by the API.
+        """
+        lut = {v: k for k, v in self.LUT_DIFFICULTY.items()}
+        return lut.get(str(value).lower(), default)
+    
+    def set_deadline(self, deadline: Deadline = None):
+        """
+        Set overall time budget of the queries. Each request uses the remaining time
+        as timeout and raises DeadlineExceeded if it cannot complete in time.
+
+        Parameters
+        ----------
+        deadline : Deadline, optional
+            Time budget, by default None (no limit).
+        """
+        self.deadline = deadline
+        
+    def set_request_budget(self, n: int = None):
+        """
+        Limit the number of HTTP requests sent from now on (retries and token calls
+        included). Requests past the budget raise BudgetExceeded before being sent.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of requests, by default None (no limit).
+        """
+        with self.sent_lock:
+            self.request_limit = None if n is None else self.sent_requests + n
+    
+    def requests_left(self) -> int:
+        """
+        Number of requests left in the budget, None if unlimited.
+        """
+        with self.sent_lock:
+            return None if self.request_limit is None else max(self.request_limit - self.sent_requests, 0)
+        
+    def expected_request_time(self) -> float:
+        """
+        Expected time in seconds before a new request completes (rate limit wait).
+        """
+        return self.limiter.expected_wait()
+    
+    def count_requests(self, n: int) -> int:
+        """
+        Number of requests needed to get `n` questions (pages of MAX_BATCH questions).
+        """
+        if n <= 0:
+            return 0
+        if self.MAX_BATCH is None:
+            return 1
+        return int(np.ceil(n / self.MAX_BATCH))
+    
+    def available_questions(self, category_id: int, difficulty: int = None) -> int:
+        """
+        Number of questions of a category according to cached statistics.
+
+        Parameters
+        ----------
+        category_id : int
+            Category of the questions.
+        difficulty : int, optional
+            Difficulty level, by default None (any).
+
+        Returns
+        -------
+        n : int
+            Number of questions, -1 if unknown and None if the category does not exist.
+        """
+        metadata = self.metadata
+        row = self.category_row(category_id=category_id, strict=False, metadata=metadata)
+        if row is None:
+            return None
+        counts = metadata.categories_difficulty[row]
+        counts = counts if difficulty is None else counts[difficulty:difficulty+1]
+        if np.any(counts < 0):
+            return -1
+        return int(counts.sum())
+    
+    def get_local_questions(self, n: int, category_id: int = None, difficulty: int = None, type: str = None, exclude: set = None) -> List[Questions]:
+        """
+        Questions available without network access, from the local question store.
+
+        Parameters
+        ----------
+        n : int
+            Number of questions.
+        category_id : int, optional
+            Category of the questions, by default None (any).
+        difficulty : int, optional
+            Difficulty level, by default None (any).
+        type : str, optional
+            Type of questions, by default None (any).
+        exclude : set, optional
+            Uuids not to return, by default None.
+
+        Returns
+        -------
+        questions : List[Questions]
+            At most n local questions.
+        """
+        store = self.question_store
+        if store is None:
+            return []
+        # Questions have no difficulty if the API cannot be queried by difficulty
+        difficulty = difficulty if self.QUERY_DIFFICULTY else None
+        return store.get(n=n, library=self.library, category_id=category_id, difficulty=difficulty, type=type, exclude=exclude)
+    
+    @property
+    def question_store(self) -> QuestionStore:
+        """
+        Local question store shared by all handlers (None if disabled). Handlers pointed
+        to a stand-in server use a store of their own, next to their metadata.
+        """
+        if self.URL_REDIRECT is not None:
+            return get_question_store(path=os.path.join(self.cache_dir, QuestionStore.FILENAME))
+        return get_question_store()
+    
+    def save_questions(self, questions: List[Questions]) -> List[Questions]:
+        """
+        Keep fetched questions in the local question store.
+
+        Parameters
+        ----------
+        questions : List[Questions]
+            Questions returned by the API.
 
-        conn = http.client.HTTPSConnection(urlsegments.netloc)
-        conn.request(method, "{}?{}".format(urlsegments.path, urlencode(params)), '', header)
-        res = conn.getresponse()
-        data = json.loads(res.read())
+        Returns
+        -------
+        questions : List[Questions]
+            Same questions.
+        """
+        # Replayed responses may come from any server, keep the bank clean
+        cassette = get_cassette()
+        if cassette is not None and cassette.is_replay:
+            return questions
         
-        return data
+        store = self.question_store
+        if store is not None and len(questions) > 0:
+            # Store is a best effort, never lose fetched questions
+            try:
+                store.add(questions=questions)
+            except sqlite3.Error as e:
+                print("Warning: {}".format(e))
+        return questions
+    
+    def is_throttled(self, result) -> bool:
+        """
+        Check if the parsed payload signals a rate limit (HTTP 429 is handled in 
+        `parse_response`).
+
+        Parameters
+        ----------
+        result : dict or list
+            Parsed result to URL query.
+
+        Returns
+        -------
+        throttled : bool
+            True if the API asks us to slow down.
+        """
+        # Error payload about the request rate
+        if result is None or not self.is_error(result=result) or not isinstance(result, dict):
+            return False
+        message = str(result.get(self.KEY_R_ERROR, "")).lower()
+        return any([m in message for m in self.THROTTLE_MESSAGES])
+    
+    def is_error(self, result) -> bool:
+        """
+        Check if the parsed payload is an error message.
+
+        Parameters
+        ----------
+        result : dict or list
+            Parsed result to URL query.
+
+        Returns
+        -------
+        error : bool
+            True if the API returned an error.
+        """
+        return result is None or (isinstance(result, dict) and self.KEY_R_ERROR in result)
+        
+    def slow_request_httpclient(self, url: str, header: dict = None, params: dict = None, method="GET"):
+        """
+        Send URL get request once allowed by the rate limiter. Kept for compatibility,
+        same as `slow_request_urllib3`.
+
+        Parameters
+        ----------
+        url : str
+            URL get query to send.
+
+        Returns
+        -------
+        dict
+            Parsed result to URL query.
+        """
+        return self.slow_request_urllib3(url=url, header=header, params=params, method=method)
     
     def __repr__(self):
         """
@@ -129,17 +1149,18 @@ class BaseAPIHandler:
         """
         
         data = []
-        N = len(self.categories)
+        metadata = self.metadata
+        N = len(metadata.categories)
         # Create table
         for i in range(N):
             data.append({
-                "ID": self.categories_id[i],
-                "Catgory": self.categories[i],
-                "Easy": int(self.categories_difficulty[i, 0]),
-                "Medium": int(self.categories_difficulty[i, 1]),
-                "Hard": int(self.categories_difficulty[i, 2]),
-                "Text": int(self.categories_type[i, 0]),
-                "Image": int(self.categories_type[i, 1]),
+                "ID": metadata.categories_id[i],
+                "Catgory": metadata.categories[i],
+                "Easy": int(metadata.categories_difficulty[i, 0]),
+                "Medium": int(metadata.categories_difficulty[i, 1]),
+                "Hard": int(metadata.categories_difficulty[i, 2]),
+                "Text": int(metadata.categories_type[i, 0]),
+                "Image": int(metadata.categories_type[i, 1]),
             })
         
         markdown = markdown_table(data).set_params(row_sep = 'markdown').get_markdown()
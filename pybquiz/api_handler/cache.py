@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+
+class ResponseCache:
+
+    KEY_URL = "url"
+    KEY_CREATED = "created"
+    KEY_DATA = "data"
+
+    def __init__(self, cache_dir: str, max_size: int = 50 * 1024 * 1024) -> None:
+        """
+        On-disk cache of parsed API responses. Entries are keyed by method, URL and
+        normalized parameters, expire after a per-request TTL and are evicted in least
+        recently used order once the cache exceeds `max_size` bytes.
+
+        Parameters
+        ----------
+        cache_dir : str
+            Folder where entries are stored (one JSON file per entry).
+        max_size : int, optional
+            Maximal size of the cache in bytes, by default 50 MB.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(url: str, params: dict = None, method: str = "GET") -> str:
+        """
+        Cache key of a request. Parameters are sorted so that their order does not matter.
+
+        Parameters
+        ----------
+        url : str
+            URL of the query.
+        params : dict, optional
+            Query fields, by default None.
+        method : str, optional
+            HTTP method, by default "GET".
+
+        Returns
+        -------
+        key : str
+            Hash of the request.
+        """
+        params = {} if params is None else params
+        query = urlencode(sorted((str(k), str(v)) for k, v in params.items()))
+        return hashlib.sha1("{} {}?{}".format(method.upper(), url, query).encode('utf8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key: str, ttl: float):
+        """
+        Get cached result, None if missing or older than `ttl` seconds.
+        """
+        path = self._path(key)
+        with self.lock:
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            # Check if expired
+            if time.time() - entry.get(self.KEY_CREATED, 0) > ttl:
+                self.misses += 1
+                return None
+            # Update access time for LRU order, evicted meanwhile by another process
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry.get(self.KEY_DATA, None)
+
+    def set(self, key: str, data, url: str = None):
+        """
+        Store result (written to a temporary file then renamed) and evict old entries.
+        """
+        path = self._path(key)
+        path_tmp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with self.lock:
+            with open(path_tmp, "w") as f:
+                json.dump({self.KEY_URL: url, self.KEY_CREATED: time.time(), self.KEY_DATA: data}, f)
+            os.replace(path_tmp, path)
+            self._evict()
+
+    def _evict(self):
+        # List entries by last access
+        entries = []
+        for f in os.listdir(self.cache_dir):
+            if not f.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, f))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, f))
+        # Drop least recently used until size fits
+        size = sum([e[1] for e in entries])
+        for _, s, f in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, f))
+            except OSError:
+                pass
+            size -= s
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        with self.lock:
+            for f in os.listdir(self.cache_dir):
+                if f.endswith(".json"):
+                    os.remove(os.path.join(self.cache_dir, f))
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def __repr__(self):
+        return "{}(dir={}, hits={}, misses={})".format(self.__class__.__name__, self.cache_dir, self.hits, self.misses)
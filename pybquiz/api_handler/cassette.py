@@ -0,0 +1,196 @@
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from pybquiz.api_handler.cache import ResponseCache
+from pybquiz.api_handler.retry import APIError
+from pybquiz.api_handler.transport import Response
+
+
+class CassetteMissError(APIError):
+    """
+    Raised in replay mode when a request was not recorded.
+    """
+    pass
+
+
+class Cassette:
+
+    MODE_RECORD = "record"
+    MODE_REPLAY = "replay"
+
+    # Never written to cassettes (API tokens), also masked in JSON bodies (session tokens)
+    SENSITIVE_HEADERS = ("x-api-key", "authorization")
+    SENSITIVE_PARAMS = ("token",)
+    REDACTED = "redacted"
+
+    KEY_METHOD = "method"
+    KEY_URL = "url"
+    KEY_PARAMS = "params"
+    KEY_HEADERS = "headers"
+    KEY_STATUS = "status"
+    KEY_RESPONSE_HEADERS = "response_headers"
+    KEY_BODY = "body"
+    KEY_BODY_B64 = "body_b64"
+    KEY_LATENCY = "latency"
+
+    def __init__(self, path: str, mode: str = MODE_REPLAY, latency: float = 0.) -> None:
+        """
+        Record / replay store of API requests. In record mode the cassette is emptied,
+        then every request and response is appended to it (gzip compressed JSON lines if
+        `path` ends with .gz). In replay mode responses are served back from the cassette
+        without network.
+
+        Parameters
+        ----------
+        path : str
+            Path to the cassette file.
+        mode : str, optional
+            Either "record" or "replay", by default "replay".
+        latency : float, optional
+            Replay only, factor applied to recorded latencies to simulate network time.
+            By default 0 (no wait).
+        """
+        if mode not in [self.MODE_RECORD, self.MODE_REPLAY]:
+            raise ValueError("Unknown cassette mode: {}".format(mode))
+
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.entries = defaultdict(deque)
+
+        if self.mode == self.MODE_REPLAY:
+            self.load()
+        else:
+            # A new recording replaces the previous one
+            if os.path.dirname(self.path) != "":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self._open("w"):
+                pass
+
+    @property
+    def is_replay(self) -> bool:
+        return self.mode == self.MODE_REPLAY
+
+    @property
+    def is_record(self) -> bool:
+        return self.mode == self.MODE_RECORD
+
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf8")
+        return open(self.path, mode, encoding="utf8")
+
+    @classmethod
+    def _redact_params(cls, params: dict = None) -> dict:
+        params = {} if params is None else params
+        return {k: v for k, v in params.items() if k not in cls.SENSITIVE_PARAMS}
+
+    @classmethod
+    def _redact_headers(cls, header: dict = None) -> dict:
+        header = {} if header is None else header
+        return {k: v for k, v in header.items() if k.lower() not in cls.SENSITIVE_HEADERS}
+
+    @classmethod
+    def _redact_body(cls, body: str) -> str:
+        # Session tokens handed out by the API (e.g. OpenTriviaDB api_token.php)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return body
+        if not isinstance(data, dict) or not any([k in data for k in cls.SENSITIVE_PARAMS]):
+            return body
+        return json.dumps({k: cls.REDACTED if k in cls.SENSITIVE_PARAMS else v for k, v in data.items()})
+
+    @classmethod
+    def make_key(cls, url: str, params: dict = None, method: str = "GET") -> str:
+        # Tokens differ between runs, they are not part of the key
+        return ResponseCache.make_key(url=url, params=cls._redact_params(params), method=method)
+
+    def load(self):
+        """
+        Load recorded entries. Entries with the same key are replayed in recording order.
+        """
+        with self._open("r") as f:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                entry = json.loads(line)
+                key = self.make_key(url=entry[self.KEY_URL], params=entry[self.KEY_PARAMS], method=entry[self.KEY_METHOD])
+                self.entries[key].append(entry)
+
+    def record(self, url: str, header: dict, params: dict, method: str, response: Response):
+        """
+        Append request and response to the cassette.
+        """
+        entry = {
+            self.KEY_METHOD: method,
+            self.KEY_URL: url,
+            self.KEY_PARAMS: self._redact_params(params),
+            self.KEY_HEADERS: self._redact_headers(header),
+            self.KEY_STATUS: response.status,
+            self.KEY_RESPONSE_HEADERS: response.headers,
+            self.KEY_LATENCY: round(response.latency, 4),
+        }
+        try:
+            entry[self.KEY_BODY] = self._redact_body(response.data.decode("utf8"))
+        except UnicodeDecodeError:
+            entry[self.KEY_BODY_B64] = base64.b64encode(response.data).decode("ascii")
+
+        with self.lock:
+            with self._open("a") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def replay(self, url: str, params: dict = None, method: str = "GET") -> Response:
+        """
+        Serve recorded response. When all recordings of a request were served, the last
+        one is served again.
+
+        Raises
+        ------
+        CassetteMissError
+            If the request was never recorded.
+        """
+        key = self.make_key(url=url, params=params, method=method)
+        with self.lock:
+            queue = self.entries.get(key, None)
+            if not queue:
+                raise CassetteMissError("Request not in cassette: {} {} {}".format(method, url, self._redact_params(params)))
+            entry = queue.popleft() if len(queue) > 1 else queue[0]
+
+        # Rebuild response
+        if self.KEY_BODY_B64 in entry:
+            data = base64.b64decode(entry[self.KEY_BODY_B64])
+        else:
+            data = entry.get(self.KEY_BODY, "").encode("utf8")
+        latency = entry.get(self.KEY_LATENCY, 0.)
+
+        # Simulate network time
+        if self.latency > 0:
+            time.sleep(latency * self.latency)
+
+        return Response(status=entry[self.KEY_STATUS], headers=entry.get(self.KEY_RESPONSE_HEADERS, {}), data=data, latency=latency)
+
+    def __repr__(self):
+        return "{}(path={}, mode={})".format(self.__class__.__name__, self.path, self.mode)
+
+
+# Cassette used by all handlers of the process (None = live network)
+_CASSETTE = None
+
+
+def get_cassette() -> Cassette:
+    return _CASSETTE
+
+
+def use_cassette(path: str = None, mode: str = Cassette.MODE_REPLAY, latency: float = 0.) -> Cassette:
+    """
+    Set the cassette used by all handlers. Use `path=None` to go back to live network.
+    """
+    global _CASSETTE
+    _CASSETTE = None if path is None else Cassette(path=path, mode=mode, latency=latency)
+    return _CASSETTE
@@ -0,0 +1,50 @@
+import time
+from pybquiz.api_handler.retry import APIError
+
+
+class DeadlineExceeded(APIError):
+    """
+    Raised when a query cannot complete before the deadline.
+    """
+    pass
+
+
+class Deadline:
+
+    def __init__(self, seconds: float) -> None:
+        """
+        Overall time budget shared by all queries of a quiz generation.
+
+        Parameters
+        ----------
+        seconds : float
+            Time budget in seconds from now.
+        """
+        self.seconds = seconds
+        self.end = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """
+        Remaining time in seconds (never negative).
+        """
+        return max(self.end - time.monotonic(), 0.)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, needed: float = 0., what: str = "request"):
+        """
+        Raise if `needed` seconds are not available anymore.
+
+        Raises
+        ------
+        DeadlineExceeded
+            If the remaining time is lower than `needed`.
+        """
+        remaining = self.remaining()
+        if remaining <= needed:
+            raise DeadlineExceeded("Deadline reached, {} needs {:.1f}s, {:.1f}s left".format(what, needed, remaining))
+
+    def __repr__(self):
+        return "{}(seconds={}, remaining={:.1f})".format(self.__class__.__name__, self.seconds, self.remaining())
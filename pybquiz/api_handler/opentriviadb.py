@@ -1,10 +1,17 @@
 from pybquiz.api_handler.base import BaseAPIHandler
-from typing import Union, List
+from pybquiz.api_handler.deadline import Deadline
+from pybquiz.api_handler.retry import APIError
+from pybquiz.api_handler.cassette import get_cassette
+from typing import Union, List, Tuple
+from collections import OrderedDict
 import numpy as np
-from tqdm import tqdm
 from pybquiz.elements import Questions
 import hashlib
 import html
+import json
+import os
+import threading
+import time
 
 
 class OpenTriviaDB(BaseAPIHandler):
@@ -12,7 +19,9 @@ class OpenTriviaDB(BaseAPIHandler):
     # URLS
     URL_CATEGORY = "https://opentdb.com/api_category.php"
     URL_CATEGORY_COUNT = "https://opentdb.com/api_count.php"
+    URL_CATEGORY_GLOBAL = "https://opentdb.com/api_count_global.php"
     URL_QUESTION = "https://opentdb.com/api.php"
+    URL_TOKEN = "https://opentdb.com/api_token.php"
     
     KEY_TRIVIA_CAT = "trivia_categories"
     KEY_NAME = "name"
@@ -22,6 +31,8 @@ class OpenTriviaDB(BaseAPIHandler):
     KEY_DIFFICULTY = "difficulty"  
     KEY_TOKEN = "token"  
     KEY_AMOUNT = "amount"      
+    KEY_COMMAND = "command"
+    KEY_UPDATED = "updated"
 
     # Keys for categories and counts
     KEY_Q_COUNT = "category_question_count"
@@ -29,6 +40,8 @@ class OpenTriviaDB(BaseAPIHandler):
     KEY_Q_EASY_COUNT = "total_easy_question_count"
     KEY_Q_MEDIUM_COUNT = "total_medium_question_count"
     KEY_Q_HARD_COUNT = "total_hard_question_count"            
+    KEY_G_CATEGORIES = "categories"
+    KEY_G_VERIFIED = "total_num_of_verified_questions"
            
     # Key for quesiton requests
     KEY_R_TYPE = "type"
@@ -38,7 +51,38 @@ class OpenTriviaDB(BaseAPIHandler):
     KEY_R_QUESTION = "question"
     KEY_R_CORRECT = "correct_answer"
     KEY_R_INCORRECT = "incorrect_answers"
+    KEY_R_CODE = "response_code"
+    
+    # Response codes
+    CODE_SUCCESS = 0
+    CODE_TOKEN_NOT_FOUND = 3
+    CODE_TOKEN_EMPTY = 4
+    CODE_RATE_LIMIT = 5
+    
+    # Session tokens are deleted by the API after 6 hours of inactivity
+    TOKEN_TTL = 6 * 3600
+    # Session token is shared by all handlers of the process
+    TOKEN_LOCK = threading.Lock()
                 
+    # Metadata endpoints cached for a day
+    CACHE_TTL = {
+        URL_CATEGORY: 24 * 3600,
+        URL_CATEGORY_COUNT: 24 * 3600,
+    }
+    
+    # Payload reports the difficulty of each question
+    MIXED_DIFFICULTY = True
+    
+    # Maximal number of questions per query (amount)
+    MAX_BATCH = 50
+    
+    # Rate limit, one request every 5 seconds per IP
+    RATE_REQUESTS = 1
+    RATE_WINDOW = 5.0
+    RATE_BURST = 1
+    # Documented hard limit, never go faster
+    RATE_MAX_FACTOR = 1.0
+    
     LUT_DIFFICULTY = {
         0: "easy",
         1: "medium",
@@ -47,10 +91,13 @@ class OpenTriviaDB(BaseAPIHandler):
     
     def __init__(
         self,
-        delay_api: int = 5,
+        delay_api: float = None,
         verbose: bool = True,
         clear_cache: bool = False,
+        rate_limit: dict = None,
         token: str = None,
+        offline: bool = False,
+        deadline: Deadline = None,
     ) -> None:
         """
         
@@ -58,11 +105,22 @@ class OpenTriviaDB(BaseAPIHandler):
 
         Parameters
         ----------
-        delay_api : int, optional
-            Default time between queries to API in seconds. By default 5 seconds.
+        delay_api : float, optional
+            Fixed time between queries to API in seconds. By default None, use the 
+            handler rate limit (RATE_REQUESTS per RATE_WINDOW seconds).
+        rate_limit : dict, optional
+            Custom rate limit with keys "requests", "window" and "burst".
+        offline : bool, optional
+            Never query the API, use cached statistics only. By default False.
+        deadline : Deadline, optional
+            Time budget of the queries, category metadata included. By default None.
         """
-        super().__init__(verbose=verbose, delay_api=delay_api, clear_cache=clear_cache, qtype="MCQ")
+        super().__init__(verbose=verbose, delay_api=delay_api, clear_cache=clear_cache, qtype="MCQ", rate_limit=rate_limit, offline=offline, deadline=deadline)
+        # Session token, persisted between runs
+        self.token_file = os.path.join(self.cache_dir, self.__class__.__name__.lower() + "_token.json")
         self.token = token
+        if self.token is None:
+            self.token = self.load_token()
                 
     def initialize_db(self) -> Union[List[str], List[int], np.ndarray, np.ndarray]:
         """
@@ -90,24 +148,121 @@ class OpenTriviaDB(BaseAPIHandler):
         categories_difficulty = np.zeros((N, 3))
         categories_type= np.zeros((N, 2))
         
-        for i in tqdm(np.arange(N), disable=(not self.verbose)):
-            # Get category specific stats            
-            result_cat = self.slow_request_urllib3(url=self.URL_CATEGORY_COUNT, params={self.KEY_CAT: categories_id[i]})
-            result_cat = result_cat.get(self.KEY_Q_COUNT, {})
-            # Extract counts
-            n_tot = result_cat.get(self.KEY_Q_TOTAL_COUNT, 0)
-            n_easy = result_cat.get(self.KEY_Q_EASY_COUNT, 0)
-            n_medium = result_cat.get(self.KEY_Q_MEDIUM_COUNT, 0)
-            n_hard = result_cat.get(self.KEY_Q_HARD_COUNT, 0)
-            # Sanity check
-            assert n_tot == n_easy + n_medium + n_hard
+        def update(i, counts):
             # Affect variable
-            categories_difficulty[i] = [n_easy, n_medium, n_hard]
-            categories_type[i] = [n_tot, 0]
+            categories_difficulty[i], categories_type[i] = counts
+        
+        # Get category specific stats, concurrently
+        self.crawl(fn=self.count_category, items=categories_id, callback=update)
 
         # Retreive categories
         return categories_name, categories_id, categories_type, categories_difficulty
 
+    def category_totals(self) -> OrderedDict:
+        """
+        Total number of verified questions per (category name, category id).
+        """
+        result = self.slow_request_urllib3(self.URL_CATEGORY)
+        result = result.get(self.KEY_TRIVIA_CAT, {})
+        result_global = self.slow_request_urllib3(self.URL_CATEGORY_GLOBAL)
+        result_global = result_global.get(self.KEY_G_CATEGORIES, {})
+        
+        totals = OrderedDict()
+        for item in result:
+            id = item.get(self.KEY_ID, -1)
+            totals[(item.get(self.KEY_NAME, ""), id)] = result_global.get(str(id), {}).get(self.KEY_G_VERIFIED, -1)
+        return totals
+    
+    def count_category(self, category_id: int) -> Tuple[List[int], List[int]]:
+        """
+        Number of questions of a category per difficulty and per type.
+        """
+        result_cat = self.slow_request_urllib3(url=self.URL_CATEGORY_COUNT, params={self.KEY_CAT: category_id})
+        result_cat = result_cat.get(self.KEY_Q_COUNT, {})
+        # Extract counts
+        n_tot = result_cat.get(self.KEY_Q_TOTAL_COUNT, 0)
+        n_easy = result_cat.get(self.KEY_Q_EASY_COUNT, 0)
+        n_medium = result_cat.get(self.KEY_Q_MEDIUM_COUNT, 0)
+        n_hard = result_cat.get(self.KEY_Q_HARD_COUNT, 0)
+        # Sanity check
+        assert n_tot == n_easy + n_medium + n_hard
+        return [n_easy, n_medium, n_hard], [n_tot, 0]
+
+    def is_throttled(self, result) -> bool:
+        # Code 5, too many requests from this IP
+        return isinstance(result, dict) and result.get(self.KEY_R_CODE, self.CODE_SUCCESS) == self.CODE_RATE_LIMIT
+    
+    def is_error(self, result) -> bool:
+        # Any response code other than success
+        if isinstance(result, dict) and result.get(self.KEY_R_CODE, self.CODE_SUCCESS) != self.CODE_SUCCESS:
+            return True
+        return super().is_error(result=result)
+
+    def load_token(self) -> str:
+        """
+        Load persisted session token, None if missing or expired.
+        """
+        with self.TOKEN_LOCK:
+            try:
+                with open(self.token_file) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return None
+        if time.time() - data.get(self.KEY_UPDATED, 0) > self.TOKEN_TTL:
+            return None
+        return data.get(self.KEY_TOKEN, None)
+    
+    def save_token(self):
+        """
+        Persist session token and its last use (written to a temporary file then renamed).
+        Tokens of replayed cassettes are redacted, they are never persisted.
+        """
+        cassette = get_cassette()
+        if cassette is not None and cassette.is_replay:
+            return
+        with self.TOKEN_LOCK:
+            path_tmp = "{}.{}.{}.tmp".format(self.token_file, os.getpid(), threading.get_ident())
+            with open(path_tmp, "w") as f:
+                json.dump({self.KEY_TOKEN: self.token, self.KEY_UPDATED: time.time()}, f)
+            os.replace(path_tmp, self.token_file)
+    
+    def request_token(self) -> str:
+        """
+        Retrieve a new session token. The API never returns twice the same question 
+        to a token until it is reset.
+
+        Returns
+        -------
+        token : str
+            Session token, None if the request failed.
+        """
+        result = self.slow_request_urllib3(url=self.URL_TOKEN, params={self.KEY_COMMAND: "request"})
+        if self.is_error(result=result):
+            if self.verbose:
+                print("Error in API: {}".format(result))
+            return None
+        self.token = result.get(self.KEY_TOKEN, None)
+        self.save_token()
+        return self.token
+    
+    def reset_token(self) -> str:
+        """
+        Reset the session token once all questions of a query were served. Unknown 
+        tokens are replaced by a new one.
+
+        Returns
+        -------
+        token : str
+            Session token, None if the request failed.
+        """
+        if self.token is None:
+            return self.request_token()
+        result = self.slow_request_urllib3(url=self.URL_TOKEN, params={self.KEY_COMMAND: "reset", self.KEY_TOKEN: self.token})
+        if self.is_error(result=result):
+            return self.request_token()
+        self.save_token()
+        return self.token
+    
     def get_questions(self, n: int, category_id: int = None, difficulty: int = None, type: str = None) -> List[Questions]:
 
         # Create query dict (if None then consider any)
@@ -119,37 +274,61 @@ class OpenTriviaDB(BaseAPIHandler):
         if difficulty is not None:
             params[self.KEY_DIFFICULTY] = self.LUT_DIFFICULTY[difficulty]
         # Check session token
+        if self.token is None:
+            try:
+                self.request_token()
+            except APIError as e:
+                # Questions may overlap without token
+                print("Warning: {}".format(e))
         if self.token is not None:
             params[self.KEY_TOKEN] = self.token
             
         # Send query
         result = self.slow_request_urllib3(url=self.URL_QUESTION, params=params)
         
+        # Session token unknown or exhausted for this query, retry once with a fresh one
+        code = result.get(self.KEY_R_CODE, None) if isinstance(result, dict) else None
+        if code in [self.CODE_TOKEN_NOT_FOUND, self.CODE_TOKEN_EMPTY]:
+            if self.verbose:
+                print("Session token {}, reset it".format("exhausted" if code == self.CODE_TOKEN_EMPTY else "not found"))
+            token = self.request_token() if code == self.CODE_TOKEN_NOT_FOUND else self.reset_token()
+            params.pop(self.KEY_TOKEN, None)
+            if token is not None:
+                params[self.KEY_TOKEN] = token
+            result = self.slow_request_urllib3(url=self.URL_QUESTION, params=params)
+        elif self.token is not None and not self.is_error(result=result):
+            # Keep token alive
+            self.save_token()
+        
         # Check if answer is correct
-        if self.KEY_R_ERROR in result:
+        if self.is_error(result=result):
             if self.verbose:
                 print("Error in API: {}".format(result))
             return []
                 
         # Parse results as questions
         questions = []
-        cat_id_lut = np.argmax(self.categories_id == category_id)
         for raw_question in result.get(self.KEY_RESULTS, []):
             # Parse question
             q_text = html.unescape(raw_question.get(self.KEY_R_QUESTION, self.KEY_R_ERROR))
             c_answers = html.unescape(raw_question.get(self.KEY_R_CORRECT, self.KEY_R_ERROR))
             i_answers = [html.unescape(a) for a in raw_question.get(self.KEY_R_INCORRECT, [])]
+            # Category and difficulty as reported by the API (query may not filter them)
+            q_cat = html.unescape(raw_question.get(self.KEY_R_CAT, ""))
+            q_cat_id = category_id
+            if q_cat_id is None:
+                q_cat_id = self.category_id_by_name(name=q_cat, strict=False)
             q = Questions(
                 question=q_text,
                 correct_answers=[c_answers],
                 incorrect_answers=i_answers,
                 library=self.__class__.__name__.lower(), 
-                category=self.categories[cat_id_lut],
-                category_id=category_id,
+                category=q_cat,
+                category_id=q_cat_id,
                 uuid=hashlib.md5(q_text.encode('utf8')).hexdigest(),
-                difficulty=difficulty,
+                difficulty=self.parse_difficulty(raw_question.get(self.KEY_R_DIFF, None), default=difficulty),
                 type="text",
             )
             questions.append(q)
             
-        return questions
\ No newline at end of file
+        return self.save_questions(questions)
\ No newline at end of file
@@ -1,4 +1,5 @@
 from pybquiz.api_handler.base import BaseAPIHandler
+from pybquiz.api_handler.deadline import Deadline
 from typing import Union, List
 import numpy as np
 from tqdm import tqdm
@@ -23,6 +24,22 @@ class QuizAPI(BaseAPIHandler):
     KEY_IS_CORRECT = "correct_answers"
     KEY_ANSWER = "answers"
     
+    # Metadata endpoints cached for a day
+    CACHE_TTL = {
+        URL_CATEGORIES: 24 * 3600,
+    }
+    
+    # Payload reports the difficulty of each question
+    MIXED_DIFFICULTY = True
+    
+    # Maximal number of questions per query (limit)
+    MAX_BATCH = 20
+    
+    # Rate limit
+    RATE_REQUESTS = 1
+    RATE_WINDOW = 1.0
+    RATE_BURST = 5
+    
     LUT_DIFFICULTY = {
         0: "easy",
         1: "medium",
@@ -32,9 +49,12 @@ class QuizAPI(BaseAPIHandler):
     def __init__(
         self,
         token: str,
-        delay_api: int = 5,
+        delay_api: float = None,
         verbose: bool = True,
         clear_cache: bool = False,
+        rate_limit: dict = None,
+        offline: bool = False,
+        deadline: Deadline = None,
     ) -> None:
         """
         
@@ -42,15 +62,22 @@ class QuizAPI(BaseAPIHandler):
 
         Parameters
         ----------
-        delay_api : int, optional
-            Default time between queries to API in seconds. By default 5 seconds.
+        delay_api : float, optional
+            Fixed time between queries to API in seconds. By default None, use the 
+            handler rate limit (RATE_REQUESTS per RATE_WINDOW seconds).
+        rate_limit : dict, optional
+            Custom rate limit with keys "requests", "window" and "burst".
+        offline : bool, optional
+            Never query the API, use cached statistics only. By default False.
+        deadline : Deadline, optional
+            Time budget of the queries, category metadata included. By default None.
         """
         # Key is needed for this api
         if token is None:
             raise NotImplementedError()
         
         self.token = token        
-        super().__init__(verbose=verbose, delay_api=delay_api, clear_cache=clear_cache, qtype="MCQ")
+        super().__init__(verbose=verbose, delay_api=delay_api, clear_cache=clear_cache, qtype="MCQ", rate_limit=rate_limit, offline=offline, deadline=deadline)
                 
     def initialize_db(self) -> Union[List[str], List[int], np.ndarray, np.ndarray]:
         """
@@ -91,17 +118,16 @@ class QuizAPI(BaseAPIHandler):
         params = {self.KEY_AMOUNT: n}
         # Check category
         if category_id is not None:
-            cat_id_lut = np.argmax(self.categories_id == category_id)
-            params[self.KEY_CAT] = self.categories[cat_id_lut]
+            params[self.KEY_CAT] = self.category_name(category_id=category_id)
         # Check category
         if difficulty is not None:
             params[self.KEY_DIFFICULTY] = self.LUT_DIFFICULTY[difficulty]
             
         # Get question
-        result = self.slow_request_httpclient(url=self.URL_QUESTIONS, header=header, params=params)
+        result = self.slow_request_urllib3(url=self.URL_QUESTIONS, header=header, params=params)
         
         # Check if answer is correct
-        if self.KEY_R_ERROR in result:
+        if self.is_error(result=result):
             if self.verbose:
                 print("Error in API: {}".format(result))
             return []
@@ -127,12 +153,12 @@ class QuizAPI(BaseAPIHandler):
                 incorrect_answers=q_incorr,
                 library=self.__class__.__name__.lower(), 
                 category=cat,
-                category_id=int(self.categories_id[np.argmax(self.categories == cat)]),
+                category_id=self.category_id_by_name(name=cat, strict=False),
                 uuid=raw_question.get(self.KEY_ID, self.KEY_R_ERROR),
-                difficulty=difficulty,
+                difficulty=self.parse_difficulty(raw_question.get(self.KEY_DIFFICULTY, None), default=difficulty),
                 type="text",
             )
             # Append question
             questions.append(q)           
             
-        return questions
\ No newline at end of file
+        return self.save_questions(questions)
\ No newline at end of file
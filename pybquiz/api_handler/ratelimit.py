@@ -0,0 +1,365 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TokenBucket:
+
+    def __init__(self, requests: float = 1, window: float = 5.0, burst: int = 1) -> None:
+        """
+        Token bucket rate limiter. The bucket holds up to `burst` tokens and is refilled
+        at `requests / window` tokens per second. Each request consumes one token, a
+        caller only waits when the bucket is empty.
+
+        Parameters
+        ----------
+        requests : float, optional
+            Number of requests allowed per window, by default 1.
+        window : float, optional
+            Length of the window in seconds, by default 5 seconds.
+        burst : int, optional
+            Maximal number of requests that can be sent back to back, by default 1.
+
+        Raises
+        ------
+        ValueError
+            If `requests` or `window` is not positive.
+        """
+        # Check limits (e.g. from user rate_limits)
+        if requests <= 0:
+            raise ValueError("Rate limit requests must be positive, got {}".format(requests))
+        if window <= 0:
+            raise ValueError("Rate limit window must be positive, got {}".format(window))
+
+        # Store variables
+        self.requests = requests
+        self.window = window
+        self.burst = max(int(burst), 1)
+        # Rate as configured, `set_rate` changes the window only
+        self.configured_rate = requests / window
+        # Bucket starts full
+        self.tokens = float(self.burst)
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        """
+        Refill rate of the bucket in tokens per seconds.
+        """
+        return self.requests / self.window
+
+    def _refill(self, now: float):
+        # Add tokens accumulated since last update (capped to burst)
+        self.tokens = min(self.burst, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+
+    def reserve(self) -> float:
+        """
+        Consume one token and return the time to wait before the request can be sent.
+        The balance can go negative so that concurrent callers are served in order.
+
+        Returns
+        -------
+        wait : float
+            Time to wait in seconds (0 if a token is available).
+        """
+        with self.lock:
+            self._refill(now=time.monotonic())
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.
+            return -self.tokens / self.rate
+
+    def expected_wait(self) -> float:
+        """
+        Time in seconds a new request would wait, without consuming a token.
+        """
+        with self.lock:
+            self._refill(now=time.monotonic())
+            return 0. if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def try_acquire(self) -> bool:
+        """
+        Consume one token if available, never wait.
+
+        Returns
+        -------
+        acquired : bool
+            True if a token was consumed.
+        """
+        with self.lock:
+            self._refill(now=time.monotonic())
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def acquire(self, timeout: float = None) -> float:
+        """
+        Block until a token is available.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximal time to wait in seconds, by default None (no limit).
+
+        Returns
+        -------
+        wait : float
+            Time waited in seconds, None if no token is available within `timeout` 
+            (nothing consumed).
+        """
+        wait = self.reserve()
+        if timeout is not None and wait > timeout:
+            self.refund()
+            return None
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def refund(self):
+        """
+        Give back a token consumed by `reserve`.
+        """
+        with self.lock:
+            self.tokens += 1
+
+    def drain(self):
+        """
+        Drop remaining burst, next request waits for a full gap.
+        """
+        with self.lock:
+            self.tokens = min(self.tokens, 0.)
+
+    def set_rate(self, rate: float):
+        """
+        Change refill rate (requests per seconds), tokens accumulated so far are kept.
+        """
+        with self.lock:
+            self._refill(now=time.monotonic())
+            self.window = self.requests / rate
+
+    def __repr__(self):
+        return "{}(requests={}, window={}, burst={})".format(
+            self.__class__.__name__, self.requests, self.window, self.burst
+        )
+
+
+class SharedTokenBucket(TokenBucket):
+
+    def __init__(self, path: str, name: str, requests: float = 1, window: float = 5.0, burst: int = 1) -> None:
+        """
+        Token bucket whose state lives in a SQLite ledger, so that all processes of the
+        machine (and all handlers of the same API) draw from the same budget. Each update
+        runs in an exclusive transaction. The rate is shared as well, a rate learned by
+        one process applies to all.
+
+        Parameters
+        ----------
+        path : str
+            Path to the SQLite ledger.
+        name : str
+            Name of the budget (one per API).
+        requests : float, optional
+            Number of requests allowed per window, by default 1.
+        window : float, optional
+            Length of the window in seconds, by default 5 seconds.
+        burst : int, optional
+            Maximal number of requests that can be sent back to back, by default 1.
+        """
+        super().__init__(requests=requests, window=window, burst=burst)
+        self.path = path
+        self.name = name
+
+        # Create budget if first user, keep shared tokens otherwise
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, timestamp REAL, rate REAL, burst INTEGER)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, ?, ?)", (self.name, float(self.burst), time.time(), self.rate, self.burst)
+            )
+            # Rate and burst follow the latest configuration (learned rates are restored by AIMDController)
+            conn.execute("UPDATE buckets SET rate = ?, burst = ? WHERE name = ?", (self.rate, self.burst, self.name))
+        self._update(lambda tokens, rate: (tokens, rate, None))
+
+    @contextmanager
+    def _transaction(self):
+        conn = sqlite3.connect(self.path, timeout=60., isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _update(self, update):
+        """
+        Refill shared bucket and apply `update(tokens, rate) -> (tokens, rate, result)`.
+        """
+        with self.lock, self._transaction() as conn:
+            tokens, timestamp, rate = conn.execute(
+                "SELECT tokens, timestamp, rate FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            # Refill (wall clock, shared between processes)
+            now = time.time()
+            tokens = min(self.burst, tokens + max(now - timestamp, 0.) * rate)
+            tokens, rate, result = update(tokens, rate)
+            conn.execute(
+                "UPDATE buckets SET tokens = ?, timestamp = ?, rate = ? WHERE name = ?", (tokens, now, rate, self.name)
+            )
+            # Local copy for inspection
+            self.tokens, self.timestamp, self.window = tokens, now, self.requests / rate
+        return result
+
+    def reserve(self) -> float:
+        def update(tokens, rate):
+            tokens -= 1
+            return tokens, rate, 0. if tokens >= 0 else -tokens / rate
+        return self._update(update)
+
+    def expected_wait(self) -> float:
+        return self._update(lambda tokens, rate: (tokens, rate, 0. if tokens >= 1 else (1 - tokens) / rate))
+
+    def try_acquire(self) -> bool:
+        def update(tokens, rate):
+            if tokens < 1:
+                return tokens, rate, False
+            return tokens - 1, rate, True
+        return self._update(update)
+
+    def refund(self):
+        self._update(lambda tokens, rate: (tokens + 1, rate, None))
+
+    def drain(self):
+        self._update(lambda tokens, rate: (min(tokens, 0.), rate, None))
+
+    def set_rate(self, rate: float):
+        self._update(lambda tokens, _: (tokens, rate, None))
+
+    def __repr__(self):
+        return "{}(name={}, requests={}, window={:.3f}, burst={})".format(
+            self.__class__.__name__, self.name, self.requests, self.window, self.burst
+        )
+
+
+class AIMDController:
+
+    KEY_RATE = "rate"
+    KEY_UPDATED = "updated"
+
+    # Minimal time between two saves of a growing rate in seconds (back off is saved at once)
+    SAVE_INTERVAL = 10.
+
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        min_rate: float,
+        max_rate: float,
+        increase: float,
+        decrease: float = 0.5,
+        path: str = None,
+    ) -> None:
+        """
+        Additive increase / multiplicative decrease controller of a token bucket rate.
+        The rate grows by `increase` after each successful request and is multiplied by
+        `decrease` when the API throttles us. The learned rate is saved to `path` so the
+        next run starts from it.
+
+        Parameters
+        ----------
+        bucket : TokenBucket
+            Bucket to control.
+        min_rate : float
+            Lowest rate allowed in requests per seconds.
+        max_rate : float
+            Highest rate allowed in requests per seconds.
+        increase : float
+            Rate added (requests per seconds) after a successful request.
+        decrease : float, optional
+            Factor applied to the rate when throttled, by default 0.5.
+        path : str, optional
+            JSON file to persist the learned rate, by default None (not persisted).
+        """
+        self.bucket = bucket
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.path = path
+        self.lock = threading.Lock()
+        self.saved_rate = None
+        self.saved_at = 0.
+
+        # Start from previously learned rate
+        rate = self.load()
+        if rate is not None:
+            self.set_rate(rate)
+            self.saved_rate = rate
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def set_rate(self, rate: float):
+        """
+        Set rate of the bucket (clipped to min and max rate).
+        """
+        self.bucket.set_rate(min(max(rate, self.min_rate), self.max_rate))
+
+    def success(self):
+        """
+        Request succeeded, shrink the gap between requests.
+        """
+        with self.lock:
+            self.set_rate(self.rate + self.increase)
+            if time.monotonic() - self.saved_at >= self.SAVE_INTERVAL:
+                self.save()
+
+    def throttle(self):
+        """
+        Request was throttled, back off sharply.
+        """
+        with self.lock:
+            self.set_rate(self.rate * self.decrease)
+            self.bucket.drain()
+            self.save()
+
+    def load(self) -> float:
+        """
+        Load learned rate, None if not available.
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                return float(json.load(f)[self.KEY_RATE])
+        except (ValueError, KeyError, TypeError, OSError):
+            return None
+
+    def save(self):
+        """
+        Save learned rate if changed (written to a temporary file then renamed).
+        """
+        # Nothing to save if the rate did not change
+        rate = self.rate
+        if self.path is None or rate == self.saved_rate:
+            return
+        path_tmp = "{}.{}.{}.tmp".format(self.path, os.getpid(), threading.get_ident())
+        with open(path_tmp, "w") as f:
+            json.dump({self.KEY_RATE: rate, self.KEY_UPDATED: time.time()}, f)
+        os.replace(path_tmp, self.path)
+        self.saved_rate, self.saved_at = rate, time.monotonic()
+
+    def __repr__(self):
+        return "{}(rate={:.3f}, min_rate={:.3f}, max_rate={:.3f})".format(
+            self.__class__.__name__, self.rate, self.min_rate, self.max_rate
+        )
@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+
+
+class APIError(Exception):
+    """
+    Raised when an API query fails for good.
+    """
+    pass
+
+
+class RetryableError(APIError):
+    """
+    Raised for transient failures (throttling, server errors, invalid payloads).
+    """
+
+    def __init__(self, message: str, retry_after: float = None, failure: bool = True) -> None:
+        """
+        Parameters
+        ----------
+        message : str
+            Error description.
+        retry_after : float, optional
+            Delay requested by the server in seconds, by default None.
+        failure : bool, optional
+            If True, the error counts as a provider failure for the circuit breaker.
+            Throttled requests are not failures (provider is up), by default True.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.failure = failure
+
+
+class CircuitOpenError(APIError):
+    """
+    Raised when the circuit breaker of an API is open (provider considered down).
+    """
+    pass
+
+
+class BudgetExceeded(APIError):
+    """
+    Raised when a request would exceed the request budget of a handler.
+    """
+    pass
+
+
+class RetryPolicy:
+
+    # HTTP status considered as transient
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+        max_backoff: float = 60.,
+        jitter: float = 0.5,
+    ) -> None:
+        """
+        Exponential backoff retry policy with jitter. The delay before attempt `i + 1` is
+        drawn in [(1 - jitter) * d, d] with d = min(max_backoff, backoff * 2**i).
+
+        Parameters
+        ----------
+        max_retries : int, optional
+            Number of retries after the first attempt, by default 3.
+        backoff : float, optional
+            Base delay in seconds, by default 1 second.
+        max_backoff : float, optional
+            Upper bound of the delay in seconds, by default 60 seconds.
+        jitter : float, optional
+            Fraction of the delay drawn at random, by default 0.5.
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def should_retry(self, status: int) -> bool:
+        return status in self.RETRY_STATUS
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        """
+        Delay in seconds before the next attempt.
+
+        Parameters
+        ----------
+        attempt : int
+            Index of the failed attempt (starts at 0).
+        retry_after : float, optional
+            Delay requested by the server, used as lower bound. By default None.
+
+        Returns
+        -------
+        delay : float
+            Time to wait in seconds.
+        """
+        d = min(self.max_backoff, self.backoff * 2 ** attempt)
+        d = d * (1 - self.jitter) + random.uniform(0, d * self.jitter)
+        if retry_after is not None:
+            d = max(d, min(retry_after, self.max_backoff))
+        return d
+
+
+class CircuitBreaker:
+
+    STATE_CLOSED = "closed"
+    STATE_OPEN = "open"
+    STATE_HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 120.) -> None:
+        """
+        Circuit breaker. After `failure_threshold` consecutive failures the circuit opens
+        and requests fail fast. After `reset_timeout` seconds one trial request is allowed
+        (half-open), its success closes the circuit again.
+
+        Parameters
+        ----------
+        failure_threshold : int, optional
+            Consecutive failures before opening the circuit, by default 5.
+        reset_timeout : float, optional
+            Time in seconds before a trial request is allowed, by default 120 seconds.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.STATE_CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.STATE_HALF_OPEN
+        return self.STATE_OPEN
+
+    def allow(self) -> bool:
+        """
+        Check if a request can be sent.
+        """
+        with self.lock:
+            state = self.state
+            # Let a single trial request through, others wait for its outcome
+            if state == self.STATE_HALF_OPEN:
+                self.opened_at = time.monotonic()
+            return state != self.STATE_OPEN
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            # Open circuit (or re-open after failed trial)
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+    def __repr__(self):
+        return "{}(state={}, failures={})".format(self.__class__.__name__, self.state, self.failures)
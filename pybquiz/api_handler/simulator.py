@@ -0,0 +1,425 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from pybquiz.api_handler.ratelimit import TokenBucket
+
+
+class TriviaBank:
+
+    DIFFICULTIES = ["easy", "medium", "hard"]
+
+    # Categories served by each simulated API (same ids / names as the real APIs)
+    OPENTRIVIADB_CATEGORIES = {
+        9: "General Knowledge", 10: "Entertainment: Books", 11: "Entertainment: Film",
+        12: "Entertainment: Music", 13: "Entertainment: Musicals & Theatres",
+        14: "Entertainment: Television", 15: "Entertainment: Video Games",
+        16: "Entertainment: Board Games", 17: "Science & Nature", 18: "Science: Computers",
+        19: "Science: Mathematics", 20: "Mythology", 21: "Sports", 22: "Geography", 23: "History",
+        24: "Politics", 25: "Art", 26: "Celebrities", 27: "Animals", 28: "Vehicles",
+        29: "Entertainment: Comics", 30: "Science: Gadgets", 31: "Entertainment: Japanese Anime & Manga",
+        32: "Entertainment: Cartoon & Animations",
+    }
+    THETRIVIAAPI_CATEGORIES = [
+        "arts_and_literature", "film_and_tv", "food_and_drink", "general_knowledge", "geography",
+        "history", "music", "science", "society_and_culture", "sport_and_leisure",
+    ]
+    QUIZAPI_CATEGORIES = {
+        1: "Linux", 2: "bash", 3: "uncategorized", 4: "Docker", 5: "SQL", 6: "CMS", 7: "Code", 8: "DevOps",
+    }
+    APININJAS_CATEGORIES = [
+        "artliterature", "language", "sciencenature", "general", "fooddrink", "peopleplaces", "geography",
+        "historyholidays", "entertainment", "toysgames", "music", "mathematics", "religionmythology",
+        "sportsleisure",
+    ]
+
+    def __init__(self, n: int = 50, seed: int = 0) -> None:
+        """
+        Synthetic question bank shared by the simulated APIs.
+
+        Parameters
+        ----------
+        n : int, optional
+            Number of questions per category and difficulty, by default 50.
+        seed : int, optional
+            Random seed, by default 0.
+        """
+        self.n = n
+        self.random = random.Random(seed)
+        self.questions = {}
+        self.lock = threading.Lock()
+
+    def get(self, library: str, category: str, difficulty: str) -> list:
+        """
+        Get (and lazily create) questions of a category and difficulty level.
+        """
+        key = (library, category, difficulty)
+        with self.lock:
+            return self._get(key=key)
+
+    def _get(self, key: tuple) -> list:
+        library, category, difficulty = key
+        if key not in self.questions:
+            self.questions[key] = [
+                {
+                    "id": "{}-{}".format(library, uuid.UUID(int=self.random.getrandbits(128)).hex),
+                    "question": "[{}] {} question #{} about {}?".format(library, difficulty.capitalize(), i, category),
+                    "correct": "Correct answer #{}".format(i),
+                    "incorrect": ["Wrong answer #{}.{}".format(i, j) for j in range(3)],
+                    "difficulty": difficulty,
+                    "category": category,
+                } for i in range(self.n)
+            ]
+        return self.questions[key]
+
+    def sample(self, library: str, categories: list, difficulties: list, n: int, exclude: set = None) -> list:
+        """
+        Sample `n` questions (at most) from the given categories and difficulties.
+        """
+        pool = []
+        for c in categories:
+            for d in difficulties:
+                pool.extend(self.get(library, c, d))
+        if exclude is not None:
+            pool = [q for q in pool if q["id"] not in exclude]
+        with self.lock:
+            return self.random.sample(pool, min(n, len(pool)))
+
+
+class TriviaSimulator:
+
+    # Path prefix per simulated API (lower class name of the handler)
+    OPENTRIVIADB = "opentriviadb"
+    THETRIVIAAPI = "thetriviaapi"
+    QUIZAPI = "quizapi"
+    APININJAS = "apininjas"
+
+    # Batch limits of the real APIs
+    MAX_BATCH = {OPENTRIVIADB: 50, THETRIVIAAPI: 50, QUIZAPI: 20, APININJAS: 1}
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.,
+        jitter: float = 0.,
+        rate_limits: dict = None,
+        error_rate: float = 0.,
+        error_status: int = 500,
+        n_questions: int = 50,
+        seed: int = 0,
+    ) -> None:
+        """
+        Local stand-in for OpenTriviaDB, TheTriviaAPI, QuizAPI and APINinjas. Endpoints
+        are served under /<api>/<original path> (e.g. /opentriviadb/api.php) with payloads
+        in the format of each API. Point handlers to it with `BaseAPIHandler.redirect`.
+
+        Parameters
+        ----------
+        host : str, optional
+            Host to bind, by default "127.0.0.1".
+        port : int, optional
+            Port to bind, by default 0 (any free port).
+        latency : float, optional
+            Time in seconds added to each response, by default 0.
+        jitter : float, optional
+            Random time in seconds (uniform) added to the latency, by default 0.
+        rate_limits : dict, optional
+            Server side rate limit per API (e.g. {"opentriviadb": {"requests": 1, "window": 5,
+            "burst": 1}}). Throttled queries get HTTP 429 (response_code 5 for OpenTriviaDB).
+            By default None, unlimited.
+        error_rate : float, optional
+            Probability of a server error per query, by default 0.
+        error_status : int, optional
+            HTTP status of server errors, by default 500.
+        n_questions : int, optional
+            Number of questions per category and difficulty, by default 50.
+        seed : int, optional
+            Random seed, by default 0.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.bank = TriviaBank(n=n_questions, seed=seed)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # Server side limiters
+        rate_limits = {} if rate_limits is None else rate_limits
+        self.limiters = {k: TokenBucket(**v) for k, v in rate_limits.items()}
+        # OpenTriviaDB session tokens (token -> served question ids)
+        self.tokens = {}
+        # Stats per API
+        self.stats = {}
+
+        # Create server
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _count(self, api: str, key: str):
+        with self.lock:
+            stats = self.stats.setdefault(api, {"requests": 0, "throttled": 0, "errors": 0})
+            stats[key] += 1
+
+    def _make_handler(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                status, payload = simulator.handle(path=self.path, headers=self.headers)
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Keep terminal quiet
+                pass
+
+        return Handler
+
+    def handle(self, path: str, headers: dict):
+        """
+        Route a query to the simulated API.
+
+        Returns
+        -------
+        status : int
+            HTTP status.
+        payload : dict, list or bytes
+            Response payload.
+        """
+        url = urlparse(path)
+        segments = url.path.strip("/").split("/", 1)
+        api, route = segments[0], "/" + (segments[1] if len(segments) > 1 else "")
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        routes = {
+            self.OPENTRIVIADB: self._opentriviadb,
+            self.THETRIVIAAPI: self._thetriviaapi,
+            self.QUIZAPI: self._quizapi,
+            self.APININJAS: self._apininjas,
+        }
+        if api not in routes:
+            return 404, {"error": "Unknown API"}
+        self._count(api, "requests")
+
+        # Simulate network time
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        # Simulate server failures
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            self._count(api, "errors")
+            return self.error_status, b"Internal Server Error"
+
+        # Simulate rate limits
+        limiter = self.limiters.get(api, None)
+        if limiter is not None and not limiter.try_acquire():
+            self._count(api, "throttled")
+            if api == self.OPENTRIVIADB:
+                return 200, {"response_code": 5, "results": []}
+            return 429, {"error": "Too many requests"}
+
+        return routes[api](route=route, params=params, headers=headers)
+
+    def _opentriviadb(self, route: str, params: dict, headers: dict):
+        cats = self.bank.OPENTRIVIADB_CATEGORIES
+        lib = self.OPENTRIVIADB
+
+        if route == "/api_category.php":
+            return 200, {"trivia_categories": [{"id": k, "name": v} for k, v in cats.items()]}
+
+        if route == "/api_count.php":
+            cat = cats.get(int(params.get("category", -1)), None)
+            if cat is None:
+                return 200, {"response_code": 2}
+            counts = [len(self.bank.get(lib, cat, d)) for d in self.bank.DIFFICULTIES]
+            return 200, {
+                "category_id": int(params["category"]),
+                "category_question_count": {
+                    "total_question_count": sum(counts),
+                    "total_easy_question_count": counts[0],
+                    "total_medium_question_count": counts[1],
+                    "total_hard_question_count": counts[2],
+                }
+            }
+
+        if route == "/api_count_global.php":
+            totals = {k: sum([len(self.bank.get(lib, v, d)) for d in self.bank.DIFFICULTIES]) for k, v in cats.items()}
+            return 200, {
+                "overall": {"total_num_of_questions": sum(totals.values()), "total_num_of_verified_questions": sum(totals.values())},
+                "categories": {str(k): {"total_num_of_questions": v, "total_num_of_verified_questions": v} for k, v in totals.items()},
+            }
+
+        if route == "/api_token.php":
+            command = params.get("command", "")
+            if command == "request":
+                token = uuid.UUID(int=self.random.getrandbits(128)).hex
+                with self.lock:
+                    self.tokens[token] = set()
+                return 200, {"response_code": 0, "response_message": "Token Generated Successfully!", "token": token}
+            if command == "reset":
+                token = params.get("token", "")
+                with self.lock:
+                    if token not in self.tokens:
+                        return 200, {"response_code": 3, "token": token}
+                    self.tokens[token] = set()
+                return 200, {"response_code": 0, "token": token}
+            return 200, {"response_code": 2}
+
+        if route == "/api.php":
+            amount = min(int(params.get("amount", 10)), self.MAX_BATCH[lib])
+            categories = list(cats.values())
+            if "category" in params:
+                categories = [cats[int(params["category"])]] if int(params["category"]) in cats else []
+            difficulties = [params["difficulty"]] if "difficulty" in params else self.bank.DIFFICULTIES
+            # Session token
+            token = params.get("token", None)
+            exclude = None
+            if token is not None:
+                if token not in self.tokens:
+                    return 200, {"response_code": 3, "results": []}
+                exclude = self.tokens[token]
+            questions = self.bank.sample(lib, categories, difficulties, n=amount, exclude=exclude)
+            if len(questions) < amount:
+                # Not enough questions (4 if due to session token)
+                return 200, {"response_code": 1 if token is None else 4, "results": []}
+            if token is not None:
+                with self.lock:
+                    self.tokens[token].update([q["id"] for q in questions])
+            return 200, {
+                "response_code": 0,
+                "results": [{
+                    "type": "multiple",
+                    "difficulty": q["difficulty"],
+                    "category": q["category"],
+                    "question": q["question"],
+                    "correct_answer": q["correct"],
+                    "incorrect_answers": q["incorrect"],
+                } for q in questions]
+            }
+
+        return 404, {"error": "Not found"}
+
+    def _thetriviaapi(self, route: str, params: dict, headers: dict):
+        cats = self.bank.THETRIVIAAPI_CATEGORIES
+        lib = self.THETRIVIAAPI
+
+        if route == "/v2/metadata":
+            categories = params["categories"].split(",") if "categories" in params else cats
+            by_cat = {c: sum([len(self.bank.get(lib, c, d)) for d in self.bank.DIFFICULTIES]) for c in categories if c in cats}
+            by_diff = {d: sum([len(self.bank.get(lib, c, d)) for c in by_cat]) for d in self.bank.DIFFICULTIES}
+            return 200, {
+                "byCategory": by_cat,
+                "byDifficulty": by_diff,
+                "byType": {"text_choice": sum(by_cat.values()), "image_choice": 0},
+                "lastCreated": None,
+                "lastReviewed": None,
+            }
+
+        if route == "/v2/questions":
+            limit = min(int(params.get("limit", 10)), self.MAX_BATCH[lib])
+            categories = params["categories"].split(",") if "categories" in params else cats
+            difficulties = params["difficulties"].split(",") if "difficulties" in params else self.bank.DIFFICULTIES
+            questions = self.bank.sample(lib, [c for c in categories if c in cats], difficulties, n=limit)
+            return 200, [{
+                "id": q["id"],
+                "category": q["category"],
+                "correctAnswer": q["correct"],
+                "incorrectAnswers": q["incorrect"],
+                "question": {"text": q["question"]},
+                "tags": [],
+                "type": "text_choice",
+                "difficulty": q["difficulty"],
+                "regions": [],
+                "isNiche": False,
+            } for q in questions]
+
+        return 404, {"error": "Not found"}
+
+    def _quizapi(self, route: str, params: dict, headers: dict):
+        cats = self.bank.QUIZAPI_CATEGORIES
+        lib = self.QUIZAPI
+
+        if not headers.get("X-Api-Key", None):
+            return 401, {"error": "Unauthenticated"}
+
+        if route == "/api/v1/categories":
+            return 200, [{"id": k, "name": v} for k, v in cats.items()]
+
+        if route == "/api/v1/questions":
+            limit = min(int(params.get("limit", 10)), self.MAX_BATCH[lib])
+            categories = list(cats.values())
+            if "category" in params:
+                categories = [c for c in categories if c.lower() == params["category"].lower()]
+            difficulties = [params["difficulty"].lower()] if "difficulty" in params else self.bank.DIFFICULTIES
+            questions = self.bank.sample(lib, categories, difficulties, n=limit)
+            if len(questions) == 0:
+                return 404, {"error": "No questions found"}
+            keys = ["answer_a", "answer_b", "answer_c", "answer_d", "answer_e", "answer_f"]
+            data = []
+            for q in questions:
+                answers = [q["correct"]] + q["incorrect"] + [None, None]
+                data.append({
+                    "id": int(q["id"].rsplit("-", 1)[-1][:8], 16),
+                    "question": q["question"],
+                    "description": None,
+                    "answers": dict(zip(keys, answers)),
+                    "multiple_correct_answers": "false",
+                    "correct_answers": {"{}_correct".format(k): "true" if i == 0 else "false" for i, k in enumerate(keys)},
+                    "correct_answer": keys[0],
+                    "explanation": None,
+                    "tip": None,
+                    "tags": [],
+                    "category": q["category"],
+                    "difficulty": q["difficulty"].capitalize(),
+                })
+            return 200, data
+
+        return 404, {"error": "Not found"}
+
+    def _apininjas(self, route: str, params: dict, headers: dict):
+        cats = self.bank.APININJAS_CATEGORIES
+        lib = self.APININJAS
+
+        if not headers.get("X-Api-Key", None):
+            return 400, {"error": "Missing API Key."}
+
+        if route == "/v1/trivia":
+            categories = [params["category"]] if "category" in params else cats
+            questions = self.bank.sample(lib, [c for c in categories if c in cats], self.bank.DIFFICULTIES, n=1)
+            return 200, [{"category": q["category"], "question": q["question"], "answer": q["correct"]} for q in questions]
+
+        return 404, {"error": "Not found"}
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+
+
+# Environment variable overriding the cache location
+ENV_CACHE_DIR = "PYBQUIZ_CACHE_DIR"
+# Cache location set by `set_cache_home` (None = environment / XDG default)
+_CACHE_HOME = None
+
+
+def set_cache_home(path: str = None):
+    """
+    Set the folder of all pybquiz caches, None to restore the default location.
+    """
+    global _CACHE_HOME
+    _CACHE_HOME = path
+
+
+def get_cache_home() -> str:
+    """
+    Folder of all pybquiz caches. In order of priority: `set_cache_home`, the
+    PYBQUIZ_CACHE_DIR environment variable, $XDG_CACHE_HOME/pybquiz and ~/.cache/pybquiz.
+    """
+    if _CACHE_HOME is not None:
+        return _CACHE_HOME
+    if os.environ.get(ENV_CACHE_DIR, "") != "":
+        return os.environ[ENV_CACHE_DIR]
+    xdg = os.environ.get("XDG_CACHE_HOME", "")
+    if xdg == "":
+        xdg = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(xdg, "pybquiz")
+
+
+class StoreError(Exception):
+    """
+    Raised when a store is missing, from another schema version or corrupted.
+    """
+    pass
+
+
+class ArrayStore:
+
+    # Bump when the layout of stored arrays changes, older stores are ignored
+    SCHEMA_VERSION = 1
+
+    MANIFEST = "manifest.json"
+    KEY_VERSION = "version"
+    KEY_CREATED = "created"
+    KEY_META = "meta"
+    KEY_ARRAYS = "arrays"
+    KEY_FILE = "file"
+    KEY_SHA256 = "sha256"
+
+    def __init__(self, path: str) -> None:
+        """
+        Versioned store of named numpy arrays. Arrays are saved as content-addressed .npy
+        files (named after their SHA-256) and a JSON manifest lists them with their
+        checksum and the schema version. A save writes every file to a temporary name
+        then renames it, the manifest last, so readers see either the old or the new
+        store, never a partial one. Arrays can be opened memory-mapped so that processes
+        share a single copy in the page cache.
+
+        Parameters
+        ----------
+        path : str
+            Folder of the store.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, self.MANIFEST)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    @staticmethod
+    def _sha256(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _tmp(self, path: str) -> str:
+        return "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+
+    def save(self, arrays: dict, meta: dict = None):
+        """
+        Save arrays atomically.
+
+        Parameters
+        ----------
+        arrays : dict
+            Arrays by name. Object arrays are not supported (no pickle).
+        meta : dict, optional
+            JSON serializable information stored in the manifest, by default None.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        entries = {}
+        with self.lock:
+            for name, array in arrays.items():
+                # Write array, then move it to its content address
+                path_tmp = self._tmp(os.path.join(self.path, name + ".npy"))
+                with open(path_tmp, "wb") as f:
+                    np.save(f, np.asarray(array), allow_pickle=False)
+                sha = self._sha256(path_tmp)
+                os.replace(path_tmp, os.path.join(self.path, sha + ".npy"))
+                entries[name] = {self.KEY_FILE: sha + ".npy", self.KEY_SHA256: sha}
+
+            # Commit point, readers switch to the new arrays
+            manifest = {
+                self.KEY_VERSION: self.SCHEMA_VERSION,
+                self.KEY_CREATED: time.time(),
+                self.KEY_META: {} if meta is None else meta,
+                self.KEY_ARRAYS: entries,
+            }
+            path_tmp = self._tmp(self.manifest_path)
+            with open(path_tmp, "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(path_tmp, self.manifest_path)
+
+            # Drop arrays of older versions (mapped copies stay readable until closed)
+            used = set([e[self.KEY_FILE] for e in entries.values()])
+            for f in os.listdir(self.path):
+                if f.endswith(".npy") and f not in used:
+                    try:
+                        os.remove(os.path.join(self.path, f))
+                    except OSError:
+                        pass
+
+    def load(self, mmap: bool = True, verify: bool = True, retry: bool = True):
+        """
+        Load arrays.
+
+        Parameters
+        ----------
+        mmap : bool, optional
+            Open arrays memory-mapped (read-only), by default True.
+        verify : bool, optional
+            Check arrays against their checksum, by default True.
+        retry : bool, optional
+            Read the manifest again if a concurrent save removed an array, by default True.
+
+        Returns
+        -------
+        arrays : dict
+            Arrays by name.
+        meta : dict
+            Information stored with the arrays.
+
+        Raises
+        ------
+        StoreError
+            If the store is missing, from another schema version or corrupted.
+        """
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise StoreError("Cannot read store {}: {}".format(self.path, e))
+
+        if manifest.get(self.KEY_VERSION, None) != self.SCHEMA_VERSION:
+            raise StoreError("Store {} has version {}, expected {}".format(
+                self.path, manifest.get(self.KEY_VERSION, None), self.SCHEMA_VERSION))
+
+        arrays = {}
+        for name, entry in manifest.get(self.KEY_ARRAYS, {}).items():
+            path = os.path.join(self.path, entry[self.KEY_FILE])
+            # Replaced by a concurrent save since the manifest was read
+            if retry and not os.path.exists(path):
+                return self.load(mmap=mmap, verify=verify, retry=False)
+            try:
+                if verify and self._sha256(path) != entry[self.KEY_SHA256]:
+                    raise StoreError("Checksum mismatch for {} in store {}".format(name, self.path))
+                arrays[name] = np.load(path, mmap_mode="r" if mmap else None, allow_pickle=False)
+            except (OSError, ValueError) as e:
+                raise StoreError("Cannot read {} in store {}: {}".format(name, self.path, e))
+
+        return arrays, manifest.get(self.KEY_META, {})
+
+    def clear(self):
+        """
+        Remove the store.
+        """
+        with self.lock:
+            if not os.path.isdir(self.path):
+                return
+            for f in os.listdir(self.path):
+                os.remove(os.path.join(self.path, f))
+
+    def __repr__(self):
+        return "{}(path={}, version={})".format(self.__class__.__name__, self.path, self.SCHEMA_VERSION)
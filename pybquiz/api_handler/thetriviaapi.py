@@ -1,8 +1,9 @@
 from pybquiz.api_handler.base import BaseAPIHandler
+from pybquiz.api_handler.deadline import Deadline
 from pybquiz.elements import Questions
-from typing import Union, List
+from typing import Union, List, Tuple
+from collections import OrderedDict
 import numpy as np
-from tqdm import tqdm
 
 
 class TheTriviaAPI(BaseAPIHandler):
@@ -34,6 +35,25 @@ class TheTriviaAPI(BaseAPIHandler):
     KEY_R_ERROR = "error"
     KEY_R_CORRECT = "correctAnswer"
     KEY_R_INCORRECT = "incorrectAnswers"
+    KEY_R_CATEGORY = "category"
+    KEY_R_DIFFICULTY = "difficulty"
+    
+    # Metadata endpoints cached for a day
+    CACHE_TTL = {
+        URL_CATEGORY: 24 * 3600,
+    }
+    
+    # Payload reports the difficulty of each question, queries accept several categories
+    MIXED_DIFFICULTY = True
+    MULTI_CATEGORY = True
+    
+    # Maximal number of questions per query (limit)
+    MAX_BATCH = 50
+    
+    # Rate limit
+    RATE_REQUESTS = 1
+    RATE_WINDOW = 1.0
+    RATE_BURST = 5
     
     LUT_DIFFICULTY = {
         0: "easy",
@@ -47,22 +67,32 @@ class TheTriviaAPI(BaseAPIHandler):
         
     def __init__(
         self,
-        delay_api: int = 5,
+        delay_api: float = None,
         token: str = None,
         verbose: bool = True,
         clear_cache: bool = False,
+        rate_limit: dict = None,
+        offline: bool = False,
+        deadline: Deadline = None,
     ) -> None:
         """
         Create API handler to https://the-trivia-api.com
 
         Parameters
         ----------
-        delay_api : int, optional
-            Default time between queries to API in seconds. By default 5 seconds.
+        delay_api : float, optional
+            Fixed time between queries to API in seconds. By default None, use the 
+            handler rate limit (RATE_REQUESTS per RATE_WINDOW seconds).
+        rate_limit : dict, optional
+            Custom rate limit with keys "requests", "window" and "burst".
+        offline : bool, optional
+            Never query the API, use cached statistics only. By default False.
+        deadline : Deadline, optional
+            Time budget of the queries, category metadata included. By default None.
         """
         
         self.token = token
-        super().__init__(verbose=verbose, delay_api=delay_api, clear_cache=clear_cache, qtype="MCQ")
+        super().__init__(verbose=verbose, delay_api=delay_api, clear_cache=clear_cache, qtype="MCQ", rate_limit=rate_limit, offline=offline, deadline=deadline)
                 
     def initialize_db(self) -> Union[List[str], List[int], np.ndarray, np.ndarray]:
         """
@@ -92,35 +122,56 @@ class TheTriviaAPI(BaseAPIHandler):
         categories_difficulty = np.zeros((N, 3))
         categories_type= np.zeros((N, 2))
         
-        for i in tqdm(np.arange(N), disable=(not self.verbose)):
-            # Get category specific stats
-            result_cat = self.slow_request_urllib3(url=self.URL_CATEGORY, params={self.KEY_CAT: categories_name[i]})
-            result_diff = result_cat.get(self.KEY_BY_DIFF, {})
-            result_type = result_cat.get(self.KEY_BY_TYPE, {})
-            # Extract counts            
-            n_easy = result_diff.get(self.KEY_DIFF_EASY, 0)
-            n_medium = result_diff.get(self.KEY_DIFF_MEDIUM, 0)
-            n_hard = result_diff.get(self.KEY_DIFF_HARD, 0)
-            n_txt = result_type.get(self.KEY_TYPE_TXT, 0)
-            n_img = result_type.get(self.KEY_TYPE_IMG, 0)
-            # Sanity check            
-            assert n_img + n_txt == n_easy + n_medium + n_hard
+        def update(i, counts):
             # Affect variable
-            categories_difficulty[i] = [n_easy, n_medium, n_hard]
-            categories_type[i] = [n_txt, n_img]
+            categories_difficulty[i], categories_type[i] = counts
+        
+        # Get category specific stats, concurrently
+        self.crawl(fn=self.count_category, items=categories_name, callback=update)
             
         # Retreive categories
         return categories_name, categories_id, categories_type, categories_difficulty
     
+    def category_totals(self) -> OrderedDict:
+        """
+        Total number of questions per (category name, category id).
+        """
+        result = self.slow_request_urllib3(self.URL_CATEGORY)
+        result = result.get(self.KEY_BY_CAT, {})
+        return OrderedDict([((name, i), result[name]) for i, name in enumerate(sorted(result.keys()))])
+    
+    def category_key(self, name: str, id: int):
+        # Counts are queried by name
+        return name
+    
+    def count_category(self, category: str) -> Tuple[List[int], List[int]]:
+        """
+        Number of questions of a category per difficulty and per type.
+        """
+        result_cat = self.slow_request_urllib3(url=self.URL_CATEGORY, params={self.KEY_CAT: category})
+        result_diff = result_cat.get(self.KEY_BY_DIFF, {})
+        result_type = result_cat.get(self.KEY_BY_TYPE, {})
+        # Extract counts            
+        n_easy = result_diff.get(self.KEY_DIFF_EASY, 0)
+        n_medium = result_diff.get(self.KEY_DIFF_MEDIUM, 0)
+        n_hard = result_diff.get(self.KEY_DIFF_HARD, 0)
+        n_txt = result_type.get(self.KEY_TYPE_TXT, 0)
+        n_img = result_type.get(self.KEY_TYPE_IMG, 0)
+        # Sanity check            
+        assert n_img + n_txt == n_easy + n_medium + n_hard
+        return [n_easy, n_medium, n_hard], [n_txt, n_img]
+    
     def get_questions(self, n: int, category_id: int = None, difficulty: int = None, type: str = None) -> List[Questions]:
 
         # Create query dict (if None then consider any)
         params = {self.KEY_R_LIMIT: n}
         header = {}
         
-        # Check category
-        if category_id is not None:
-            params[self.KEY_R_CAT] = self.categories[category_id]
+        # Check category (one or several)
+        if isinstance(category_id, (list, tuple)):
+            params[self.KEY_R_CAT] = ",".join([self.category_name(category_id=c) for c in category_id])
+        elif category_id is not None:
+            params[self.KEY_R_CAT] = self.category_name(category_id=category_id)
         if difficulty is not None:
             params[self.KEY_R_DIFF] = self.LUT_DIFFICULTY[difficulty]
         if type is not None:
@@ -133,7 +184,7 @@ class TheTriviaAPI(BaseAPIHandler):
         result = self.slow_request_urllib3(url=self.URL_QUESTION, header=header, params=params)     
 
         # Check return message
-        if result is None:
+        if self.is_error(result=result):
             if self.verbose:
                 print("Error in API: {}".format(result))
             return []
@@ -141,19 +192,24 @@ class TheTriviaAPI(BaseAPIHandler):
         # Parse results as questions
         questions = []
         for raw_question in result:
+            # Category as reported by the API (query may target several)
+            q_cat_id = category_id
+            q_cat = raw_question.get(self.KEY_R_CATEGORY, "")
+            if not isinstance(q_cat_id, (int, np.integer)):
+                q_cat_id = self.category_id_by_name(name=q_cat, strict=False)
             # Parse question
             q = Questions(
                 question=raw_question.get(self.KEY_R_QUESTION, self.KEY_R_ERROR).get(self.KEY_TEXT, self.KEY_R_ERROR),
                 correct_answers=[raw_question.get(self.KEY_R_CORRECT, self.KEY_R_ERROR)],
                 incorrect_answers=raw_question.get(self.KEY_R_INCORRECT, []),
                 library=self.__class__.__name__.lower(), 
-                category=self.categories[category_id],
-                category_id=category_id,
+                category=q_cat if q_cat_id is None else self.category_name(category_id=q_cat_id),
+                category_id=q_cat_id,
                 uuid=raw_question.get(self.KEY_R_ID, ""),
-                difficulty=difficulty,
+                difficulty=self.parse_difficulty(raw_question.get(self.KEY_R_DIFFICULTY, None), default=difficulty),
                 type=type,
             )
             
             questions.append(q)
             
-        return questions
\ No newline at end of file
+        return self.save_questions(questions)
\ No newline at end of file
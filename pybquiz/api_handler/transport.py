@@ -0,0 +1,208 @@
+import json
+import threading
+import time
+import urllib3
+
+
+class TransportError(Exception):
+    """
+    Raised when a request cannot be completed (connection, timeout, size limit).
+    """
+    pass
+
+
+class Response:
+
+    def __init__(self, status: int, headers: dict, data: bytes, latency: float = 0.) -> None:
+        """
+        Raw HTTP response returned by the transport.
+
+        Parameters
+        ----------
+        status : int
+            HTTP status code.
+        headers : dict
+            Response headers.
+        data : bytes
+            Decoded (un-gzipped) response body.
+        latency : float, optional
+            Time in seconds to get the full response, by default 0.
+        """
+        self.status = status
+        self.headers = headers
+        self.data = data
+        self.latency = latency
+
+    def json(self):
+        return json.loads(self.data)
+
+    def __repr__(self):
+        return "{}(status={}, size={}, latency={:.3f})".format(
+            self.__class__.__name__, self.status, len(self.data), self.latency
+        )
+
+
+class HTTPTransport:
+
+    # Default settings
+    CONNECT_TIMEOUT = 5.
+    READ_TIMEOUT = 30.
+    MAX_SIZE = 10 * 1024 * 1024
+    NUM_POOLS = 10
+    POOL_SIZE = 4
+    CHUNK_SIZE = 64 * 1024
+
+    KEY_ACCEPT_ENCODING = "Accept-Encoding"
+    KEY_CONTENT_LENGTH = "Content-Length"
+
+    def __init__(
+        self,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_size: int = MAX_SIZE,
+        gzip: bool = True,
+        num_pools: int = NUM_POOLS,
+        pool_size: int = POOL_SIZE,
+    ) -> None:
+        """
+        HTTP transport shared by API handlers. Keep one keep-alive connection pool per
+        host so that consecutive queries do not pay a new TCP + TLS handshake.
+
+        Parameters
+        ----------
+        connect_timeout : float, optional
+            Timeout in seconds to open a connection, by default 5 seconds.
+        read_timeout : float, optional
+            Timeout in seconds to read the response, by default 30 seconds.
+        max_size : int, optional
+            Maximal size in bytes of a (decoded) response, by default 10 MB.
+        gzip : bool, optional
+            If True, ask servers for gzip compressed responses, by default True.
+        num_pools : int, optional
+            Number of host pools kept alive, by default 10.
+        pool_size : int, optional
+            Number of connections kept alive per host, by default 4. Should be at least
+            the number of concurrent requests to a host, extra connections are opened
+            and then discarded otherwise.
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_size = max_size
+        self.gzip = gzip
+        self.num_pools = num_pools
+        self.pool_size = pool_size
+        self.pool = urllib3.PoolManager(num_pools=num_pools, maxsize=pool_size, block=False)
+
+    def request(self, url: str, header: dict = None, params: dict = None, method: str = "GET", timeout: float = None) -> Response:
+        """
+        Send request through the connection pool.
+
+        Parameters
+        ----------
+        url : str
+            URL to query.
+        header : dict, optional
+            Request headers, by default None.
+        params : dict, optional
+            Query fields, by default None.
+        method : str, optional
+            HTTP method, by default "GET".
+        timeout : float, optional
+            Overall time budget in seconds, connect and read timeouts are capped to it.
+            By default None (transport timeouts).
+
+        Returns
+        -------
+        response : Response
+            Response with decoded body.
+        """
+        # Build headers
+        headers = {} if header is None else dict(header)
+        if self.gzip:
+            headers.setdefault(self.KEY_ACCEPT_ENCODING, "gzip")
+
+        # Build timeouts
+        connect_timeout, read_timeout = self.connect_timeout, self.read_timeout
+        if timeout is not None:
+            connect_timeout, read_timeout = min(connect_timeout, timeout), min(read_timeout, timeout)
+
+        start = time.time()
+        try:
+            result = self.pool.request(
+                method=method,
+                url=url,
+                headers=headers,
+                fields=params,
+                timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+                preload_content=False,
+                decode_content=True,
+                retries=False,
+            )
+        except urllib3.exceptions.HTTPError as e:
+            raise TransportError("Request to {} failed: {}".format(url, e)) from e
+
+        try:
+            # Reject announced oversized payloads
+            length = result.headers.get(self.KEY_CONTENT_LENGTH, None)
+            if length is not None and length.isdigit() and int(length) > self.max_size:
+                raise TransportError("Response from {} too large ({} bytes)".format(url, length))
+            # Stream content with size limit
+            chunks = []
+            size = 0
+            for chunk in result.stream(self.CHUNK_SIZE, decode_content=True):
+                size += len(chunk)
+                if size > self.max_size:
+                    raise TransportError("Response from {} exceeds {} bytes".format(url, self.max_size))
+                chunks.append(chunk)
+        except urllib3.exceptions.HTTPError as e:
+            raise TransportError("Reading response from {} failed: {}".format(url, e)) from e
+        finally:
+            # Give connection back to the pool (keep-alive)
+            result.release_conn()
+
+        return Response(status=result.status, headers=dict(result.headers), data=b"".join(chunks), latency=time.time() - start)
+
+    def clear(self):
+        """
+        Close all pooled connections.
+        """
+        self.pool.clear()
+
+
+# Transport shared by all handlers of the process
+_TRANSPORT = None
+_TRANSPORT_LOCK = threading.Lock()
+
+
+def get_transport(pool_size: int = None) -> HTTPTransport:
+    """
+    Return the shared transport, create it with default settings if needed. With
+    `pool_size`, the transport is replaced by a larger one (same settings) if it keeps
+    fewer connections per host. Requests in flight finish on the previous one.
+    """
+    global _TRANSPORT
+    with _TRANSPORT_LOCK:
+        if _TRANSPORT is None:
+            _TRANSPORT = HTTPTransport(pool_size=max(HTTPTransport.POOL_SIZE, pool_size or 0))
+        elif pool_size is not None and pool_size > _TRANSPORT.pool_size:
+            _TRANSPORT = HTTPTransport(
+                connect_timeout=_TRANSPORT.connect_timeout,
+                read_timeout=_TRANSPORT.read_timeout,
+                max_size=_TRANSPORT.max_size,
+                gzip=_TRANSPORT.gzip,
+                num_pools=_TRANSPORT.num_pools,
+                pool_size=pool_size,
+            )
+        return _TRANSPORT
+
+
+def configure_transport(**kwargs) -> HTTPTransport:
+    """
+    Replace the shared transport with a new one created from `kwargs` (see HTTPTransport).
+    """
+    global _TRANSPORT
+    with _TRANSPORT_LOCK:
+        if _TRANSPORT is not None:
+            _TRANSPORT.clear()
+        _TRANSPORT = HTTPTransport(**kwargs)
+        return _TRANSPORT
@@ -1,8 +1,10 @@
 import os
+import shutil
 import urllib.request
 import zipfile
 import re
 from PIL import Image, ImageFilter
+from pybquiz.filelock import build_once
 
 
 def standardize_text(text: str):
@@ -14,6 +16,9 @@ class BackgroundManager():
     URL_BACKGROUND = "https://github.com/christianabbet/pybQuiz/releases/download/v1.0/backgrounds.zip"
     FILE_ZIP = "backgrounds.zip"    
     FOLDER_NAME = "backgrounds"
+    # Lock files of blurred images, kept out of the backgrounds folder
+    FOLDER_LOCK = ".locks"
+    EXTENSIONS = [".jpg", ".jpeg", ".png"]
     
     def __init__(
         self, 
@@ -25,19 +30,30 @@ class BackgroundManager():
         # Define filenames
         filename_zip = os.path.join(dirout, BackgroundManager.FILE_ZIP)
         filename_out = os.path.join(dirout, BackgroundManager.FOLDER_NAME)
+        self.dir_lock = os.path.join(dirout, BackgroundManager.FOLDER_LOCK)
         
-        # Check if download needed
-        if not os.path.exists(filename_out):
+        def download():
             # Download file
+            dir_tmp = os.path.join(dirout, ".{}.{}.tmp".format(BackgroundManager.FOLDER_NAME, os.getpid()))
             urllib.request.urlretrieve(self.URL_BACKGROUND, filename_zip)
-            # Unzip
+            # Unzip aside, then move in place (never seen half extracted)
             with zipfile.ZipFile(filename_zip, 'r') as zip_ref:
-                zip_ref.extractall(dirout)
+                zip_ref.extractall(dir_tmp)
+            dir_extracted = os.path.join(dir_tmp, BackgroundManager.FOLDER_NAME)
+            os.replace(dir_extracted if os.path.isdir(dir_extracted) else dir_tmp, filename_out)
+            if os.path.isdir(dir_tmp):
+                shutil.rmtree(dir_tmp)
             # Remove zip
             os.remove(filename_zip)
+        
+        # Check if download needed (once for all processes)
+        build_once(path=filename_out, build=download)
             
-        # Get local list
-        self.bgs = {os.path.splitext(f)[0]: os.path.join(filename_out, f) for f in os.listdir(filename_out)}
+        # Get local list (images only, no temporary or lock files)
+        self.bgs = {
+            os.path.splitext(f)[0]: os.path.join(filename_out, f) for f in os.listdir(filename_out)
+            if os.path.splitext(f)[1].lower() in self.EXTENSIONS and not f.startswith(".")
+        }
         
         # # Set openai api
         # if os.path.exists(yaml_token):
@@ -60,10 +76,15 @@ class BackgroundManager():
         if blurred and path_img is not None:
             filename, ext = os.path.splitext(os.path.basename(path_img))
             path_blur = os.path.join(os.path.dirname(path_img), "{}_blurred{}".format(filename, ext))
-            # Check if blured image exists
-            if not os.path.exists(path_blur):
+            def blur():
                 img = Image.open(path_img)
-                img.filter(ImageFilter.GaussianBlur(radius=10)).save(path_blur)
+                # Written aside, then renamed
+                path_tmp = os.path.join(os.path.dirname(path_blur), ".{}.{}.tmp{}".format(filename, os.getpid(), ext))
+                img.filter(ImageFilter.GaussianBlur(radius=10)).save(path_tmp)
+                os.replace(path_tmp, path_blur)
+            
+            # Check if blured image exists (created once for all processes)
+            build_once(path=path_blur, build=blur, lock=os.path.join(self.dir_lock, os.path.basename(path_blur) + ".lock"))
             return path_blur
         else:
             return path_img
@@ -46,8 +46,9 @@ class ConfigGenerator:
         count = 0
         for j, api_name in enumerate(self.apis.keys()):
             # Get stats
-            c = self.apis[api_name].categories
-            c_id = self.apis[api_name].categories_id
+            metadata = self.apis[api_name].metadata
+            c = metadata.categories
+            c_id = metadata.categories_id
             # Create data frame
             if use_navite_id:
                 p_id = c_id + (j+1)*self.OFFSET
@@ -10,6 +10,7 @@ class PYBConst:
     THEME_ID = "theme_id"
     DIFFICULTY = "difficulty"
     TYPE = "type"
+    DEGRADED = "degraded"
     
     # For question
     ANSWERS = "answers"
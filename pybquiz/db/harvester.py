@@ -0,0 +1,305 @@
+import json
+import os
+import time
+from typing import List
+from pybquiz.api_handler import create_handler
+from pybquiz.api_handler.base import BaseAPIHandler
+from pybquiz.api_handler.retry import APIError, CircuitOpenError, BudgetExceeded
+from pybquiz.api_handler.store import get_cache_home
+from pybquiz.db.store import QuestionStore, get_question_store
+
+
+class Harvester:
+
+    APIS = ["OpenTriviaDB", "TheTriviaAPI", "QuizAPI", "APINinjas"]
+
+    FILENAME = "harvest.json"
+    VERSION = 1
+
+    # Questions asked per query when the API has no batch limit
+    BATCH = 10
+    # Number of queries without new questions before a bucket is considered exhausted,
+    # more when statistics report missing questions (random sampling APIs repeat a lot)
+    MAX_STALE = 3
+    MAX_STALE_KNOWN = 10
+    # Number of failed queries before a bucket is left for the next run
+    MAX_ERRORS = 3
+
+    KEY_VERSION = "version"
+    KEY_BUCKETS = "buckets"
+    KEY_DONE = "done"
+    KEY_REQUESTS = "requests"
+    KEY_NEW = "new"
+    KEY_STALE = "stale"
+    KEY_UPDATED = "updated"
+
+    def __init__(
+        self,
+        tokens: dict = None,
+        apis: List[str] = None,
+        store: QuestionStore = None,
+        checkpoint: str = None,
+        delay_api: float = None,
+        rate_limits: dict = None,
+        max_requests: int = None,
+        verbose: bool = True,
+    ) -> None:
+        """
+        Fill the local question store with every category and difficulty level of the
+        APIs. Queries go through the handlers, hence their rate limits. Each bucket (API,
+        category, difficulty) is harvested until the store holds all its questions or the
+        API has nothing new to offer. Progress is saved after each query so that an
+        interrupted run resumes where it stopped.
+
+        Parameters
+        ----------
+        tokens : dict, optional
+            API tokens per API name, by default None.
+        apis : List[str], optional
+            Names of the APIs to harvest, by default None (all of APIS).
+        store : QuestionStore, optional
+            Destination of the questions, by default the store of each handler.
+        checkpoint : str, optional
+            Path to the progress file, by default harvest.json in the user cache folder.
+        delay_api : float, optional
+            Fixed time between queries to API in seconds, by default None.
+        rate_limits : dict, optional
+            Custom rate limits per API name, by default None.
+        max_requests : int, optional
+            Maximal number of HTTP requests per API for this run (metadata, session tokens
+            and retries included), by default None (no limit).
+        verbose : bool, optional
+            Extended verbose terminal output, by default True.
+        """
+        self.tokens = {} if tokens is None else tokens
+        self.apis = self.APIS if apis is None else apis
+        self.store = store
+        self.checkpoint = os.path.join(get_cache_home(), self.FILENAME) if checkpoint is None else checkpoint
+        self.delay_api = delay_api
+        self.rate_limits = {} if rate_limits is None else rate_limits
+        self.max_requests = max_requests
+        self.verbose = verbose
+        self.state = self.load()
+
+    def load(self) -> dict:
+        """
+        Load progress of previous runs (empty if missing or invalid).
+        """
+        try:
+            with open(self.checkpoint) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if state.get(self.KEY_VERSION, None) != self.VERSION:
+            state = {self.KEY_VERSION: self.VERSION, self.KEY_BUCKETS: {}}
+        return state
+
+    def save(self):
+        """
+        Save progress atomically (never leaves a partial file if interrupted).
+        """
+        if os.path.dirname(self.checkpoint) != "":
+            os.makedirs(os.path.dirname(self.checkpoint), exist_ok=True)
+        path_tmp = "{}.{}.tmp".format(self.checkpoint, os.getpid())
+        with open(path_tmp, "w") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(path_tmp, self.checkpoint)
+
+    def reset(self):
+        """
+        Forget progress, next run harvests all buckets again.
+        """
+        self.state = {self.KEY_VERSION: self.VERSION, self.KEY_BUCKETS: {}}
+        self.save()
+
+    @staticmethod
+    def make_key(api: str, category_id: int, difficulty: int) -> str:
+        return "{}/{}/{}".format(api, category_id, "any" if difficulty is None else difficulty)
+
+    def bucket(self, api: str, category_id: int, difficulty: int) -> dict:
+        key = self.make_key(api=api, category_id=category_id, difficulty=difficulty)
+        return self.state[self.KEY_BUCKETS].setdefault(key, {
+            self.KEY_DONE: False, self.KEY_REQUESTS: 0, self.KEY_NEW: 0, self.KEY_STALE: 0,
+        })
+
+    def buckets(self, handler: BaseAPIHandler) -> List[tuple]:
+        """
+        Categories and difficulty levels of an API (None if difficulty cannot be queried).
+        """
+        difficulties = list(handler.LUT_DIFFICULTY.keys()) if handler.QUERY_DIFFICULTY else [None]
+        return [(int(c), d) for c in handler.categories_id for d in difficulties]
+
+    def get_store(self, handler: BaseAPIHandler = None) -> QuestionStore:
+        """
+        Store receiving the questions of a handler (the one it already writes to by default).
+        """
+        if self.store is not None:
+            return self.store
+        store = handler.question_store if handler is not None else get_question_store()
+        return QuestionStore() if store is None else store
+
+    def create_handler(self, api: str) -> BaseAPIHandler:
+        # Own handler, its request count starts with the metadata requests of this run
+        try:
+            handler = create_handler(
+                name=api, delay_api=self.delay_api, token=self.tokens.get(api, None), verbose=self.verbose,
+                rate_limit=self.rate_limits.get(api, None), shared=False,
+            )
+        except NotImplementedError:
+            return None
+        return handler if isinstance(handler, BaseAPIHandler) else None
+
+    def harvest_bucket(self, handler: BaseAPIHandler, category_id: int, difficulty: int, budget: int = None) -> int:
+        """
+        Query a bucket until it is exhausted or the budget is spent.
+
+        Parameters
+        ----------
+        handler : BaseAPIHandler
+            API handler.
+        category_id : int
+            Category of the questions.
+        difficulty : int
+            Difficulty level, None if not supported by the API.
+        budget : int, optional
+            Maximal number of HTTP requests, by default None (no limit).
+
+        Returns
+        -------
+        requests : int
+            Number of HTTP requests sent (retries and session tokens included).
+        """
+        api = handler.__class__.__name__
+        library = api.lower()
+        store = self.get_store(handler=handler)
+        state = self.bucket(api=api, category_id=category_id, difficulty=difficulty)
+        available = handler.available_questions(category_id=category_id, difficulty=difficulty)
+        known = available is not None and available >= 0
+        max_stale = self.MAX_STALE_KNOWN if known else self.MAX_STALE
+        start, errors = handler.sent_requests, 0
+
+        while not state[self.KEY_DONE]:
+            # Bucket complete according to category statistics
+            stored = store.count(library=library, category_id=category_id, difficulty=difficulty)
+            if known and available <= stored:
+                state[self.KEY_DONE] = True
+                break
+            if budget is not None and handler.sent_requests - start >= budget:
+                break
+            if handler.requests_left() == 0:
+                raise BudgetExceeded("Request budget of {} spent".format(api))
+            
+            # Never ask more than the bucket holds, some APIs answer nothing otherwise
+            size = self.BATCH if handler.MAX_BATCH is None else handler.MAX_BATCH
+            if known:
+                size = max(min(size, available - stored), 1)
+
+            # Handlers already write to the shared store, new questions are counted there
+            before = store.count(library=library)
+            sent = handler.sent_requests
+            try:
+                questions = handler.fetch_questions(n=size, category_id=category_id, difficulty=difficulty, max_pages=1)
+            except (CircuitOpenError, BudgetExceeded):
+                raise
+            except APIError as e:
+                print("Warning: {}".format(e))
+                errors += 1
+                if errors >= self.MAX_ERRORS:
+                    break
+                continue
+            finally:
+                state[self.KEY_REQUESTS] += handler.sent_requests - sent
+
+            # Stop once the API keeps serving known questions (uuids already stored)
+            store.add(questions=questions)
+            new = store.count(library=library) - before
+            state[self.KEY_NEW] += new
+            state[self.KEY_STALE] = 0 if new > 0 else state[self.KEY_STALE] + 1
+            state[self.KEY_UPDATED] = time.time()
+            self.save()
+            
+            if state[self.KEY_STALE] >= max_stale:
+                # Statistics say questions are left, try again next run
+                if known:
+                    if self.verbose:
+                        print("{}: bucket {} stalled, {} questions left for next run".format(
+                            api, self.make_key(api, category_id, difficulty), available - stored))
+                    break
+                state[self.KEY_DONE] = True
+
+        self.save()
+        return handler.sent_requests - start
+
+    def harvest(self, handler: BaseAPIHandler, spent: int = 0) -> int:
+        """
+        Harvest all buckets of an API not completed by previous runs, within `max_requests`
+        HTTP requests.
+
+        Parameters
+        ----------
+        handler : BaseAPIHandler
+            API handler.
+        spent : int, optional
+            Requests of this run already sent (e.g. metadata at creation), by default 0.
+
+        Returns
+        -------
+        requests : int
+            Number of HTTP requests sent.
+        """
+        api = handler.__class__.__name__
+        buckets = [(c, d) for c, d in self.buckets(handler=handler) if not self.bucket(api, c, d)[self.KEY_DONE]]
+        if self.verbose:
+            print("{}: {} buckets left".format(api, len(buckets)))
+
+        # Every request of the handler counts (token calls and retries too)
+        start = handler.sent_requests
+        handler.set_request_budget(None if self.max_requests is None else max(self.max_requests - spent, 0))
+        try:
+            for c, d in buckets:
+                try:
+                    self.harvest_bucket(handler=handler, category_id=c, difficulty=d)
+                except (CircuitOpenError, BudgetExceeded) as e:
+                    # API is down or budget spent, next run will resume from here
+                    print("Warning: {}".format(e))
+                    break
+        finally:
+            # Handler may be used by others afterwards
+            handler.set_request_budget(None)
+        self.save()
+        return handler.sent_requests - start
+
+    def run(self) -> dict:
+        """
+        Harvest all APIs.
+
+        Returns
+        -------
+        requests : dict
+            Number of HTTP requests sent per API.
+        """
+        requests = {}
+        for api in self.apis:
+            handler = self.create_handler(api=api)
+            if handler is None:
+                if self.verbose:
+                    print("{}: skipped (unknown API or missing token)".format(api))
+                continue
+            # Metadata requests of the new handler are part of the budget
+            requests[api] = handler.sent_requests + self.harvest(handler=handler, spent=handler.sent_requests)
+
+        if self.verbose:
+            store = self.get_store()
+            print("Harvest done: {} questions in {}".format(len(store), store.path))
+        return requests
+
+    def progress(self) -> dict:
+        """
+        Number of completed and known buckets per API.
+        """
+        progress = {}
+        for key, state in self.state[self.KEY_BUCKETS].items():
+            api = key.split("/")[0]
+            done, total = progress.get(api, (0, 0))
+            progress[api] = (done + int(state[self.KEY_DONE]), total + 1)
+        return progress
@@ -0,0 +1,345 @@
+import hashlib
+import html
+import os
+import re
+import sqlite3
+import struct
+import unicodedata
+from contextlib import contextmanager
+from typing import List
+import numpy as np
+from pybquiz.elements import Questions
+from pybquiz.api_handler.store import get_cache_home
+from pybquiz.db.store import QuestionStore
+
+
+class MinHasher:
+
+    # Number of hash functions (length of signatures)
+    NUM_PERM = 128
+    # Length of character shingles
+    SHINGLE = 5
+    # Same seed everywhere, signatures are persisted
+    SEED = 1
+
+    PRIME = np.uint64((1 << 61) - 1)
+    MAX_HASH = np.uint64((1 << 32) - 1)
+
+    def __init__(self) -> None:
+        """
+        MinHash signatures of the normalized text of a question (question and correct
+        answers). The share of equal values between two signatures estimates the
+        Jaccard similarity of their character shingles.
+        """
+        rng = np.random.RandomState(self.SEED)
+        self.a = rng.randint(1, self.PRIME, size=self.NUM_PERM, dtype=np.uint64)
+        self.b = rng.randint(0, self.PRIME, size=self.NUM_PERM, dtype=np.uint64)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Text without case, accents, punctuation and extra spaces.
+        """
+        text = unicodedata.normalize("NFKD", html.unescape(str(text))).encode("ascii", "ignore").decode("ascii")
+        return " ".join(re.sub("[^a-z0-9]+", " ", text.lower()).split())
+
+    @classmethod
+    def text(cls, q: Questions) -> str:
+        return cls.normalize(" ".join([q.question] + sorted([str(a) for a in q.correct_answers])))
+
+    def shingles(self, text: str) -> set:
+        if len(text) <= self.SHINGLE:
+            return set([text])
+        return set([text[i:i+self.SHINGLE] for i in range(len(text) - self.SHINGLE + 1)])
+
+    def signature(self, q: Questions) -> np.ndarray:
+        """
+        Signature of a question.
+
+        Parameters
+        ----------
+        q : Questions
+            Question.
+
+        Returns
+        -------
+        signature : np.ndarray
+            NUM_PERM minimal hashes (uint32).
+        """
+        shingles = self.shingles(self.text(q))
+        hv = np.array([struct.unpack("<I", hashlib.blake2b(s.encode("utf8"), digest_size=4).digest())[0] for s in shingles], dtype=np.uint64)
+        # Universal hashing (a * x + b) mod p, overflow is part of the hash
+        with np.errstate(over="ignore"):
+            phv = np.bitwise_and((hv[:, None] * self.a[None, :] + self.b[None, :]) % self.PRIME, self.MAX_HASH)
+        return phv.min(axis=0).astype(np.uint32)
+
+    @staticmethod
+    def similarity(sig1: np.ndarray, sig2: np.ndarray) -> float:
+        """
+        Estimated Jaccard similarity of two signatures.
+        """
+        return float(np.mean(sig1 == sig2))
+
+
+class LSH:
+
+    # Bands of ROWS values each (BANDS * ROWS = NUM_PERM). Pairs above about
+    # (1 / BANDS) ** (1 / ROWS) = 0.7 similarity share a bucket with high probability
+    BANDS = 16
+    ROWS = 8
+
+    @classmethod
+    def buckets(cls, signature: np.ndarray) -> List[int]:
+        """
+        One bucket per band, band index included so buckets never collide across bands.
+        """
+        bands = signature.reshape(cls.BANDS, cls.ROWS)
+        return [
+            struct.unpack("<q", hashlib.blake2b(struct.pack("<B", i) + band.tobytes(), digest_size=8).digest())[0]
+            for i, band in enumerate(bands)
+        ]
+
+
+class NearDuplicateIndex:
+
+    FILENAME = "neardup.sqlite"
+
+    # Minimal estimated similarity of near duplicates
+    THRESHOLD = 0.7
+
+    KEY_WATERMARK = "watermark"
+
+    def __init__(self, path: str = None, hasher: MinHasher = None) -> None:
+        """
+        Persistent MinHash/LSH index of the local question bank. Each question is stored
+        with its signature and one bucket per LSH band. Candidates of a question are the
+        questions sharing at least one bucket, found with BANDS indexed lookups whatever
+        the size of the bank, then verified against their signature.
+
+        Parameters
+        ----------
+        path : str, optional
+            Path to the index, by default neardup.sqlite in the user cache folder.
+        hasher : MinHasher, optional
+            Signature builder, by default a new one.
+        """
+        self.path = os.path.join(get_cache_home(), self.FILENAME) if path is None else path
+        self.hasher = MinHasher() if hasher is None else hasher
+        if os.path.dirname(self.path) != "":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS signatures (key TEXT PRIMARY KEY, signature BLOB) WITHOUT ROWID")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (bucket INTEGER, key TEXT, PRIMARY KEY (bucket, key)) WITHOUT ROWID")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value REAL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(q: Questions) -> str:
+        return "{}/{}".format(q.library, QuestionStore.make_uuid(q))
+
+    @staticmethod
+    def split_key(key: str) -> tuple:
+        """
+        Library and uuid of a key.
+        """
+        library, uuid = key.split("/", 1)
+        return library, uuid
+
+    def add(self, questions: List[Questions]) -> int:
+        """
+        Index questions, known ones are ignored.
+
+        Returns
+        -------
+        n : int
+            Number of new questions.
+        """
+        signatures, buckets = [], []
+        for q in questions:
+            key = self.make_key(q)
+            sig = self.hasher.signature(q)
+            signatures.append((key, sig.tobytes()))
+            buckets.extend([(b, key) for b in LSH.buckets(sig)])
+
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO signatures VALUES (?, ?)", signatures)
+            n = conn.total_changes - before
+            conn.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?)", buckets)
+        return n
+
+    def update(self, store: QuestionStore, chunk: int = 1000, verbose: bool = False) -> int:
+        """
+        Index questions added to the store since the last update.
+
+        Parameters
+        ----------
+        store : QuestionStore
+            Local question bank.
+        chunk : int, optional
+            Number of questions indexed per transaction, by default 1000.
+        verbose : bool, optional
+            Extended verbose terminal output, by default False.
+
+        Returns
+        -------
+        n : int
+            Number of new questions.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE name = ?", (self.KEY_WATERMARK,)).fetchone()
+        watermark = None if row is None else row[0]
+
+        n, batch = 0, []
+        for added, q in store.scan(since=watermark):
+            batch.append(q)
+            watermark = added
+            if len(batch) >= chunk:
+                n += self._commit(batch, watermark)
+                batch = []
+        if len(batch) > 0:
+            n += self._commit(batch, watermark)
+
+        if verbose:
+            print("Indexed {} new questions for near duplicates".format(n))
+        return n
+
+    def _commit(self, questions: List[Questions], watermark: float) -> int:
+        # Questions of the watermark are scanned again next time, add is idempotent
+        n = self.add(questions)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (self.KEY_WATERMARK, watermark))
+        return n
+
+    def candidates(self, signature: np.ndarray) -> List[str]:
+        """
+        Keys sharing at least one LSH bucket with a signature.
+        """
+        buckets = LSH.buckets(signature)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT key FROM buckets WHERE bucket IN ({})".format(", ".join(["?"] * len(buckets))), buckets,
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def duplicates(self, q: Questions, threshold: float = None) -> List[str]:
+        """
+        Keys of the near duplicates of a question (the question itself excluded).
+
+        Parameters
+        ----------
+        q : Questions
+            Question.
+        threshold : float, optional
+            Minimal estimated similarity, by default THRESHOLD.
+
+        Returns
+        -------
+        keys : List[str]
+            Keys of near duplicates.
+        """
+        threshold = self.THRESHOLD if threshold is None else threshold
+        sig = self.hasher.signature(q)
+        key = self.make_key(q)
+        keys = [k for k in self.candidates(sig) if k != key]
+        if len(keys) == 0:
+            return []
+
+        # Verify candidates
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, signature FROM signatures WHERE key IN ({})".format(", ".join(["?"] * len(keys))), keys,
+            ).fetchall()
+        return [k for k, s in rows if MinHasher.similarity(sig, np.frombuffer(s, dtype=np.uint32)) >= threshold]
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def __repr__(self):
+        return "{}(path={})".format(self.__class__.__name__, self.path)
+
+
+class NearDuplicateFilter:
+
+    def __init__(self, index: NearDuplicateIndex = None, used=None, threshold: float = None, hasher: MinHasher = None) -> None:
+        """
+        Reject questions close to a question already accepted for the quiz (e.g. the same
+        question from two APIs or with small wording changes). With an index of the bank
+        and a used-question index, questions close to one already played in front of the
+        audience are rejected too. Accepted questions are kept in an in-memory LSH.
+
+        Parameters
+        ----------
+        index : NearDuplicateIndex, optional
+            Index of the local question bank, by default None.
+        used : UsedIndex, optional
+            Questions already played in front of the audience, by default None.
+        threshold : float, optional
+            Minimal estimated similarity of near duplicates, by default NearDuplicateIndex.THRESHOLD.
+        hasher : MinHasher, optional
+            Signature builder, by default the one of the index.
+        """
+        self.index = index
+        self.used = used
+        self.threshold = NearDuplicateIndex.THRESHOLD if threshold is None else threshold
+        self.hasher = hasher if hasher is not None else (index.hasher if index is not None else MinHasher())
+        # Accepted questions, signatures by key and keys by LSH bucket
+        self.signatures = {}
+        self.buckets = {}
+        self.rejected = 0
+
+    def is_duplicate(self, q: Questions, sig: np.ndarray = None) -> bool:
+        """
+        Check a question against accepted ones and questions used by the audience.
+        """
+        sig = self.hasher.signature(q) if sig is None else sig
+        key = NearDuplicateIndex.make_key(q)
+
+        # Accepted for this quiz (e.g. by another round)
+        if key in self.signatures:
+            return True
+        candidates = set([k for b in LSH.buckets(sig) for k in self.buckets.get(b, [])])
+        for k in candidates:
+            if MinHasher.similarity(sig, self.signatures[k]) >= self.threshold:
+                return True
+
+        # Close to a question of the bank already played
+        if self.index is not None and self.used is not None:
+            for k in self.index.duplicates(q, threshold=self.threshold):
+                if self.used.contains(*self.index.split_key(k)):
+                    return True
+        return False
+
+    def accept(self, q: Questions) -> bool:
+        """
+        Accept a question unless it is a near duplicate, accepted questions are kept.
+
+        Returns
+        -------
+        accepted : bool
+            False if the question is a near duplicate.
+        """
+        sig = self.hasher.signature(q)
+        if self.is_duplicate(q, sig=sig):
+            self.rejected += 1
+            return False
+
+        key = NearDuplicateIndex.make_key(q)
+        self.signatures[key] = sig
+        for b in LSH.buckets(sig):
+            self.buckets.setdefault(b, []).append(key)
+        return True
+
+    def __len__(self):
+        return len(self.signatures)
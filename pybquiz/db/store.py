@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List
+from pybquiz.elements import Questions
+from pybquiz.api_handler.store import get_cache_home
+
+
+class QuestionStore:
+
+    FILENAME = "questions.sqlite"
+
+    # Question types as stored (handlers use names or Questions.TYPE_* values)
+    LUT_TYPE = {
+        None: "text",
+        Questions.TYPE_TEXT: "text",
+        Questions.TYPE_IMAGE: "image",
+    }
+
+    def __init__(self, path: str = None) -> None:
+        """
+        Local SQLite bank of questions fetched from the APIs. Questions are unique per
+        library and uuid, and indexed by library, category, difficulty and type so that
+        rounds can be filled without network.
+
+        Parameters
+        ----------
+        path : str, optional
+            Path to the database, by default questions.sqlite in the user cache folder.
+        """
+        self.path = os.path.join(get_cache_home(), self.FILENAME) if path is None else path
+        if os.path.dirname(self.path) != "":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                "library TEXT NOT NULL, uuid TEXT NOT NULL, category_id INTEGER, category TEXT, "
+                "difficulty INTEGER, type TEXT, question TEXT NOT NULL, correct_answers TEXT, "
+                "incorrect_answers TEXT, added REAL, PRIMARY KEY (library, uuid))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_lookup ON questions (library, category_id, difficulty, type)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_questions_uuid ON questions (uuid)")
+
+    @contextmanager
+    def _connect(self):
+        # One connection per call, the store is shared by threads and processes
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @classmethod
+    def make_uuid(cls, q: Questions) -> str:
+        # Provider id, or hash of the text
+        if q.uuid:
+            return str(q.uuid)
+        return hashlib.md5(q.question.encode('utf8')).hexdigest()
+
+    @classmethod
+    def normalize_type(cls, type) -> str:
+        return cls.LUT_TYPE.get(type, type)
+
+    @staticmethod
+    def _where(library: str = None, category_id: int = None, difficulty: int = None, type: str = None):
+        clauses, args = [], []
+        for column, value in [("library", library), ("category_id", category_id), ("difficulty", difficulty)]:
+            if value is not None:
+                clauses.append("{} = ?".format(column))
+                args.append(value)
+        if type is not None:
+            clauses.append("type = ?")
+            args.append(QuestionStore.normalize_type(type))
+        return ("WHERE " + " AND ".join(clauses)) if len(clauses) > 0 else "", args
+
+    def add(self, questions: List[Questions]) -> int:
+        """
+        Add questions, known ones (same library and uuid) are ignored.
+
+        Parameters
+        ----------
+        questions : List[Questions]
+            Questions to store.
+
+        Returns
+        -------
+        n : int
+            Number of new questions.
+        """
+        rows = [(
+            q.library,
+            self.make_uuid(q),
+            None if q.category_id is None else int(q.category_id),
+            q.category,
+            None if q.difficulty is None else int(q.difficulty),
+            self.normalize_type(q.type),
+            q.question,
+            json.dumps(q.correct_answers),
+            json.dumps(q.incorrect_answers),
+            time.time(),
+        ) for q in questions]
+
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO questions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            return conn.total_changes - before
+
+    def get(
+        self,
+        n: int,
+        library: str = None,
+        category_id: int = None,
+        difficulty: int = None,
+        type: str = None,
+        exclude: set = None,
+    ) -> List[Questions]:
+        """
+        Get random questions matching the filters.
+
+        Parameters
+        ----------
+        n : int
+            Number of questions.
+        library : str, optional
+            Name of the library (lower class name of the handler), by default None (any).
+        category_id : int, optional
+            Category of the questions, by default None (any).
+        difficulty : int, optional
+            Difficulty level, by default None (any).
+        type : str, optional
+            Type of questions, by default None (any).
+        exclude : set, optional
+            Uuids not to return, by default None.
+
+        Returns
+        -------
+        questions : List[Questions]
+            At most n questions.
+        """
+        if n <= 0:
+            return []
+        exclude = set() if exclude is None else exclude
+        where, args = self._where(library=library, category_id=category_id, difficulty=difficulty, type=type)
+
+        questions = []
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "SELECT library, uuid, category_id, category, difficulty, type, question, correct_answers, "
+                "incorrect_answers FROM questions {} ORDER BY RANDOM()".format(where), args,
+            )
+            # Skip excluded questions until n are found
+            for row in cursor:
+                if row[1] in exclude:
+                    continue
+                questions.append(Questions(
+                    question=row[6],
+                    correct_answers=json.loads(row[7]),
+                    incorrect_answers=json.loads(row[8]),
+                    library=row[0],
+                    category=row[3],
+                    category_id=row[2],
+                    uuid=row[1],
+                    difficulty=row[4],
+                    type=row[5],
+                ))
+                if len(questions) >= n:
+                    break
+        return questions
+
+    def scan(self, since: float = None):
+        """
+        Iterate over questions in insertion order.
+
+        Parameters
+        ----------
+        since : float, optional
+            Only questions added at or after this timestamp, by default None (all).
+
+        Yields
+        ------
+        added : float
+            Timestamp of insertion.
+        q : Questions
+            Stored question.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "SELECT library, uuid, category_id, category, difficulty, type, question, correct_answers, "
+                "incorrect_answers, added FROM questions WHERE added >= ? ORDER BY added", (0. if since is None else since,),
+            )
+            for row in cursor:
+                yield row[9], Questions(
+                    question=row[6],
+                    correct_answers=json.loads(row[7]),
+                    incorrect_answers=json.loads(row[8]),
+                    library=row[0],
+                    category=row[3],
+                    category_id=row[2],
+                    uuid=row[1],
+                    difficulty=row[4],
+                    type=row[5],
+                )
+
+    def count(self, library: str = None, category_id: int = None, difficulty: int = None, type: str = None) -> int:
+        """
+        Number of questions matching the filters.
+        """
+        where, args = self._where(library=library, category_id=category_id, difficulty=difficulty, type=type)
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM questions {}".format(where), args).fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __repr__(self):
+        return "{}(path={})".format(self.__class__.__name__, self.path)
+
+
+# Stores written and read by handlers, by path
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+_STORE_PATH = None
+_STORE_ENABLED = True
+
+
+def get_question_store(path: str = None) -> QuestionStore:
+    """
+    Question store shared by the process, created at first use. Handlers pointed to a
+    stand-in server use their own store (`path`) so that fake questions never reach the
+    default one. None if stores are disabled.
+    """
+    if not _STORE_ENABLED:
+        return None
+    if path is None:
+        path = os.path.join(get_cache_home(), QuestionStore.FILENAME) if _STORE_PATH is None else _STORE_PATH
+    with _STORES_LOCK:
+        if path not in _STORES:
+            _STORES[path] = QuestionStore(path=path)
+        return _STORES[path]
+
+
+def use_question_store(path: str = None, enabled: bool = True) -> QuestionStore:
+    """
+    Set the default question store used by handlers. Use `enabled=False` to disable
+    all stores.
+    """
+    global _STORE_PATH, _STORE_ENABLED
+    _STORE_ENABLED = enabled
+    _STORE_PATH = path
+    with _STORES_LOCK:
+        _STORES.clear()
+    return get_question_store()
@@ -0,0 +1,292 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import List
+from pybquiz.elements import Questions
+from pybquiz.api_handler.store import get_cache_home
+from pybquiz.db.store import QuestionStore, get_question_store
+
+
+class BloomFilter:
+
+    MAGIC = b"PYBBLOOM"
+    # Magic, number of bits, number of hashes, capacity, number of items
+    HEADER = struct.Struct("<8sQIQQ")
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        """
+        Compact set of strings with false positives (about `error_rate` once `capacity`
+        items were added) and no false negatives. Membership costs a fixed number of
+        bit lookups, about 1.2 bytes per item at 1%.
+
+        Parameters
+        ----------
+        capacity : int
+            Expected number of items.
+        error_rate : float, optional
+            False positive rate at capacity, by default 0.01.
+        """
+        self.capacity = max(int(capacity), 1)
+        self.n_bits = int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(int(round(self.n_bits / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing, k positions from two 64 bits hashes
+        digest = hashlib.blake2b(item.encode("utf8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        for i in range(self.n_hashes):
+            yield (h1 + i * h2) % self.n_bits
+
+    def add(self, item: str):
+        for p in self._positions(item):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def save(self, path: str):
+        """
+        Save filter atomically.
+        """
+        path_tmp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(path_tmp, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.n_bits, self.n_hashes, self.capacity, self.count))
+            f.write(self.bits)
+        os.replace(path_tmp, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Load a filter, None if missing or invalid.
+        """
+        try:
+            with open(path, "rb") as f:
+                magic, n_bits, n_hashes, capacity, count = cls.HEADER.unpack(f.read(cls.HEADER.size))
+                bits = bytearray(f.read())
+        except (OSError, struct.error):
+            return None
+        if magic != cls.MAGIC or len(bits) != (n_bits + 7) // 8:
+            return None
+
+        bloom = cls.__new__(cls)
+        bloom.capacity, bloom.n_bits, bloom.n_hashes, bloom.count, bloom.bits = capacity, n_bits, n_hashes, count, bits
+        return bloom
+
+    def __repr__(self):
+        return "{}(count={}, capacity={}, bits={}, hashes={})".format(
+            self.__class__.__name__, self.count, self.capacity, self.n_bits, self.n_hashes)
+
+
+class UsedIndex:
+
+    FOLDER = "used"
+    FILENAME = "used.sqlite"
+
+    # Initial capacity of an audience filter, doubled when full
+    CAPACITY = 100000
+    ERROR_RATE = 0.01
+
+    def __init__(self, audience: str, path: str = None) -> None:
+        """
+        Questions already played in front of an audience (venue, team, ...). Questions
+        are identified by library and uuid, like in the question store, and kept in a
+        SQLite table shared by all audiences. A Bloom filter per audience answers most
+        lookups in memory: a negative answer is final, a positive one is confirmed by
+        the table. Only filters of the audiences in use are loaded.
+
+        Parameters
+        ----------
+        audience : str
+            Name of the audience.
+        path : str, optional
+            Folder of the index, by default "used" in the user cache folder.
+        """
+        self.audience = audience
+        self.path = os.path.join(get_cache_home(), self.FOLDER) if path is None else path
+        self.db_file = os.path.join(self.path, self.FILENAME)
+        slug = re.sub(r"[^\w\-]+", "_", audience)[:32]
+        self.bloom_file = os.path.join(self.path, "{}-{}.bloom".format(slug, hashlib.md5(audience.encode("utf8")).hexdigest()[:8]))
+        os.makedirs(self.path, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            migrated = self._migrate(conn)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS used (audience TEXT NOT NULL, library TEXT NOT NULL, uuid TEXT NOT NULL, "
+                "used_at REAL, PRIMARY KEY (audience, library, uuid)) WITHOUT ROWID"
+            )
+            if migrated:
+                self._migrate_rows(conn)
+
+        # Filters of the former table hold uuids only
+        self.bloom = self.rebuild_bloom() if migrated else self.load_bloom()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _migrate(conn) -> bool:
+        # Tables of former versions are keyed by uuid only, moved aside
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(used)")]
+        if len(columns) == 0 or "library" in columns:
+            return False
+        conn.execute("ALTER TABLE used RENAME TO used_legacy")
+        return True
+
+    def _migrate_rows(self, conn):
+        # Library of former rows found in the question store, rows of unknown questions are dropped
+        store = get_question_store()
+        if store is not None and os.path.exists(store.path):
+            conn.execute("ATTACH DATABASE ? AS bank", (store.path,))
+            conn.execute(
+                "INSERT OR IGNORE INTO used SELECT u.audience, q.library, u.uuid, u.used_at "
+                "FROM used_legacy u JOIN bank.questions q ON q.uuid = u.uuid"
+            )
+            conn.commit()
+            conn.execute("DETACH DATABASE bank")
+        conn.execute("DROP TABLE used_legacy")
+
+    @staticmethod
+    def make_key(library: str, uuid: str) -> str:
+        # Same keys as the near duplicate index
+        return "{}/{}".format(library, uuid)
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM used WHERE audience = ?", (self.audience,)).fetchone()[0]
+
+    def load_bloom(self) -> BloomFilter:
+        """
+        Load the filter of the audience, rebuilt from the table if missing or out of date
+        (e.g. written by another process meanwhile).
+        """
+        count = self.count()
+        bloom = BloomFilter.load(self.bloom_file)
+        if bloom is not None and bloom.count == count and not bloom.full:
+            return bloom
+        return self.rebuild_bloom(count=count)
+
+    def rebuild_bloom(self, count: int = None) -> BloomFilter:
+        """
+        Build the filter from the table, large enough for twice the current count.
+        """
+        count = self.count() if count is None else count
+        bloom = BloomFilter(capacity=max(self.CAPACITY, 2 * count), error_rate=self.ERROR_RATE)
+        with self._connect() as conn:
+            for library, uuid in conn.execute("SELECT library, uuid FROM used WHERE audience = ?", (self.audience,)):
+                bloom.add(self.make_key(library, uuid))
+        bloom.save(self.bloom_file)
+        return bloom
+
+    def contains(self, library: str, uuid: str) -> bool:
+        """
+        Check if a question (library and uuid) was used for the audience.
+        """
+        # Most unused questions stop here
+        if self.make_key(library, uuid) not in self.bloom:
+            return False
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT 1 FROM used WHERE audience = ? AND library = ? AND uuid = ?", (self.audience, library, uuid),
+            ).fetchone() is not None
+
+    def __contains__(self, key: str) -> bool:
+        # Key "library/uuid" (see make_key)
+        library, uuid = key.split("/", 1)
+        return self.contains(library, uuid)
+
+    def is_used(self, q: Questions) -> bool:
+        return self.contains(q.library, QuestionStore.make_uuid(q))
+
+    def mark(self, questions: List[Questions]) -> int:
+        """
+        Mark questions as used for the audience.
+
+        Parameters
+        ----------
+        questions : List[Questions]
+            Questions played.
+
+        Returns
+        -------
+        n : int
+            Number of questions not used before.
+        """
+        rows = [(q.library, QuestionStore.make_uuid(q)) for q in questions]
+        now = time.time()
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO used VALUES (?, ?, ?, ?)", [(self.audience, l, u, now) for l, u in rows])
+            n = conn.total_changes - before
+
+        if n == 0:
+            return n
+
+        # Other indexes of the audience marked questions meanwhile, the filter misses them
+        count = self.count()
+        if count != self.bloom.count + n or self.bloom.count + n >= self.bloom.capacity:
+            self.bloom = self.rebuild_bloom(count=count)
+            return n
+
+        # Keep the filter in line with the table
+        for key in set([self.make_key(l, u) for l, u in rows]):
+            self.bloom.add(key)
+        self.bloom.count = count
+        self.bloom.save(self.bloom_file)
+        return n
+
+    def clear(self):
+        """
+        Forget all questions used by the audience.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM used WHERE audience = ?", (self.audience,))
+        self.bloom = self.rebuild_bloom(count=0)
+
+    def __len__(self):
+        return self.count()
+
+    def __repr__(self):
+        return "{}(audience={}, path={})".format(self.__class__.__name__, self.audience, self.path)
+
+
+class Exclusion:
+
+    def __init__(self, *containers, library: str = None) -> None:
+        """
+        Uuids of a library found in any of the containers (sets of uuids, used indexes).
+        Used indexes are looked up with `library`.
+        """
+        self.containers = [c for c in containers if c is not None]
+        self.library = library
+
+    def __contains__(self, uuid: str) -> bool:
+        for c in self.containers:
+            if isinstance(c, UsedIndex):
+                if c.contains(self.library, uuid):
+                    return True
+            elif uuid in c:
+                return True
+        return False
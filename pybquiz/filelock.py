@@ -0,0 +1,126 @@
+import os
+import time
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockTimeout(Exception):
+    """
+    Raised when a lock cannot be acquired in time.
+    """
+    pass
+
+
+class FileLock:
+
+    def __init__(self, path: str, timeout: float = None, poll: float = 0.1) -> None:
+        """
+        Exclusive lock between processes (and threads) based on a lock file. Used around
+        cache rebuilds so that a single worker builds an artifact while the others wait,
+        then reuse it.
+
+        Parameters
+        ----------
+        path : str
+            Path to the lock file (created if missing, never removed).
+        timeout : float, optional
+            Maximal time to wait in seconds, by default None (no limit).
+        poll : float, optional
+            Time between two attempts in seconds, by default 0.1.
+        """
+        self.path = path
+        self.timeout = timeout
+        self.poll = poll
+        self.fd = None
+
+    def _try_lock(self, fd: int) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self):
+        """
+        Block until the lock is acquired.
+
+        Raises
+        ------
+        LockTimeout
+            If the lock is still held by another process after `timeout` seconds.
+        """
+        if os.path.dirname(self.path) != "":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Each acquisition has its own file descriptor, threads exclude each other too
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        start = time.monotonic()
+        while not self._try_lock(fd):
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                os.close(fd)
+                raise LockTimeout("Cannot lock {} within {}s".format(self.path, self.timeout))
+            time.sleep(self.poll)
+        self.fd = fd
+
+    def release(self):
+        """
+        Release the lock.
+        """
+        if self.fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        else:
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def __repr__(self):
+        return "{}(path={}, locked={})".format(self.__class__.__name__, self.path, self.fd is not None)
+
+
+def build_once(path: str, build, exists=None, timeout: float = None, lock: str = None):
+    """
+    Build an artifact unless it exists. The check is repeated under a lock so that
+    concurrent workers build it once, the others wait and reuse it.
+
+    Parameters
+    ----------
+    path : str
+        Path to the artifact.
+    build : callable
+        Function building the artifact, `build()`. It should write it atomically.
+    exists : callable, optional
+        Check if the artifact is available, by default `os.path.exists(path)`.
+    timeout : float, optional
+        Maximal time to wait for the lock in seconds, by default None (no limit).
+    lock : str, optional
+        Path to the lock file, by default `path` + ".lock".
+
+    Returns
+    -------
+    built : bool
+        True if the artifact was built by this call.
+    """
+    exists = (lambda: os.path.exists(path)) if exists is None else exists
+    # Fast path, no lock needed
+    if exists():
+        return False
+    with FileLock(path=path + ".lock" if lock is None else lock, timeout=timeout):
+        if exists():
+            return False
+        build()
+        return True
@@ -0,0 +1,257 @@
+from collections import OrderedDict, defaultdict
+from typing import List
+import math
+import numpy as np
+from pybquiz.api_handler.base import BaseAPIHandler
+from pybquiz.api_handler.retry import APIError
+from pybquiz.db.used import UsedIndex
+
+
+class FetchRequest:
+
+    def __init__(self, api: str, token: str, type: str, category_ids: List[int], difficulty: int, size: int, buckets: dict) -> None:
+        """
+        Single provider query serving one or several asks (buckets).
+
+        Parameters
+        ----------
+        api : str
+            Name of the API.
+        token : str
+            API token.
+        type : str
+            Type of questions.
+        category_ids : List[int]
+            Categories targeted by the query.
+        difficulty : int
+            Difficulty level, None if the query mixes difficulties.
+        size : int
+            Number of questions to ask for.
+        buckets : dict
+            Number of questions needed per bucket (api, token, type, category_id, difficulty).
+        """
+        self.api = api
+        self.token = token
+        self.type = type
+        self.category_ids = category_ids
+        self.difficulty = difficulty
+        self.size = size
+        self.buckets = buckets
+
+    def __repr__(self):
+        return "{}(api={}, categories={}, difficulty={}, size={}, buckets={})".format(
+            self.__class__.__name__, self.api, self.category_ids, self.difficulty, self.size, len(self.buckets)
+        )
+
+
+class FetchPlanner:
+
+    # Queries without difficulty ask for OVERFETCH times the expected need of each bucket
+    OVERFETCH = 3
+
+    def __init__(self, handlers: dict, verbose: bool = True, used: UsedIndex = None) -> None:
+        """
+        Plan the queries of all rounds of a quiz at once. Asks targeting the same API,
+        category, difficulty and type are merged, difficulties of a category are merged in
+        a single query when the API reports the difficulty of each question, and categories
+        are merged when the API accepts several categories per query. Results are split
+        back into rounds in the configured order.
+
+        Parameters
+        ----------
+        handlers : dict
+            API handlers indexed by (api name, token).
+        verbose : bool, optional
+            Extended verbose terminal output, by default True.
+        used : UsedIndex, optional
+            Questions already played in front of the audience, skipped. By default None.
+        """
+        self.handlers = handlers
+        self.verbose = verbose
+        self.used = used
+
+    @staticmethod
+    def make_key(cfg_round: dict, difficulty: int) -> tuple:
+        return (cfg_round["api"], cfg_round.get("token", None), cfg_round.get("type", None), cfg_round["theme_id"], difficulty)
+
+    def make_asks(self, cfg_rounds: List[dict]) -> OrderedDict:
+        """
+        Number of questions needed per bucket, summed over rounds.
+        """
+        asks = OrderedDict()
+        for cfg_round in cfg_rounds:
+            for d, n in enumerate(cfg_round.get("difficulty", [])):
+                if n <= 0:
+                    continue
+                key = self.make_key(cfg_round=cfg_round, difficulty=d)
+                asks[key] = asks.get(key, 0) + n
+        return asks
+
+    @staticmethod
+    def _counts(handler: BaseAPIHandler, category_id: int) -> np.ndarray:
+        """
+        Known number of questions per difficulty of a category, None if unknown.
+        """
+        metadata = handler.metadata
+        row = handler.category_row(category_id=category_id, strict=False, metadata=metadata)
+        if row is None:
+            return None
+        counts = metadata.categories_difficulty[row]
+        if np.any(counts < 0):
+            return None
+        return counts
+
+    def _size(self, handler: BaseAPIHandler, cats: dict, category_ids: List[int]) -> int:
+        """
+        Size of a query without difficulty such that each bucket expects OVERFETCH times
+        its need.
+        """
+        needs = [(c, d, n) for c in category_ids for d, n in cats[c].items()]
+        counts = {c: self._counts(handler, c) for c in category_ids}
+
+        # Unknown distribution
+        if any([v is None for v in counts.values()]):
+            return self.OVERFETCH * sum([n for _, _, n in needs])
+
+        # Sample size based on the share of each bucket
+        total = sum([v.sum() for v in counts.values()])
+        sizes = [math.ceil(self.OVERFETCH * n * total / counts[c][d]) for c, d, n in needs if counts[c][d] > 0]
+        return max(sizes + [sum([n for _, _, n in needs])])
+
+    def _cap(self, handler: BaseAPIHandler, category_ids: List[int], size: int) -> int:
+        # Never ask more than the API serves or holds (query would fail)
+        if handler.MAX_BATCH is not None:
+            size = min(size, handler.MAX_BATCH)
+        counts = [self._counts(handler, c) for c in category_ids]
+        if all([v is not None for v in counts]):
+            size = min(size, int(sum([v.sum() for v in counts])))
+        return size
+
+    def plan(self, cfg_rounds: List[dict]) -> List[FetchRequest]:
+        """
+        Merge asks of all rounds into as few queries as possible.
+
+        Parameters
+        ----------
+        cfg_rounds : List[dict]
+            Round configurations (api, token, theme_id, difficulty, type).
+
+        Returns
+        -------
+        requests : List[FetchRequest]
+            Planned queries.
+        """
+        # Group asks per API and type
+        groups = OrderedDict()
+        for (api, token, type, theme_id, d), n in self.make_asks(cfg_rounds=cfg_rounds).items():
+            groups.setdefault((api, token, type), OrderedDict()).setdefault(theme_id, OrderedDict())[d] = n
+
+        requests = []
+        for (api, token, type), cats in groups.items():
+            handler = self.handlers.get((api, token), None)
+            if handler is None:
+                continue
+
+            # Difficulty cannot be recovered from payload, only identical asks are merged
+            if not handler.MIXED_DIFFICULTY:
+                for c, diffs in cats.items():
+                    for d, n in diffs.items():
+                        buckets = {(api, token, type, c, d): n}
+                        requests.append(FetchRequest(api, token, type, [c], d, self._cap(handler, [c], n), buckets))
+                continue
+
+            # Group categories while a single query can serve them
+            chunks = []
+            for c in cats:
+                candidate = chunks[-1] + [c] if len(chunks) > 0 else None
+                if candidate is not None and handler.MULTI_CATEGORY and \
+                        (handler.MAX_BATCH is None or self._size(handler, cats, candidate) <= handler.MAX_BATCH):
+                    chunks[-1] = candidate
+                else:
+                    chunks.append([c])
+
+            for chunk in chunks:
+                buckets = {(api, token, type, c, d): n for c in chunk for d, n in cats[c].items()}
+                # Single ask, query it as is
+                if len(buckets) == 1:
+                    (_, _, _, c, d), n = list(buckets.items())[0]
+                    requests.append(FetchRequest(api, token, type, chunk, d, self._cap(handler, chunk, n), buckets))
+                else:
+                    size = self._cap(handler, chunk, self._size(handler, cats, chunk))
+                    requests.append(FetchRequest(api, token, type, chunk, None, size, buckets))
+
+        if self.verbose:
+            n_asks = sum([len(cfg.get("difficulty", [])) for cfg in cfg_rounds])
+            print("Planned {} queries for {} asks".format(len(requests), n_asks))
+
+        return requests
+
+    def execute(self, requests: List[FetchRequest]) -> dict:
+        """
+        Send planned queries and sort questions into buckets (deduplicated by uuid).
+
+        Returns
+        -------
+        pool : dict
+            Questions per bucket (api, token, type, category_id, difficulty).
+        """
+        pool = defaultdict(list)
+        seen = set()
+
+        for r in requests:
+            handler = self.handlers[(r.api, r.token)]
+            category_id = r.category_ids if len(r.category_ids) > 1 else r.category_ids[0]
+            try:
+                questions = handler.get_questions(n=r.size, category_id=category_id, difficulty=r.difficulty, type=r.type)
+            except APIError as e:
+                print("Warning: {}".format(e))
+                continue
+
+            for q in questions:
+                d = q.difficulty if r.difficulty is None else r.difficulty
+                key = (r.api, r.token, r.type, q.category_id, d)
+                uid = (r.api, q.uuid if q.uuid else q.question)
+                # Keep only what is needed
+                if key in r.buckets and uid not in seen and len(pool[key]) < r.buckets[key] and \
+                        (self.used is None or not self.used.is_used(q)):
+                    pool[key].append(q)
+                    seen.add(uid)
+
+        return pool
+
+    def split(self, cfg_rounds: List[dict], pool: dict) -> List[dict]:
+        """
+        Give back questions to rounds in configured order.
+
+        Returns
+        -------
+        prefetched : List[dict]
+            Questions per difficulty level for each round.
+        """
+        pool = {k: list(v) for k, v in pool.items()}
+        prefetched = []
+        for cfg_round in cfg_rounds:
+            questions = {}
+            for d, n in enumerate(cfg_round.get("difficulty", [])):
+                key = self.make_key(cfg_round=cfg_round, difficulty=d)
+                questions[d], pool[key] = pool.get(key, [])[:n], pool.get(key, [])[n:]
+            prefetched.append(questions)
+        return prefetched
+
+    def run(self, cfg_rounds: List[dict]) -> List[dict]:
+        """
+        Plan, execute and split queries of all rounds.
+
+        Parameters
+        ----------
+        cfg_rounds : List[dict]
+            Round configurations (api, token, theme_id, difficulty, type).
+
+        Returns
+        -------
+        prefetched : List[dict]
+            Questions per difficulty level for each round.
+        """
+        requests = self.plan(cfg_rounds=cfg_rounds)
+        pool = self.execute(requests=requests)
+        return self.split(cfg_rounds=cfg_rounds, pool=pool)
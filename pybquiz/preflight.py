@@ -0,0 +1,279 @@
+from typing import List
+import copy
+import os
+import yaml
+from py_markdown_table.markdown_table import markdown_table
+from pybquiz.api_handler import create_handler
+from pybquiz.api_handler.base import BaseAPIHandler
+from pybquiz.api_handler.store import set_cache_home
+from pybquiz.planner import FetchPlanner
+
+
+class RoundCheck:
+
+    def __init__(self, title: str, api: str, theme_id: int, asked: List[int]) -> None:
+        """
+        Feasibility of a single round.
+
+        Parameters
+        ----------
+        title : str
+            Title of the round.
+        api : str
+            Name of the API.
+        theme_id : int
+            Category of the round.
+        asked : List[int]
+            Number of questions asked per difficulty level.
+        """
+        self.title = title
+        self.api = api
+        self.theme_id = theme_id
+        self.asked = asked
+        # Available per difficulty (-1 if unknown) and missing questions
+        self.available = [-1] * len(asked)
+        self.missing = [0] * len(asked)
+        self.issues = []
+
+    @property
+    def feasible(self) -> bool:
+        return len(self.issues) == 0 and sum(self.missing) == 0
+
+
+class PreflightReport:
+
+    def __init__(self, rounds: List[RoundCheck], requests: dict, eta: dict) -> None:
+        """
+        Result of a dry run, see Preflight.
+
+        Parameters
+        ----------
+        rounds : List[RoundCheck]
+            Check of each round in configured order.
+        requests : dict
+            Expected number of requests per API.
+        eta : dict
+            Expected time in seconds per API.
+        """
+        self.rounds = rounds
+        self.requests = requests
+        self.eta = eta
+
+    @property
+    def feasible(self) -> bool:
+        return all([r.feasible for r in self.rounds])
+
+    @property
+    def total_eta(self) -> float:
+        # APIs are queried one after the other
+        return sum(self.eta.values())
+
+    def __repr__(self):
+        """
+        Create a pretty print of the report
+
+        Returns
+        -------
+        pprint: str
+            Pretty print
+        """
+        data = []
+        for r in self.rounds:
+            data.append({
+                "Round": r.title,
+                "API": r.api,
+                "Theme": r.theme_id,
+                "Asked": str(r.asked),
+                "Available": str(["?" if a < 0 else a for a in r.available]),
+                "Missing": sum(r.missing),
+                "Issues": "; ".join(r.issues),
+            })
+
+        lines = ["Dry run"]
+        if len(data) > 0:
+            lines.append(markdown_table(data).set_params(row_sep='markdown').get_markdown())
+        for api, n in self.requests.items():
+            lines.append("{}: {} requests, ETA {:.0f}s".format(api, n, self.eta[api]))
+        lines.append("Total ETA: {:.0f}s".format(self.total_eta))
+        lines.append("Feasible: {}".format(self.feasible))
+        return "\n".join(lines)
+
+
+class Preflight:
+
+    # Expected network time of a request in seconds (on top of rate limit waits)
+    LATENCY = 0.5
+
+    LUT_TYPE = {"text": 0, "image": 1}
+
+    def __init__(
+        self,
+        cfg_rounds: List[dict],
+        tokens: dict = None,
+        delay_api: float = None,
+        rate_limits: dict = None,
+        plan: bool = True,
+        verbose: bool = False,
+    ) -> None:
+        """
+        Check a quiz configuration against cached category statistics and estimate the
+        time needed to fetch it. No request is sent, handlers are created offline.
+
+        Parameters
+        ----------
+        cfg_rounds : List[dict]
+            Round configurations (title, api, theme_id, difficulty, type).
+        tokens : dict, optional
+            API tokens per API name, by default None.
+        delay_api : float, optional
+            Fixed time between queries to API in seconds, by default None.
+        rate_limits : dict, optional
+            Custom rate limits per API name, by default None.
+        plan : bool, optional
+            Estimate requests of the fetch planner, by default True.
+        verbose : bool, optional
+            Extended verbose terminal output, by default False.
+        """
+        self.tokens = {} if tokens is None else tokens
+        self.rate_limits = {} if rate_limits is None else rate_limits
+        self.delay_api = delay_api
+        self.plan = plan
+        self.verbose = verbose
+
+        # Same round settings as PybQuiz
+        self.cfg_rounds = copy.deepcopy(cfg_rounds)
+        for cfg_round in self.cfg_rounds:
+            cfg_round["token"] = self.tokens.get(cfg_round["api"], None)
+            cfg_round["rate_limit"] = self.rate_limits.get(cfg_round["api"], None)
+
+    def _create_handlers(self) -> dict:
+        """
+        Offline handlers per API, None if the API cannot be used.
+        """
+        handlers = {}
+        for cfg_round in self.cfg_rounds:
+            key = (cfg_round["api"], cfg_round["token"])
+            if key in handlers:
+                continue
+            try:
+                handler = create_handler(
+                    name=cfg_round["api"], delay_api=self.delay_api, token=cfg_round["token"], verbose=self.verbose,
+                    rate_limit=cfg_round["rate_limit"], offline=True,
+                )
+            except NotImplementedError:
+                handler = None
+            handlers[key] = handler if isinstance(handler, BaseAPIHandler) else None
+        return handlers
+
+    def _check_rounds(self, handlers: dict) -> List[RoundCheck]:
+        checks = []
+        # Questions left per bucket, rounds drawing from the same one share it
+        remaining = {}
+
+        for cfg_round in self.cfg_rounds:
+            asked = list(cfg_round.get("difficulty", []))
+            check = RoundCheck(title=cfg_round.get("title", ""), api=cfg_round["api"], theme_id=cfg_round["theme_id"], asked=asked)
+            checks.append(check)
+
+            handler = handlers[(cfg_round["api"], cfg_round["token"])]
+            if handler is None:
+                check.issues.append("API not available (unknown or missing token)")
+                continue
+            if len(handler.categories_id) == 0:
+                check.issues.append("no cached statistics, run once online")
+                continue
+            if handler.available_questions(category_id=check.theme_id) is None:
+                check.issues.append("unknown category")
+                continue
+
+            # Check type of questions
+            type = cfg_round.get("type", None)
+            if type in self.LUT_TYPE:
+                metadata = handler.metadata
+                n_type = metadata.categories_type[handler.category_row(category_id=check.theme_id, metadata=metadata), self.LUT_TYPE[type]]
+                if n_type == 0:
+                    check.issues.append("no {} questions".format(type))
+
+            # Check counts per difficulty
+            for d, n in enumerate(asked):
+                key = FetchPlanner.make_key(cfg_round=cfg_round, difficulty=d)
+                if key not in remaining:
+                    remaining[key] = handler.available_questions(category_id=check.theme_id, difficulty=d)
+                check.available[d] = remaining[key]
+                if remaining[key] < 0:
+                    continue
+                got = min(n, remaining[key])
+                check.missing[d] = n - got
+                remaining[key] -= got
+
+        return checks
+
+    def _count_requests(self, handlers: dict) -> dict:
+        requests = {}
+
+        if self.plan:
+            planner = FetchPlanner(handlers={k: h for k, h in handlers.items() if h is not None}, verbose=self.verbose)
+            for r in planner.plan(cfg_rounds=self.cfg_rounds):
+                handler = handlers[(r.api, r.token)]
+                # Merged queries are sent once, single asks may need pages
+                n = handler.count_requests(n=list(r.buckets.values())[0]) if len(r.buckets) == 1 else 1
+                requests[r.api] = requests.get(r.api, 0) + n
+            return requests
+
+        for cfg_round in self.cfg_rounds:
+            handler = handlers[(cfg_round["api"], cfg_round["token"])]
+            if handler is None:
+                continue
+            n = sum([handler.count_requests(n=n) for n in cfg_round.get("difficulty", [])])
+            requests[cfg_round["api"]] = requests.get(cfg_round["api"], 0) + n
+        return requests
+
+    def run(self) -> PreflightReport:
+        """
+        Check all rounds and estimate fetch time.
+
+        Returns
+        -------
+        report : PreflightReport
+            Shortfalls per round, requests and ETA per API.
+        """
+        handlers = self._create_handlers()
+        checks = self._check_rounds(handlers=handlers)
+        requests = self._count_requests(handlers=handlers)
+
+        # Estimate time from rate limits, the bucket is assumed full at start
+        eta = {}
+        for api, n in requests.items():
+            handler = [h for (name, _), h in handlers.items() if name == api and h is not None][0]
+            wait = max(n - handler.limiter.burst, 0) / handler.limiter.rate
+            eta[api] = wait + n * self.LATENCY
+
+        return PreflightReport(rounds=checks, requests=requests, eta=eta)
+
+    @staticmethod
+    def from_yaml(yaml_path: str, yaml_token: str = None):
+
+        # Default tokens empty
+        data_token = {}
+
+        # Parse input file
+        with open(yaml_path) as stream:
+            data_cfg = yaml.safe_load(stream)
+
+        # Check if file exists
+        if yaml_token is not None and os.path.exists(yaml_token):
+            with open(yaml_token) as stream:
+                data_token = yaml.safe_load(stream)
+
+        # Base infos
+        cfg_base = data_cfg.get("BaseInfo", {})
+        if "cache_dir" in cfg_base:
+            set_cache_home(path=os.path.expanduser(cfg_base["cache_dir"]))
+
+        return Preflight(
+            cfg_rounds=data_cfg.get("Rounds", []),
+            tokens=data_token,
+            delay_api=cfg_base.get("delay_api", None),
+            rate_limits=cfg_base.get("rate_limits", {}),
+            plan=cfg_base.get("plan", True),
+        )
@@ -5,6 +5,9 @@ from pybquiz.export.pptx import PptxFactory
 from pybquiz.background import BackgroundManager
 from pybquiz.export.googleslide import GoogleSlideFactory, GoogleSheetFactory
 from pybquiz.config_generator import ConfigGenerator
+from pybquiz.api_handler.cassette import use_cassette
+from pybquiz.api_handler import redirect
+from pybquiz.preflight import Preflight
 
 
 def main(args):
@@ -12,12 +15,26 @@ def main(args):
     # Get input information
     cfg_yml = args.cfg
     token_path = args.apitoken
+    
+    # Use stand-in server instead of the real APIs
+    if args.api_url is not None:
+        redirect(base_url=args.api_url)
+    
+    # Record or replay API requests
+    if args.cassette is not None:
+        use_cassette(path=args.cassette, mode=args.cassette_mode)
        
     # Assist quiz creation
     if cfg_yml is None or not os.path.exists(cfg_yml):
         cfgGen = ConfigGenerator(yaml_api_file=token_path, dirout="config")
         cfg_yml = cfgGen.run_terminal()
 
+    # Check config against cached statistics, no request sent
+    if args.dry_run:
+        report = Preflight.from_yaml(yaml_path=cfg_yml, yaml_token=token_path).run()
+        print(report)
+        return
+
     # Create output directory
     os.makedirs(args.dirout, exist_ok=True)
     
@@ -29,7 +46,7 @@ def main(args):
     # Create quiz
     if not os.path.exists(outfile_json):
         print("Quiz {} does not exists, create it ...".format(name))
-        quiz = PybQuiz.from_yaml(yaml_path=cfg_yml, yaml_token=token_path)
+        quiz = PybQuiz.from_yaml(yaml_path=cfg_yml, yaml_token=token_path, deadline=args.deadline)
         quiz.dump(file=outfile_json) 
         
     # Create background handler                
@@ -68,6 +85,16 @@ if __name__ == '__main__':
                         help='path to stored API tokens (default is "config/apitoken.yml")')
     parser.add_argument('--googlecreds', default='config/credentials.json', 
                         help='path to stored Google credentials (default is "config/credentials.json")')
+    parser.add_argument('--deadline', default=None, type=float,
+                        help='time budget in seconds to fetch questions, late rounds use local questions (default is None, no limit)')
+    parser.add_argument('--api-url', default=None, 
+                        help='base URL of a simulated API server, see run_simulated_server.py (default is None, real APIs)')
+    parser.add_argument('--cassette', default=None, 
+                        help='path to cassette file to record / replay API requests (default is None, live network)')
+    parser.add_argument('--cassette-mode', default='replay', choices=['record', 'replay'],
+                        help='cassette mode, either "record" or "replay" (default is "replay")')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='check rounds against cached statistics and estimate fetch time, without network')
     args = parser.parse_args()
     
     main(args=args)
@@ -0,0 +1,61 @@
+import argparse
+import time
+import json
+from pybquiz.api_handler.simulator import TriviaSimulator
+
+
+def main(args):
+    
+    # Server side rate limits
+    rate_limits = None
+    if args.rate_limits is not None:
+        rate_limits = json.loads(args.rate_limits)
+    
+    # Create server
+    simulator = TriviaSimulator(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limits=rate_limits,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        n_questions=args.questions,
+    )
+    
+    with simulator:
+        print("Simulated APIs available at {} (use run_create_quiz.py --api-url {})".format(simulator.url, simulator.url))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("Stats: {}".format(simulator.stats))
+
+
+if __name__ == '__main__':
+    
+    # Create parser
+    parser = argparse.ArgumentParser(
+        prog='Simulated trivia APIs',
+        description='Local stand-in for OpenTriviaDB, TheTriviaAPI, QuizAPI and APINinjas',
+    )
+    parser.add_argument('--host', default="127.0.0.1",
+                        help='host to bind (default is "127.0.0.1")')
+    parser.add_argument('--port', default=8000, type=int,
+                        help='port to bind (default is 8000)')
+    parser.add_argument('--latency', default=0., type=float,
+                        help='latency in seconds added to each response (default is 0)')
+    parser.add_argument('--jitter', default=0., type=float,
+                        help='random latency in seconds added to each response (default is 0)')
+    parser.add_argument('--rate-limits', default=None,
+                        help='JSON rate limits per API, e.g. \'{"opentriviadb": {"requests": 1, "window": 5, "burst": 1}}\' (default is None)')
+    parser.add_argument('--error-rate', default=0., type=float,
+                        help='probability of a server error per query (default is 0)')
+    parser.add_argument('--error-status', default=500, type=int,
+                        help='HTTP status of server errors (default is 500)')
+    parser.add_argument('--questions', default=50, type=int,
+                        help='number of questions per category and difficulty (default is 50)')
+    args = parser.parse_args()
+    
+    main(args=args)
+    
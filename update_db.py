@@ -1,29 +1,74 @@
 import argparse
+import os
+import yaml
 from pybquiz.db.wwtbam import WWTBAM
+from pybquiz.db.harvester import Harvester
+from pybquiz.db.neardup import NearDuplicateIndex
+from pybquiz.api_handler.store import set_cache_home
 
 
 def main(args):
-    
-    wwtbam_db = WWTBAM()
-    wwtbam_db.update()
-    
+
+    # Custom cache folder (default to the user cache folder)
+    if args.cache_dir is not None:
+        set_cache_home(path=os.path.expanduser(args.cache_dir))
+
+    # Fill local question store from APIs
+    if not args.skip_apis:
+        # Load tokens if any
+        tokens = {}
+        if os.path.exists(args.apitoken):
+            with open(args.apitoken) as stream:
+                tokens = yaml.safe_load(stream)
+
+        harvester = Harvester(tokens=tokens, apis=args.apis, checkpoint=args.checkpoint, max_requests=args.max_requests)
+        if args.restart:
+            harvester.reset()
+        harvester.run()
+
+        # Display progress
+        for api, (done, total) in harvester.progress().items():
+            print("{}: {}/{} buckets completed".format(api, done, total))
+
+        # Index new questions of the bank for near duplicate detection
+        NearDuplicateIndex().update(store=harvester.get_store(), verbose=True)
+
+    # Update who wants to be a millionaire scrap
+    if not args.skip_wwtbam:
+        wwtbam_db = WWTBAM()
+        wwtbam_db.update()
+
 
 if __name__ == '__main__':
-    
+
     # Create parser
     parser = argparse.ArgumentParser(
         prog='Update Databases',
         description='Update remote databases',
     )
+    parser.add_argument('--apitoken', default='config/apitoken.yml',
+                        help='path to stored API tokens (default is "config/apitoken.yml")')
+    parser.add_argument('--apis', nargs='+', default=None,
+                        help='APIs to harvest (default is all of {})'.format(Harvester.APIS))
+    parser.add_argument('--checkpoint', default=None,
+                        help='path to the harvest progress file (default in the cache folder)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='path to the cache folder (default is $PYBQUIZ_CACHE_DIR or ~/.cache/pybquiz)')
+    parser.add_argument('--max-requests', type=int, default=None,
+                        help='maximal number of requests per API for this run (default is no limit)')
+    parser.add_argument('--restart', action='store_true',
+                        help='forget progress of previous runs')
+    parser.add_argument('--skip-apis', action='store_true',
+                        help='do not harvest APIs')
+    parser.add_argument('--skip-wwtbam', action='store_true',
+                        help='do not update the WWTBAM scrap')
     # parser.add_argument('--cfg', default=None,
     #                     help='path to config file (default if None)')
-    # parser.add_argument('--dirout', default="output", 
+    # parser.add_argument('--dirout', default="output",
     #                     help='path to output directory for data generation (default is "output")')
-    # parser.add_argument('--apitoken', default='config/apitoken.yml', 
-    #                     help='path to stored API tokens (default is "config/apitoken.yml")')
-    # parser.add_argument('--googlecreds', default='config/credentials.json', 
+    # parser.add_argument('--googlecreds', default='config/credentials.json',
     #                     help='path to stored Google credentials (default is "config/credentials.json")')
     args = parser.parse_args()
-    
+
     main(args=args)
-    
\ No newline at end of file
+